@@ -2,14 +2,30 @@
 Automated PDF table extractor: Version K
 """
 
+import json
+import os
 import streamlit as st
-import pdfplumber
 import pandas as pd
 # Import custom functions
 from table_functions import (reset_all, save_template_to_disk, build_template_from_actions,
-                             list_templates, load_template_from_disk, replay_template,
-                             action_label, undo_last_action, undo_to_action_id,
-                             redo_last_action, run_action)
+                             list_templates, load_compiled_template, compile_template, replay_plan,
+                             action_label, describe_row_conditions, undo_last_action, undo_to_action_id,
+                             redo_last_action, run_action, init_main_table, display_row_hashes)
+from memory_functions import govern_memory, memory_report, restore_evicted_tables
+from validation_functions import VALIDATION_RULES, COLUMN_ROLES, guess_column_map, validate_table
+from extraction_functions import (extract_pdf, all_tables_from_pages, page_text, full_text,
+                                  clean_extraction_settings, EXTRACTION_BACKENDS, DEFAULT_BACKEND)
+from column_type_utils import display_column_config, to_text_frame
+from search_functions import refresh_search_index, search_rows, guess_search_columns, SEARCH_MODES
+from csv_functions import csv_preview_pages, process_csv, non_row_local_steps, CHUNK_ROWS, CSV_PREVIEW_ROWS
+from diff_functions import file_tables, processed_table, diff_tables, highlight_changes
+from price_list_functions import (PRICE_LIST_TYPES, save_price_list, list_price_lists, price_list_columns,
+                                  price_list_signature, guess_price_list_columns)
+from explain_functions import explain_plan
+from pool_functions import PoolError, pool_load, pool_metrics
+from regex_utils import check_pattern, UnsafePatternError
+from ledger_functions import (LEDGER_TEXT_FIELDS, LEDGER_NUMBER_FIELDS, guess_ledger_map, save_invoice,
+                              price_history, open_backorders, ledger_summary)
 
 # Reusable regex/text mappings for row/column deletion
 DELETE_VALUE_MAPPING = {
@@ -20,353 +36,907 @@ DELETE_VALUE_MAPPING = {
     "Word: None": r"(?i)^\s*None\s*$", # literal word 'None' (case-insensitive)
 }
 
+# Where delete rows looks for the pattern (see table_functions.ROW_SCOPES)
+ROW_SCOPE_LABELS = {
+    "first_cell": "First cell",
+    "column": "One column",
+    "any_cell": "Any cell",
+    "all_cells": "All cells",
+}
 
-st.title('Automated PDF Table Extractor: Version K')
+# Rows shown at a time in the raw data viewer
+RAW_ROWS_PER_PAGE = 50
+# Folder for full-size CSV outputs, and the largest one offered as a download
+EXPORTS_DIR = "exports"
+MAX_DOWNLOAD_MB = 200
 
-# File uploader for PDF invoice
-uploaded_file = st.file_uploader("Upload a PDF invoice", type="pdf")
+st.title('Automated PDF Table Extractor: Version K')
 
-if uploaded_file is not None:
-    with pdfplumber.open(uploaded_file) as pdf:
-        all_tables = []
-
-        # DEBUG: page_text = pdf.pages[0].extract_text()
-        # DEBUG: st.text_area("Raw text (first 1000 chars):", page_text[:1000])
-        with st.expander("View Raw Data or Original Tables"):
-            for page_num, page in enumerate(pdf.pages, 1): # Start page numbering at 1
-                tables = page.extract_tables()
-                st.write(f"Found {len(tables)} table(s) on page {page_num}")
-                if tables:
-                    for i, table in enumerate(tables):
-                        # DEBUG: st.write(f"DEBUG: Page {page_num}, Table {i + 1}")
-                        col_raw, col_original = st.columns([1, 1])
-                        with col_raw:
-                            if st.button(f"Raw Data: Table {i + 1}, Page {page_num}", 
-                                        key=f"show_raw_data_{page_num}_{i}", type="primary"):
-                                st.write(f"#### Original Table {i + 1} from Page {page_num}:")
-                                st.write(f"Raw: {table}")
-                        df = pd.DataFrame(table)
-                        with col_original:
-                            if st.button(f"Original Table {i + 1}, Page {page_num}",
-                                        key=f"show_original_table_{page_num}_{i}", type="primary"):
-                                st.write(f"#### Original Table {i + 1} from Page {page_num}:")
-                                st.dataframe(df, width="stretch")
-                        all_tables.append(df)
-                else:
-                    page_text = page.extract_text()
-                    st.write(f"No tables detected.  Click to see raw text from {page_num}:")
-                    if st.button(f"Raw Text, Page {page_num}",
-                                key=f"show_text_{page_num}", type="primary"):
-                        st.text_area("Extracted text:", page_text, height=400)
-
-        # Combine all tables and initialize session state
-        if all_tables and 'main_table' not in st.session_state:
-            combined_table = pd.concat(all_tables, ignore_index=True)
-            st.session_state.main_table = combined_table
-            # Convert dataframe to list of lists for processing
-            st.session_state.table_as_list = combined_table.values.tolist()
-            # Always preserve original data
-            st.session_state.original_table_data = [r[:] for r in st.session_state.table_as_list]
-            st.session_state.working_data = [r[:] for r in st.session_state.table_as_list]
-            st.session_state.current_headers = None
-            st.success("Main table initialized!")
-
-        # Show current processing status
-        if 'current_headers' in st.session_state and st.session_state.current_headers:
-            with st.expander("View Current Headers"):
-                st.write("**Current Headers:**", st.session_state.current_headers)
-
-        # Display current main table
-        if 'main_table' in st.session_state:
-            st.write(f"#### Current Main Table (all tables combined):")
-            st.write("Click on options below to format table")
-            st.dataframe(st.session_state.main_table, width="stretch")
-
-        # Initialize applied actions tracking
-        if 'applied_actions' not in st.session_state:
-            st.session_state.applied_actions = []
-
-        # Initialize redo-stack to undo an undo button
-        if 'redo_stack' not in st.session_state:
-            st.session_state.redo_stack = []
-
-        # Create columns for table and actions panel
-        col_choices, col_break, col_actions = st.columns([4, 1, 2])
-
-        # Column on the left to display formatting choices    
-        with col_choices:
-            # Header and Data start selection
-            st.write("### Formatting Choices")
-
-
-
-            tab1, tab2, tab3, tab4 = st.tabs(["Headers", "Rows", "Columns", "Templates"])
-
-            with tab1:
-                # Choose row that contains headers
-                with st.expander("Choose Headers"):
-                    with st.form("header_form"):
-                        st.write("#### Choose Header Row")
-
-                        if 'table_as_list' in st.session_state:
-                            header_row_input = st.number_input("Select the first row that includes headers",
-                                                            min_value=0,
-                                                            max_value=len(st.session_state.table_as_list) - 1 if 'table_as_list' in st.session_state else 10,
-                                                            value=0,
-                                                            key="header_row_selector")
-
-                            # Wrap in a form to keep expander open when changing inputs
-                            if st.form_submit_button("Click to Apply Headers", key="choose_headers_btn", type="primary"):
-                                # Save current state before applying changes
-                                params={'header_row_index': int(header_row_input)}
-                                # run_action replaces save_action_state + choose_headers + update_display_table
-                                run_action("apply_headers", params)
-                                st.session_state.header_row_index = int(header_row_input)
-                                st.toast(f"Headers applied from row {header_row_input}!")
-                                st.rerun()
-
-                            # Remove duplicate header rows
-                with st.expander("Remove Duplicate Headers"):
-                    if 'header_row_index' in st.session_state and st.session_state.header_row_index is not None:
-                        st.write("Will remove rows that match header row")
-                        if st.button("Remove Duplicate Header Rows", key = "remove_duplicates_btn", type="primary"):
-                            # Save current state before applying changes
-                            params={'header_row_index': int(st.session_state.get('header_row_index', 0))}
-                            run_action("remove_duplicates", params)
-                            st.toast("Removed duplicate header rows!")
-                            st.rerun()
+# Fragments showing the working table. Actions run in widget callbacks and rerun just these,
+# so the upload, extraction and raw data viewer aren't run again on every click.
+VIEW_FRAGMENTS = ["table_view", "formatting_tabs", "applied_actions"]
+
+
+def extract_or_stop(file_bytes, settings):
+    """
+    extract_pdf through the shared worker pool, telling the user when they have to wait
+    for a worker, or (with a stop) when the pool is too busy to take the file or the job failed.
+    """
+    notice = st.empty()
+    load = pool_load()
+    if load['queued'] or load['running'] >= load['workers']:
+        notice.info(f"All {load['workers']} extraction workers are busy ({load['queued']} file(s) waiting); "
+                    "yours will start as soon as one is free.")
+    try:
+        return extract_pdf(file_bytes, settings)
+    except PoolError as e:
+        st.warning(str(e))
+        st.stop()
+    finally:
+        notice.empty()
+
+def rerun_if_evicted():
+    """
+    Tables evicted while the session was idle are restored by a full script run
+    (it has the extraction); a fragment rerun or callback hands over to one.
+    """
+    if st.session_state.get('tables_evicted'):
+        st.rerun()
+
+def apply_action(action_type, params, message=None):
+    """Widget callback: run an action, then rerun only the fragments showing the table"""
+    rerun_if_evicted()
+    st.session_state.action_warnings = run_action(action_type, params)
+    notify(message)
+    st.rerun(VIEW_FRAGMENTS)
+
+def notify(message):
+    """Widget callback: toast shown when the table view reruns (callbacks can't draw)"""
+    if message:
+        st.session_state.action_toast = message
+
+def report_problem(message):
+    """Widget callback: show message above the formatting tabs instead of applying anything"""
+    st.session_state.action_problem = message
+
+def delete_pattern(choice_key, pattern_key, what):
+    """Pattern for the delete rows/columns choice (None after reporting a problem)"""
+    choice = st.session_state.get(choice_key)
+    custom_pattern = (st.session_state.get(pattern_key) or "").strip()
+    if choice is None:
+        report_problem(f"Please select a {what} type to delete first")
+        return None
+    if choice == "Other" and not custom_pattern:
+        report_problem("Please enter a custom pattern when 'Other' is selected")
+        return None
+    if choice == "Other":
+        try:
+            check_pattern(custom_pattern)
+        except UnsafePatternError as e:
+            report_problem(str(e))
+            return None
+    return DELETE_VALUE_MAPPING.get(choice, custom_pattern)
+
+def on_apply_headers():
+    row = int(st.session_state.header_row_selector)
+    # run_action replaces save_action_state + choose_headers + update_display_table
+    apply_action("apply_headers", {'header_row_index': row}, f"Headers applied from row {row}!")
+
+def on_remove_duplicates():
+    params = {'header_row_index': int(st.session_state.get('header_row_index') or 0)}
+    apply_action("remove_duplicates", params, "Removed duplicate header rows!")
+
+def row_condition():
+    """The delete rows condition as currently entered (None after reporting a problem)"""
+    pattern = delete_pattern("delete_row_choice", "delete_row_pattern", "row")
+    if pattern is None:
+        return None
+    scope = st.session_state.get("delete_row_scope") or "first_cell"
+    column = (st.session_state.get("delete_row_column") or "").strip() or None
+    if scope == "column" and column is None:
+        return report_problem("Please enter the column to look in")
+    return {'pattern': pattern, 'scope': scope, 'column': column if scope == "column" else None}
+
+def on_add_row_condition():
+    condition = row_condition()
+    if condition is not None:
+        st.session_state.setdefault('row_conditions', []).append(condition)
+
+def on_clear_row_conditions():
+    st.session_state.row_conditions = []
+
+def on_delete_rows():
+    condition = row_condition()
+    if condition is not None:
+        choice = st.session_state.delete_row_choice
+        # Conditions added earlier come first; together they make one step
+        first, *more = st.session_state.get('row_conditions', []) + [condition]
+        params = dict(first)
+        if more:
+            params['conditions'] = more
+            params['combine'] = st.session_state.get("delete_row_combine") or "or"
+        else:
+            params['choice'] = choice # optional (e.g., 'letters', 'numbers', 'other')
+        st.session_state.row_conditions = []
+        apply_action("delete_unwanted_rows", params, f"Deleted rows matching: {describe_row_conditions(params)}")
+
+def on_delete_cols():
+    pattern = delete_pattern("delete_col_choice", "delete_col_pattern", "column")
+    if pattern is not None:
+        choice = st.session_state.delete_col_choice
+        params = {
+            'pattern': pattern,
+            'choice': choice, # optional (e.g., 'letters', 'numbers', 'other')
+            'scope': 'column'
+        }
+        apply_action("delete_unwanted_cols", params,
+                     f"Deleted columns that contain: {choice if choice != 'Other' else pattern}")
+
+def on_add_net():
+    # Subtract 1 since users will be using 1 base instead of 0 base indexing
+    params = {
+        'retail_price_index': int(st.session_state.retail_price_col_selector) - 1,
+        'discount_percent_index': int(st.session_state.discount_percent_col_selector) - 1,
+    }
+    apply_action("add_net_item_col", params, "Added Net-per-Item Column")
+
+def on_add_computed():
+    expression = st.session_state.computed_expression.strip()
+    if not expression:
+        return report_problem("Please enter an expression")
+    params = {
+        'expression': expression,
+        'header_name': st.session_state.computed_name.strip() or "Computed",
+        'insert_after': int(st.session_state.computed_insert_selector) or None,
+    }
+    apply_action("add_computed_col", params, f"Added {params['header_name']} column")
+
+def on_split_column():
+    split_on = st.session_state.split_on_selector
+    split_patterns = {"Runs of 2+ spaces": None, "Any whitespace": r"\s+",
+                      "Custom regex": st.session_state.split_pattern_input.strip() or None}
+    if split_on == "Custom regex" and not split_patterns[split_on]:
+        return report_problem("Please enter a delimiter regex")
+    try:
+        check_pattern(split_patterns[split_on] or "")
+    except UnsafePatternError as e:
+        return report_problem(str(e))
+    params = {
+        'column': st.session_state.split_column_input.strip(),
+        'pattern': split_patterns[split_on],
+        'num_columns': int(st.session_state.split_count_selector) or None,
+        'header_names': st.session_state.split_names_input.strip() or None,
+    }
+    apply_action("split_column", params, f"Split column {params['column']}")
+
+def price_check_keys(price_list, table_headers):
+    """Widget keys of the price check form for this price list and these table headers"""
+    list_id, table_id = price_list, hash(tuple(table_headers))
+    return {'list_key': f"price_list_key_{list_id}", 'list_price': f"price_list_price_{list_id}",
+            'key': f"price_key_column_{table_id}", 'price': f"price_price_column_{table_id}"}
+
+def on_check_prices(price_list, keys):
+    key_column = st.session_state[keys['key']].strip()
+    price_column = st.session_state[keys['price']].strip()
+    if not key_column or not price_column:
+        return report_problem("Please enter the item and price columns")
+    params = {
+        'price_list': price_list,
+        'key_column': key_column,
+        'price_column': price_column,
+        'list_key_column': st.session_state[keys['list_key']],
+        'list_price_column': st.session_state[keys['list_price']],
+    }
+    apply_action("check_prices", params, f"Checked prices against {price_list}")
+
+def on_undo_last():
+    rerun_if_evicted()
+    if undo_last_action():
+        st.rerun(VIEW_FRAGMENTS)
+
+def on_undo_to(action_id):
+    rerun_if_evicted()
+    undo_to_action_id(action_id)
+    st.rerun(VIEW_FRAGMENTS)
+
+def on_redo():
+    rerun_if_evicted()
+    if redo_last_action():
+        st.rerun(VIEW_FRAGMENTS)
+
+def on_reset():
+    rerun_if_evicted()
+    # Ensure original_table_data is initialized for this file/session
+    if 'original_table_data' not in st.session_state and 'table_as_list' in st.session_state:
+        st.session_state.original_table_data = [r[:] for r in st.session_state.table_as_list]
+    reset_all()
+    notify("Table reset to original!")
+    st.rerun(VIEW_FRAGMENTS)
+
+
+@st.fragment
+def raw_data_view(pages, all_tables):
+    """Raw data viewer; paging through it reruns only this part"""
+    # DEBUG: page_text = pdf.pages[0].extract_text()
+    # DEBUG: st.text_area("Raw text (first 1000 chars):", page_text[:1000])
+    with st.expander("View Raw Data or Original Tables"):
+        # Only the selected page/table is built, so big PDFs stay cheap on reruns
+        st.write(f"Found {len(all_tables)} table(s) on {len(pages)} page(s)")
+        page_num = st.number_input("Page", min_value=1, max_value=len(pages), value=1,
+                                   key="raw_page_selector")
+        tables = pages[page_num - 1]['tables']
+        if tables:
+            table_num = st.selectbox(f"Found {len(tables)} table(s) on page {page_num}",
+                                     range(1, len(tables) + 1), key="raw_table_selector")
+            table = tables[table_num - 1]
+            # Paginate rows so a long table is never formatted all at once
+            row_pages = max(1, -(-len(table) // RAW_ROWS_PER_PAGE))
+            row_page = st.number_input(f"Rows page (of {row_pages})", min_value=1, max_value=row_pages,
+                                       value=1, key="raw_rows_selector")
+            start = (row_page - 1) * RAW_ROWS_PER_PAGE
+            rows = table[start:start + RAW_ROWS_PER_PAGE]
+            col_raw, col_original = st.columns([1, 1])
+            with col_raw:
+                show_raw = st.button(f"Raw Data: Table {table_num}, Page {page_num}",
+                                     key="show_raw_data", type="primary")
+            with col_original:
+                show_original = st.button(f"Original Table {table_num}, Page {page_num}",
+                                          key="show_original_table", type="primary")
+            if show_raw:
+                st.write(f"#### Original Table {table_num} from Page {page_num}:")
+                st.write(f"Raw: {rows}")
+            if show_original:
+                st.write(f"#### Original Table {table_num} from Page {page_num}:")
+                st.dataframe(pd.DataFrame(rows, index=range(start, start + len(rows))), width="stretch")
+        elif pages[page_num - 1]['skipped']:
+            st.write(f"Page {page_num} is skipped by the current extraction settings.")
+        else:
+            st.write(f"No tables detected.  Click to see raw text from {page_num}:")
+            if st.button(f"Raw Text, Page {page_num}",
+                        key=f"show_text_{page_num}", type="primary"):
+                st.text_area("Extracted text:", page_text(pages, page_num), height=400)
+
+@st.fragment(key="table_view")
+def table_view():
+    """Current headers, main table and line-item search"""
+    # Actions, undo and redo only rerun the fragments, so usage is recorded here too
+    govern_memory()
+    rerun_if_evicted()
+    # Messages left by the action callbacks
+    if st.session_state.get('action_toast'):
+        st.toast(st.session_state.pop('action_toast'))
+    for w in st.session_state.pop('action_warnings', None) or []:
+        st.warning(w)
+    # Show current processing status
+    if 'current_headers' in st.session_state and st.session_state.current_headers:
+        with st.expander("View Current Headers"):
+            st.write("**Current Headers:**", st.session_state.current_headers)
+
+    # Display current main table
+    if 'main_table' in st.session_state:
+        st.write(f"#### Current Main Table (all tables combined):")
+        st.write("Click on options below to format table")
+        st.dataframe(st.session_state.main_table, width="stretch",
+                     column_config=display_column_config(st.session_state.main_table))
+        # The CSV is only built when the button is clicked, not on every rerun (e.g. search keystrokes)
+        table = st.session_state.main_table
+        st.download_button("Download Table as CSV", lambda: to_text_frame(table).to_csv(index=False),
+                           "table.csv", mime="text/csv", key="download_main_table")
+
+        # Line-item search; the index only re-reads rows that changed since the last action
+        st.session_state.search_index = refresh_search_index(st.session_state.get('search_index'),
+                                                             st.session_state.main_table, display_row_hashes())
+        search_index = st.session_state.search_index
+        if any(search_index['columns']):
+            col_query, col_mode = st.columns([3, 1])
+            with col_query:
+                search_query = st.text_input("Search line items",
+                                             placeholder=f"Search {' and '.join(str(c) for c in search_index['columns'] if c)}",
+                                             key="search_query")
+            with col_mode:
+                search_mode = st.selectbox("Match", SEARCH_MODES, index=SEARCH_MODES.index("Substring"),
+                                           key="search_mode")
+            if search_query:
+                hits = search_rows(search_index, search_query, search_mode)
+                st.write(f"{len(hits)} matching row(s)")
+                if hits:
+                    st.dataframe(st.session_state.main_table.iloc[hits], width="stretch",
+                                 column_config=display_column_config(st.session_state.main_table))
+
+@st.fragment(key="formatting_tabs")
+def formatting_tabs(uploaded_file, is_csv, pages):
+    """Formatting choices; actions applied here rerun only the table fragments"""
+    rerun_if_evicted()
+    # Header and Data start selection
+    st.write("### Formatting Choices")
+    # Problem found by an action's callback, shown on this fragment's rerun
+    if st.session_state.get('action_problem'):
+        st.error(st.session_state.pop('action_problem'))
+
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["Headers", "Rows", "Columns", "Templates", "Verify", "Ledger"])
+
+    with tab1:
+        # Choose row that contains headers
+        with st.expander("Choose Headers"):
+            with st.form("header_form"):
+                st.write("#### Choose Header Row")
+
+                if 'table_as_list' in st.session_state:
+                    header_row_input = st.number_input("Select the first row that includes headers",
+                                                    min_value=0,
+                                                    max_value=len(st.session_state.table_as_list) - 1 if 'table_as_list' in st.session_state else 10,
+                                                    value=0,
+                                                    key="header_row_selector")
+
+                    # Wrap in a form to keep expander open when changing inputs
+                    st.form_submit_button("Click to Apply Headers", key="choose_headers_btn", type="primary",
+                                          on_click=on_apply_headers)
+
+                    # Remove duplicate header rows
+        with st.expander("Remove Duplicate Headers"):
+            if 'header_row_index' in st.session_state and st.session_state.header_row_index is not None:
+                st.write("Will remove rows that match header row")
+                st.button("Remove Duplicate Header Rows", key = "remove_duplicates_btn", type="primary",
+                          on_click=on_remove_duplicates)
+            else:
+                st.info("Please select headers first to identify which rows to remove")
+
+    with tab2:
+
+        # Fix concatenated data
+        with st.expander("Separate Rows"):
+            st.button("Fix rows that have been combined", key="fix_concat_btn", type="primary",
+                      on_click=apply_action, args=("fix_concatenated", {}, "Table rows have been separated!"))
+
+        # Delete unwanted rows without real data
+        with st.expander("Delete Rows"):
+            # Input for choosing rows to delete
+            delete_row_input = st.radio("Select which rows to delete - First cells (Column 1) should not include these values:",
+                        ["Empty", "Word: None", "Letters", "Numbers", "Symbols", "Other"],
+                        index=None, key="delete_row_choice")
+
+            if delete_row_input == "Other":
+                st.text_input("Enter custom regex pattern or text to search for:",
+                              placeholder="e.g. Total|Subtotal or ^\\d{6}$' or ^Page \\d+",
+                              help="Use regex patterns or plain text. Examples: 'Total' (exact match), '^\\d{6}$' (6 digit numbers)",
+                              key="delete_row_pattern")
+
+            row_scope = st.radio("Look in", list(ROW_SCOPE_LABELS), format_func=ROW_SCOPE_LABELS.get,
+                                 horizontal=True, key="delete_row_scope")
+            if row_scope == "column":
+                st.text_input("Column (number or header name)", key="delete_row_column")
+
+            # Several conditions make a single step, so the table is filtered once
+            row_conditions = st.session_state.get('row_conditions', [])
+            if row_conditions:
+                st.radio("Delete rows matching", ["or", "and"], horizontal=True, key="delete_row_combine",
+                         format_func={"or": "Any condition", "and": "Every condition"}.get)
+                st.caption("Conditions so far: " + "; ".join(describe_row_conditions(c) for c in row_conditions)
+                           + " (plus the one above)")
+                st.button("Clear conditions", key="clear_row_conditions_btn", on_click=on_clear_row_conditions)
+            st.button("Add as condition", key="add_row_condition_btn", on_click=on_add_row_condition,
+                      help="Keep this condition and enter another; the rows are deleted in one step")
+            st.button("Delete unwanted rows", key="del_rows_btn", type="primary", on_click=on_delete_rows)
+            if 'debug_matches' in st.session_state:
+                st.write("Rows that matched pattern:", st.session_state.pop('debug_matches'))
+    with tab3:
+
+        with st.expander("Alter columns"):
+            st.write("Delete Columns")
+
+            delete_col_input = st.radio("Select which columns to delete - columns should not include these values:",
+                        ["Empty", "Word: None", "Letters", "Numbers", "Symbols", "Other"],
+                        index=None, key="delete_col_choice")
+
+            if delete_col_input == "Other":
+                st.text_input("Enter custom regex pattern or text to search for:",
+                              placeholder="e.g. Total|Subtotal or ^\\d{6}$' or ^Page \\d+",
+                              help="Use regex patterns or plain text. Examples: 'Total' (exact match), '^\\d{6}$' (6 digit numbers)",
+                              key="delete_col_pattern")
+
+            st.button("Delete unwanted columns", key="del_cols_btn", type="primary", on_click=on_delete_cols)
+            if 'debug_matched_cols' in st.session_state:
+                st.write("Rows that matched pattern:", st.session_state.pop('debug_matched_cols'))
+
+
+
+
+
+
+            with st.form("add_net_form"):
+                st.write("Add a Net-per-Item Column")
+                st.number_input("Column number for retail price (1 = first column)",
+                                                min_value=1,
+                                                max_value=max((len(r) for r in st.session_state.get('working_data', [])),
+                                                                default=1),
+                                                value=1,
+                                                key="retail_price_col_selector"
+                                                )
+                st.number_input("Column number for discount percent (1 = first column)",
+                                                min_value=1,
+                                                max_value=max((len(r) for r in st.session_state.get('working_data', [])),
+                                                                    default=1),
+                                                value=1,
+                                                key="discount_percent_col_selector"
+                                                )
+                st.form_submit_button("Add Net-per-Item Column", type="primary", on_click=on_add_net)
+
+            with st.form("add_computed_form"):
+                st.write("Add a Computed Column")
+                st.text_input("Expression using column names or numbers in braces",
+                              placeholder="e.g. {Net} * {Ship} or {5} * (1 - {6} / 100)",
+                              help="Columns: {Header Name} or {column number} (1 = first column). "
+                                   "Operators: + - * / and parentheses",
+                              key="computed_expression")
+                st.text_input("New column name", value="Extension", key="computed_name")
+                st.number_input("Insert after column number (0 = at the end)",
+                                min_value=0, value=0, key="computed_insert_selector")
+                st.form_submit_button("Add Computed Column", type="primary", on_click=on_add_computed)
+
+            with st.form("split_column_form"):
+                st.write("Split a Column")
+                st.text_input("Column to split (number or header name)", value="1", key="split_column_input")
+                st.selectbox("Split on", ["Runs of 2+ spaces", "Any whitespace", "Custom regex"],
+                             key="split_on_selector")
+                st.text_input("Custom delimiter regex", placeholder=r"e.g. \s*\|\s*", key="split_pattern_input")
+                st.number_input("Number of columns (0 = as many as needed)",
+                                min_value=0, value=0, key="split_count_selector")
+                st.text_input("New column names (optional, comma separated)", key="split_names_input")
+                st.form_submit_button("Split Column", type="primary", on_click=on_split_column)
+
+            # Price check: look every line up in one of our saved price lists
+            st.write("Check Prices Against a Price List")
+            price_upload = st.file_uploader("Add a price list (CSV or Parquet)", type=PRICE_LIST_TYPES,
+                                            key="price_list_upload")
+            if price_upload is not None and st.button("Save Price List", key="save_price_list_btn"):
+                st.toast(f"Saved price list {save_price_list(price_upload.name, price_upload.getvalue())}")
+            price_lists = list_price_lists()
+            if not price_lists:
+                st.info("No price lists saved yet.")
+            else:
+                price_list = st.selectbox("Price list", price_lists, key="price_list_selector")
+                try:
+                    list_columns = price_list_columns(price_list, price_list_signature(price_list))
+                except Exception as e:
+                    st.error(f"Could not read price list {price_list}: {e}")
+                    list_columns = []
+                if list_columns:
+                    with st.form("check_prices_form"):
+                        # Keys carry the price list and the table's headers, so the guesses
+                        # are redone when either changes
+                        table_headers = st.session_state.get('current_headers') or []
+                        keys = price_check_keys(price_list, table_headers)
+                        guessed_list_key, guessed_list_price = guess_price_list_columns(list_columns)
+                        st.selectbox("Item column in the price list", list_columns,
+                                     index=list_columns.index(guessed_list_key) if guessed_list_key else 0,
+                                     key=keys['list_key'])
+                        st.selectbox("Price column in the price list", list_columns,
+                                     index=list_columns.index(guessed_list_price) if guessed_list_price else 0,
+                                     key=keys['list_price'])
+                        st.text_input("Item column in the table (number or header name)",
+                                      value=guess_search_columns(table_headers)[0] or "1", key=keys['key'])
+                        st.text_input("Price column in the table (number or header name)",
+                                      value=guess_column_map(table_headers)['net'] or "", key=keys['price'])
+                        st.form_submit_button("Add Expected Price Columns", type="primary",
+                                              on_click=on_check_prices, args=(price_list, keys))
+
+    with tab4:
+
+        # Save Template
+        if st.session_state.applied_actions:
+            with st.form("save_template_form"):
+                st.write("#### Save Template")
+                template_name = st.text_input("Please enter name of template", key="save_template-name")
+                save_clicked = st.form_submit_button("Click to save template", type="primary")
+                if save_clicked:
+                    if not template_name or not template_name.strip():
+                        st.error("Please enter a template name")
                     else:
-                        st.info("Please select headers first to identify which rows to remove")
-
-            with tab2:
-
-                # Fix concatenated data
-                with st.expander("Separate Rows"):
-                    if st.button("Fix rows that have been combined", key="fix_concat_btn", type="primary"):
-                        # Save current state before applying changes
-                            params={}
-                            run_action("fix_concatenated", params)
-                            st.toast("Table rows have been separated!")
-                            st.rerun()
-
-                # Delete unwanted rows without real data
-                with st.expander("Delete Rows"):
-                    custom_pattern = ""
-                    # Input for choosing rows to delete
-                    delete_row_input = st.radio("Select which rows to delete - First cells (Column 1) should not include these values:",
-                                ["Empty", "Word: None", "Letters", "Numbers", "Symbols", "Other"],
-                                index=None,)
-                    
-                    if delete_row_input == "Other":
-                        custom_pattern = st.text_input("Enter custom regex pattern or text to search for:",
-                                                    placeholder="e.g. Total|Subtotal or ^\\d{6}$' or ^Page \\d+",
-                                                    help="Use regex patterns or plain text. Examples: 'Total' (exact match), '^\\d{6}$' (6 digit numbers)")
-                        
-                    search_pattern = DELETE_VALUE_MAPPING.get(delete_row_input, custom_pattern)
-                    
-                                                    
-                    if st.button("Delete unwanted rows", key="del_rows_btn", type="primary"):
-                        if delete_row_input is None:
-                            st.error("Please select a row type to delete first")
-                            st.stop() # Early exit to halt remainder of script for this rerun
-                        if delete_row_input == "Other" and (not custom_pattern or custom_pattern.strip() == ""):
-                            st.error("Please enter a custom pattern when 'Other' is selected")
-                            st.stop()# Early exit to halt remainder of script for this rerun
-                            
-                        # Save current state before applying changes
-                        params = {                                
-                            'pattern': search_pattern,
-                            'choice': delete_row_input, # optional (e.g., 'letters', 'numbers', 'other')
-                            'scope': 'first_cell'
-                        }
-                        run_action("delete_unwanted_rows", params)
-                        if 'debug_matches' in st.session_state:
-                            st.write("Rows that matched pattern:", st.session_state.debug_matches)
-                            del st.session_state.debug_matches
-                        st.toast(f"Deleted rows where first cell contains: {delete_row_input if delete_row_input != 'other' else custom_pattern}")
-                        st.rerun()
-            with tab3:
-
-                with st.expander("Alter columns"):
-                    st.write("Delete Columns")
-                    custom_pattern = ""
-
-                    delete_col_input = st.radio("Select which columns to delete - columns should not include these values:",
-                                ["Empty", "Word: None", "Letters", "Numbers", "Symbols", "Other"],
-                                index=None,)
-                    
-                    if delete_col_input == "Other":
-                        custom_pattern = st.text_input("Enter custom regex pattern or text to search for:",
-                                                    placeholder="e.g. Total|Subtotal or ^\\d{6}$' or ^Page \\d+",
-                                                    help="Use regex patterns or plain text. Examples: 'Total' (exact match), '^\\d{6}$' (6 digit numbers)")
-                        
-                    search_pattern = DELETE_VALUE_MAPPING.get(delete_col_input, custom_pattern)
-                    
-                                                    
-                    if st.button("Delete unwanted columns", key="del_cols_btn", type="primary"):
-                        if delete_col_input is None:
-                            st.error("Please select a column type to delete first")
-                            st.stop() # Early exit to halt remainder of script for this rerun
-                        if delete_col_input == "Other" and (not custom_pattern or custom_pattern.strip() == ""):
-                            st.error("Please enter a custom pattern when 'Other' is selected")
-                            st.stop()# Early exit to halt remainder of script for this rerun
-                            
-                        # Save current state before applying changes
-                        params = {                       
-                            'pattern': search_pattern,
-                            'choice': delete_col_input, # optional (e.g., 'letters', 'numbers', 'other')
-                            'scope': 'column'
-                        }
-                        run_action("delete_unwanted_cols", params)
-                        if 'debug_matched_cols' in st.session_state:
-                            st.write("Rows that matched pattern:", st.session_state.debug_matched_cols)
-                            del st.session_state.debug_matched_cols
-                        st.toast(f"Deleted columns that contain: {delete_col_input if delete_col_input != 'other' else custom_pattern}")
+                        st.session_state.template_name = template_name.strip()
+                        tpl = build_template_from_actions(st.session_state.applied_actions)
+                        for w in tpl.get("warnings", []):
+                            st.warning(w)
+                        path = save_template_to_disk(tpl)
+                        st.success(f"Template: {template_name} saved!")
+
+        # Stream the whole CSV through the current actions, writing the output as it goes
+        if is_csv:
+            with st.form("process_csv_form"):
+                st.write("#### Process Full CSV")
+                st.caption(f"The table above shows the first {CSV_PREVIEW_ROWS:,} rows. "
+                           "This runs the applied actions over every row, chunk by chunk.")
+                chunk_rows = st.number_input("Rows per chunk", min_value=1000, value=CHUNK_ROWS, step=1000)
+                if st.form_submit_button("Process Full CSV", type="primary"):
+                    plan = compile_template({"name": "current", "actions": [
+                        {'type': a['type'], 'params': a.get('params', {}) or {}}
+                        for a in st.session_state.applied_actions]})
+                    blocked = non_row_local_steps(plan)
+                    if blocked:
+                        st.error(f"These steps need the whole table and can't be streamed: {', '.join(blocked)}")
+                        st.stop()
+                    os.makedirs(EXPORTS_DIR, exist_ok=True)
+                    out_path = os.path.join(EXPORTS_DIR, os.path.splitext(uploaded_file.name)[0] + "_clean.csv")
+                    status = st.empty()
+                    progress = None
+                    with open(out_path, "w", newline="", encoding="utf-8") as out:
+                        for progress in process_csv(uploaded_file.getvalue(), plan, out, chunk_rows=int(chunk_rows)):
+                            status.write(f"Chunk {progress['chunks']}: {progress['rows_in']:,} rows read, "
+                                         f"{progress['rows_out']:,} written")
+                    for w in (progress or {}).get('warnings', []):
+                        st.warning(w)
+                    st.session_state.csv_export_path = out_path
+                    st.success(f"Wrote {out_path}")
+            if st.session_state.get("csv_export_path") and os.path.exists(st.session_state.csv_export_path):
+                export_path = st.session_state.csv_export_path
+                if os.path.getsize(export_path) <= MAX_DOWNLOAD_MB * 1024 * 1024:
+                    with open(export_path, "rb") as f:
+                        st.download_button("Download Processed CSV", f, os.path.basename(export_path),
+                                           mime="text/csv", key="download_csv_export")
+                else:
+                    st.info(f"Output is over {MAX_DOWNLOAD_MB} MB; find it on the server at {export_path}")
+
+        # Extraction settings: limit which pages and which region pdfplumber analyzes (PDFs only)
+        if not is_csv:
+            with st.expander("Extraction Settings"):
+                with st.form("extraction_settings_form"):
+                    current = st.session_state.get("extraction_settings") or {}
+                    st.write(f"Page size: {pages[0]['width']:.0f} x {pages[0]['height']:.0f} points"
+                             if pages else "No pages found")
+                    backend_names = list(EXTRACTION_BACKENDS)
+                    backend = st.selectbox("Extraction backend", backend_names,
+                                           index=backend_names.index(current.get("backend", DEFAULT_BACKEND)),
+                                           format_func=lambda b: EXTRACTION_BACKENDS[b]["label"])
+                    word_gap = st.number_input("Word gap for word clustering backends (points, 0 = automatic)",
+                                               min_value=0.0, value=float(current.get("word_gap", 0.0)))
+                    skip_first = st.number_input("Skip first pages", min_value=0,
+                                                 value=int(current.get("skip_first_pages", 0)))
+                    skip_last = st.number_input("Skip last pages", min_value=0,
+                                                value=int(current.get("skip_last_pages", 0)))
+                    crop_input = st.text_input("Crop box on every page: x0, top, x1, bottom (blank = whole page)",
+                                               value=", ".join(str(v) for v in current.get("crop_bbox", [])))
+                    page_crops_input = st.text_area("Per-page crop boxes as JSON (optional)",
+                                                    value=json.dumps(current.get("page_crop_bboxes", {})),
+                                                    help='e.g. {"1": [0, 250, 612, 720], "-1": [0, 0, 612, 400]}')
+                    table_settings_input = st.text_area("pdfplumber table_settings as JSON (optional)",
+                                                        value=json.dumps(current.get("table_settings", {})),
+                                                        help='e.g. {"vertical_strategy": "text", "horizontal_strategy": "text"}')
+                    drop_repeated = st.checkbox("Drop tables repeated on later pages (headers, footers)",
+                                                value=bool(current.get("drop_repeated_tables", False)))
+                    if st.form_submit_button("Apply Extraction Settings", type="primary"):
+                        try:
+                            crop_bbox = [float(v) for v in crop_input.split(",")] if crop_input.strip() else []
+                            if crop_bbox and len(crop_bbox) != 4:
+                                raise ValueError("Crop box needs 4 numbers")
+                            new_settings = clean_extraction_settings({
+                                "backend": backend if backend != DEFAULT_BACKEND else None,
+                                "word_gap": float(word_gap),
+                                "skip_first_pages": int(skip_first),
+                                "skip_last_pages": int(skip_last),
+                                "crop_bbox": crop_bbox,
+                                "page_crop_bboxes": json.loads(page_crops_input or "{}"),
+                                "table_settings": json.loads(table_settings_input or "{}"),
+                                "drop_repeated_tables": drop_repeated,
+                            })
+                        except ValueError as e: # json.JSONDecodeError is a ValueError
+                            st.error(f"Invalid extraction settings: {e}")
+                            st.stop()
+                        st.session_state.extraction_settings = new_settings
+                        new_tables = all_tables_from_pages(extract_or_stop(uploaded_file.getvalue(), new_settings), new_settings)
+                        if new_tables:
+                            init_main_table(new_tables)
+                        else:
+                            st.session_state.pop('main_table', None)
                         st.rerun()
 
-
-
-
-
-
-                    with st.form("add_net_form"):
-                        st.write("Add a Net-per-Item Column")
-                        retail_price_input = st.number_input("Column number for retail price (1 = first column)",
-                                                        min_value=1,
-                                                        max_value=max((len(r) for r in st.session_state.working_data),
-                                                                        default=0),
-                                                        value=1,
-                                                        key="retail_price_col_selector"
-                                                        )
-                        discount_percent_input = st.number_input("Column number for discount percent (1 = first column)",
-                                                        min_value=1,
-                                                        max_value=max((len(r) for r in st.session_state.working_data),
-                                                                            default=0),
-                                                        value=1,
-                                                        key="discount_percent_col_selector"
-                                                        )
-                    
-                        # Subtract 1 since users will be using 1 base instead of 0 base indexing
-                        retail_idx = retail_price_input - 1
-                        discount_idx = discount_percent_input - 1
-
-                        if st.form_submit_button("Add Net-per-Item Column", type="primary"):
-                            params={
-                                'retail_price_index' : int(retail_idx),
-                                'discount_percent_index' : int(discount_idx)
-                            }
-                            run_action("add_net_item_col", params)
-                            st.toast("Added Net-per-Item Column")
-                            st.rerun()
-
-            with tab4:
-                
-                # Save Template
-                if st.session_state.applied_actions:
-                    with st.form("save_template_form"):
-                        st.write("#### Save Template")
-                        template_name = st.text_input("Please enter name of template", key="save_template-name")
-                        save_clicked = st.form_submit_button("Click to save template", type="primary")
-                        if save_clicked:
-                            if not template_name or not template_name.strip():
-                                st.error("Please enter a template name")
-                            else:
-                                st.session_state.template_name = template_name.strip()
-                                tpl = build_template_from_actions(st.session_state.applied_actions)
-                                for w in tpl.get("warnings", []):
-                                    st.warning(w)
-                                path = save_template_to_disk(tpl)
-                                st.success(f"Template: {template_name} saved!")
-
-                with st.form("load_template_form"):
-                    st.write("#### Load Template")
-                    template_list = list_templates() # Returns list of filenames
-                    if not template_list:
-                        st.info("No templates saved yet.")
+        with st.form("load_template_form"):
+            st.write("#### Load Template")
+            template_list = list_templates() # Returns list of filenames
+            if not template_list:
+                st.info("No templates saved yet.")
+            else:
+                selected = st.selectbox(
+                    "Choose a template to apply",
+                    template_list,
+                    index=None,
+                    placeholder="Select template"
+                )
+                reset_before = st.checkbox("Reset to original before applying", value=True)
+                apply_clicked = st.form_submit_button(f"Apply Selected Template", type="primary")
+                explain_clicked = st.form_submit_button("Explain Selected Template",
+                                                        help="Dry run on a sample of the table: what each step would do")
+
+                if explain_clicked:
+                    plan = load_compiled_template(selected) if selected else None
+                    if not selected:
+                        st.error("Please select a template.")
+                    elif not plan:
+                        st.error(f"Could not load template: {selected}")
                     else:
-                        selected = st.selectbox(
-                            "Choose a template to apply",
-                            template_list,
-                            index=None,
-                            placeholder="Select template"
-                        )
-                        reset_before = st.checkbox("Reset to original before applying", value=True)
-                        apply_clicked = st.form_submit_button(f"Apply Selected Template", type="primary")
-
-                        if apply_clicked:
-                            if not selected:
-                                st.error("Please select a template.")
-                            else:
-                                tpl = load_template_from_disk(selected)
-                                if not tpl:
-                                    st.error(f"Could not load template: {selected}")
-                                else:
-                                    st.session_state.redo_stack = []
-                                    # Show any stored warnings prior to replay
-                                    warnings = replay_template(tpl, reset_first=reset_before, log_steps=True)
-                                    for w in warnings:
-                                        st.warning(w)
-                                    st.success(f"Template replayed: {tpl.get('name', selected)}")
-                                    st.rerun()
-
-        # Space between columns
-        with col_break:
-            st.write("")
-
-        # Column on the right to display applied actions
-        with col_actions:
-            st.write("### Applied Actions")
-            actions = st.session_state.get('applied_actions', [])
-            redo_stack = st.session_state.get('redo_stack', [])
-            if redo_stack:
-                next_redo = redo_stack[-1]
-                redo_label = action_label(next_redo['type'], next_redo.get('params', {}) or {})
-                if st.button(f"Redo {redo_label}", key="redo_btn", type="secondary"):
-                    if redo_last_action():
-                        st.rerun()
+                        source = st.session_state.original_table_data if reset_before else st.session_state.working_data
+                        explained = explain_plan(plan, source)
+                        st.caption(f"Ran on {explained['sample_rows']:,} of {explained['table_rows']:,} rows; "
+                                   f"counts and times are whole-table estimates. "
+                                   f"Projected total: {explained['projected_ms']:,.0f} ms. "
+                                   "Uses the current extraction settings.")
+                        steps = pd.DataFrame(explained['steps'])
+                        steps['flags'] = steps['flags'].str.join("; ")
+                        st.dataframe(steps, hide_index=True, width="stretch")
+                        for e in explained['steps']:
+                            if e['flags']:
+                                st.warning(f"Step {e['step']} ({e['label']}): {'; '.join(e['flags'])}")
+
+                if apply_clicked:
+                    if not selected:
+                        st.error("Please select a template.")
+                    else:
+                        # Validated and compiled once per template file version
+                        plan = load_compiled_template(selected)
+                        if not plan:
+                            st.error(f"Could not load template: {selected}")
+                        else:
+                            st.session_state.redo_stack = []
+                            # Re-extract first if the template carries different extraction settings
+                            tpl_extraction = clean_extraction_settings(plan['extraction'])
+                            if not is_csv and tpl_extraction != st.session_state.get("extraction_settings"):
+                                st.session_state.extraction_settings = tpl_extraction
+                                tpl_tables = all_tables_from_pages(extract_or_stop(uploaded_file.getvalue(), tpl_extraction), tpl_extraction)
+                                if tpl_tables:
+                                    init_main_table(tpl_tables)
+                            # Show any stored warnings prior to replay
+                            warnings = replay_plan(plan, reset_first=reset_before, log_steps=True)
+                            for w in warnings:
+                                st.warning(w)
+                            st.success(f"Template replayed: {plan['name'] or selected}")
+                            st.rerun()
 
-            if actions:
-                for i, a in enumerate(reversed(actions)):
-                    with st.container():
-                        idx = len(actions) - 1 - i # original index
-                        label = action_label(a['type'], a.get('params', {}) or {})
-                        st.write(f"**{idx + 1}. {label}**")
-
-                        if i == 0:
-                            # Most recent action: "Undo {name}"
-                            if st.button(f"Undo {label}", key=f"undo_last{a['id']}", type="secondary"):
-                                if undo_last_action():
-                                    st.rerun()
+    with tab5:
+        # Reconciliation checks over the whole combined table
+        with st.expander("Verify Invoice"):
+            if 'main_table' in st.session_state:
+                table = st.session_state.main_table
+                guessed = guess_column_map(table.columns)
+                options = [None] + list(table.columns)
+                with st.form("verify_form"):
+                    st.write("Match columns to check (leave blank to skip a check)")
+                    column_map = {}
+                    for role in COLUMN_ROLES:
+                        # No key: the widget resets when the table's columns change
+                        column_map[role] = st.selectbox(role.capitalize(), options,
+                                                        index=options.index(guessed[role]))
+                    invoice_total_input = st.number_input("Invoice total (0 = skip)", min_value=0.0,
+                                                          value=0.0, step=0.01, format="%.2f")
+                    if st.form_submit_button("Run Checks", type="primary"):
+                        results = validate_table(table, column_map, invoice_total=invoice_total_input)
+                        for key, rule_failed in results['rules'].items():
+                            st.write(f"**{VALIDATION_RULES[key]['label']}:** {int(rule_failed.sum())} row(s) failed")
+                        for label in results['skipped']:
+                            st.write(f"**{label}:** skipped (column not selected)")
+                        if results['total_ok'] is not None:
+                            st.write(f"**Extensions add up to invoice total:** {'yes' if results['total_ok'] else 'no'} "
+                                     f"(sum {results['extension_sum']:.2f})")
+                        if results['failed'].any():
+                            st.dataframe(table[results['failed']], width="stretch",
+                                         column_config=display_column_config(table))
+                        elif results['rules']:
+                            st.success("All rows passed")
+            else:
+                st.info("No table to verify yet")
+
+        # Line-by-line diff against a re-issued or updated invoice, processed the same way
+        with st.expander("Compare With Another Invoice"):
+            if 'main_table' in st.session_state and st.session_state.get('current_headers'):
+                table = st.session_state.main_table
+                compare_file = st.file_uploader("Other invoice (PDF or CSV)", type=["pdf", "csv"],
+                                                key="compare_file")
+                key_options = list(table.columns)
+                guessed_key = guess_search_columns(key_options)[0]
+                with st.form("compare_form"):
+                    st.caption("The other invoice is extracted with the current settings and "
+                               "the applied actions are replayed on it.")
+                    key_col = st.selectbox("Match lines on", key_options,
+                                           index=key_options.index(guessed_key) if guessed_key else 0)
+                    if st.form_submit_button("Compare", type="primary"):
+                        if compare_file is None:
+                            st.warning("Upload the invoice to compare with")
                         else:
-                            # Older actions: undo back to this point
-                            if st.button("Undo to here", key=f"undo_to{a['id']}", type="secondary"):
-                                undo_to_action_id(a['id'])
-                                st.rerun()
+                            plan = compile_template({"name": "current", "actions": [
+                                {'type': a['type'], 'params': a.get('params', {}) or {}}
+                                for a in st.session_state.applied_actions]})
+                            try:
+                                other_tables = file_tables(compare_file.name, compare_file.getvalue(),
+                                                           st.session_state.get("extraction_settings"))
+                            except PoolError as e:
+                                st.warning(str(e))
+                                st.stop()
+                            other, warnings = processed_table(other_tables, plan) if other_tables else (None, [])
+                            for w in warnings:
+                                st.warning(w)
+                            try:
+                                if other is None:
+                                    raise ValueError("No tables found in the other invoice")
+                                st.session_state.invoice_diff = diff_tables(table, other, key_col)
+                                st.session_state.invoice_diff['other_name'] = compare_file.name
+                            except ValueError as e:
+                                st.session_state.pop('invoice_diff', None)
+                                st.error(str(e))
+
+                diff = st.session_state.get('invoice_diff')
+                if diff:
+                    st.write(f"Compared with {diff['other_name']}: {len(diff['changed'])} changed, "
+                             f"{len(diff['added'])} added, {len(diff['removed'])} removed, "
+                             f"{diff['unchanged']} unchanged line(s)")
+                    for label, cols in [("Columns only in this invoice", diff['columns_only_old']),
+                                        ("Columns only in the other invoice", diff['columns_only_new'])]:
+                        if cols:
+                            st.write(f"**{label}:** {', '.join(map(str, cols))}")
+                    if len(diff['changed']):
+                        st.write("**Changed lines** (changed values highlighted)")
+                        st.dataframe(highlight_changes(diff['changed'], diff['changed_cells']),
+                                     width="stretch", hide_index=True)
+                    if len(diff['added']):
+                        st.write("**Added lines** (only in the other invoice)")
+                        st.dataframe(diff['added'], width="stretch", hide_index=True)
+                    if len(diff['removed']):
+                        st.write("**Removed lines** (only in this invoice)")
+                        st.dataframe(diff['removed'], width="stretch", hide_index=True)
+            else:
+                st.info("Apply headers first, so lines can be matched on a column")
+
+    with tab6:
+        # Optional local ledger of final line items across invoices
+        with st.expander("Add to Ledger"):
+            if 'main_table' in st.session_state:
+                table = st.session_state.main_table
+                guessed = guess_ledger_map(table.columns)
+                options = [None] + list(table.columns)
+                with st.form("ledger_form"):
+                    invoice_id_input = st.text_input("Invoice number")
+                    vendor_input = st.text_input("Vendor")
+                    invoice_date_input = st.date_input("Invoice date")
+                    st.write("Match columns to store (leave blank to skip a field)")
+                    ledger_map = {}
+                    for field in LEDGER_TEXT_FIELDS + list(LEDGER_NUMBER_FIELDS):
+                        ledger_map[field] = st.selectbox(field.replace("_", " ").capitalize(), options,
+                                                         index=options.index(guessed[field]))
+                    if st.form_submit_button("Save to Ledger", type="primary"):
+                        if not invoice_id_input.strip() or not vendor_input.strip():
+                            st.warning("Enter an invoice number and vendor")
+                        elif ledger_map['item_number'] is None:
+                            st.warning("Select the item number column")
+                        else:
+                            saved = save_invoice(invoice_id_input.strip(), vendor_input.strip(), invoice_date_input,
+                                                 table, ledger_map, source_file=uploaded_file.name)
+                            st.success(f"Saved {saved} line item(s) for invoice {invoice_id_input.strip()}")
+            else:
+                st.info("No table to save yet")
+
+        with st.expander("Query Ledger"):
+            summary = ledger_summary()
+            st.write(f"{summary['invoices']} invoice(s) from {summary['vendors']} vendor(s), "
+                     f"{summary['line_items']} line item(s)"
+                     + (f", latest {summary['last_date']}" if summary['last_date'] else ""))
+            history_item = st.text_input("Price history for item number", key="ledger_item")
+            if history_item.strip():
+                history = price_history(history_item)
+                if history.empty:
+                    st.info("Item not in the ledger")
+                else:
+                    st.dataframe(history, width="stretch", hide_index=True)
+            if st.checkbox("Show open backorders", key="ledger_backorders"):
+                backorders = open_backorders()
+                st.write(f"{len(backorders)} open backorder line(s)")
+                st.dataframe(backorders, width="stretch", hide_index=True)
+
+@st.fragment(key="applied_actions")
+def applied_actions_panel():
+    """Applied actions with undo/redo"""
+    rerun_if_evicted()
+    st.write("### Applied Actions")
+    actions = st.session_state.get('applied_actions', [])
+    redo_stack = st.session_state.get('redo_stack', [])
+    if redo_stack:
+        next_redo = redo_stack[-1]
+        redo_label = action_label(next_redo['type'], next_redo.get('params', {}) or {})
+        st.button(f"Redo {redo_label}", key="redo_btn", type="secondary", on_click=on_redo)
+
+    if actions:
+        for i, a in enumerate(reversed(actions)):
+            with st.container():
+                idx = len(actions) - 1 - i # original index
+                label = action_label(a['type'], a.get('params', {}) or {})
+                st.write(f"**{idx + 1}. {label}**")
+
+                if i == 0:
+                    # Most recent action: "Undo {name}"
+                    st.button(f"Undo {label}", key=f"undo_last{a['id']}", type="secondary", on_click=on_undo_last)
+                else:
+                    # Older actions: undo back to this point
+                    st.button("Undo to here", key=f"undo_to{a['id']}", type="secondary",
+                              on_click=on_undo_to, args=(a['id'],))
 
 
-        # Reset button to start over
-        if st.button("Reset to Original", key="reset_btn", type="primary"):
-            # Ensure original_table_data is initialized for this file/session
-            if 'original_table_data' not in st.session_state and 'table_as_list' in st.session_state:
-                st.session_state.original_table_data = [r[:] for r in st.session_state.table_as_list]
-            reset_all()
-            st.success("Table reset to original!")
-            st.rerun()
+# File uploader for PDF invoice or CSV export
+uploaded_file = st.file_uploader("Upload a PDF invoice or CSV export", type=["pdf", "csv"])
 
+if uploaded_file is not None:
+    is_csv = uploaded_file.name.lower().endswith(".csv")
+    if is_csv:
+        # The first rows become the working table; the full file is streamed from the Templates tab
+        pages = csv_preview_pages(uploaded_file.getvalue())
+        all_tables = pages[0]['tables']
+    else:
+        # Parsed once per file and served from the extraction cache on every rerun
+        pages = extract_or_stop(uploaded_file.getvalue(), st.session_state.get("extraction_settings"))
+        all_tables = all_tables_from_pages(pages, st.session_state.get("extraction_settings"))
+
+    raw_data_view(pages, all_tables)
+
+    # Combine all tables and initialize session state
+    if all_tables and st.session_state.get('tables_evicted'):
+        # Tables were evicted to save memory while this session was idle
+        restore_evicted_tables(all_tables)
+    elif all_tables and 'main_table' not in st.session_state:
+        init_main_table(all_tables)
+        st.success("Main table initialized!")
+
+    table_view()
+
+    # Initialize applied actions tracking
+    if 'applied_actions' not in st.session_state:
+        st.session_state.applied_actions = []
+
+    # Initialize redo-stack to undo an undo button
+    if 'redo_stack' not in st.session_state:
+        st.session_state.redo_stack = []
+
+    # Create columns for table and actions panel
+    col_choices, col_break, col_actions = st.columns([4, 1, 2])
+
+    # Column on the left to display formatting choices
+    with col_choices:
+        formatting_tabs(uploaded_file, is_csv, pages)
+
+    # Space between columns
+    with col_break:
+        st.write("")
+
+    # Column on the right to display applied actions
+    with col_actions:
+        applied_actions_panel()
+
+    # Reset button to start over
+    st.button("Reset to Original", key="reset_btn", type="primary", on_click=on_reset)
 
     # Fallback: show text for manual copy/paste
     if not all_tables:
-        full_text = ""
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                full_text += page_text + "\n\n"
-
-        if full_text:
-            st.text_area("Extracted text:", full_text, height=400)
+        fallback_text = full_text(pages)
+
+        if fallback_text:
+            st.text_area("Extracted text:", fallback_text, height=400)
         else:
             st.error("Could not extract any text from this PDF")
 
+# Memory accounting for everyone sharing this instance
+govern_memory()
+with st.sidebar.expander("Admin: Memory Usage"):
+    report = memory_report()
+    st.write(f"**Session tables:** {report['tracked_mb']} MB of {report['budget_mb']:.0f} MB budget")
+    if report['rss_mb'] is not None:
+        st.write(f"**Process memory:** {report['rss_mb']} MB")
+    if report['sessions']:
+        st.dataframe(pd.DataFrame(report['sessions']), width="stretch", hide_index=True)
+
+with st.sidebar.expander("Admin: Extraction Workers"):
+    metrics = pool_metrics()
+    st.write(f"**Workers busy:** {metrics['running']} of {metrics['workers']}")
+    st.write(f"**Queue:** {metrics['queued']} of {metrics['max_queued']} waiting")
+    st.write(f"**Jobs:** {metrics['completed']} done, {metrics['failed']} failed, {metrics['rejected']} turned away")
+    if metrics['wait_p50_s'] is not None:
+        st.write(f"**Wait for a worker:** {metrics['wait_p50_s']}s median, {metrics['wait_p95_s']}s p95")
+        st.write(f"**Extraction time:** {metrics['run_p50_s']}s median, {metrics['run_p95_s']}s p95")
+    if metrics['sessions']:
+        st.dataframe(pd.DataFrame(metrics['sessions']), width="stretch", hide_index=True)
+
 # Clear session state when new file is uploaded
 if uploaded_file is None and 'main_table' in st.session_state:
     del st.session_state.main_table
@@ -0,0 +1,122 @@
+"""
+Benchmark extraction backends on a local corpus of PDF invoices
+
+Usage:
+    python benchmark_backends.py CORPUS_DIR [--repeat 3] [--min-accuracy 0.95] [--pin TEMPLATE.json]
+
+Every PDF in CORPUS_DIR is extracted with each backend in EXTRACTION_BACKENDS.
+If a CSV with the same name sits next to a PDF (e.g. invoice.pdf + invoice.csv),
+it is used as the expected rows and the backend is scored on row recovery:
+the share of expected rows that show up, cell for cell, in the extracted tables.
+With --pin, the fastest backend that meets --min-accuracy is saved into the
+template's "extraction" settings.
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import statistics
+import time
+from collections import Counter
+
+from extraction_functions import EXTRACTION_BACKENDS, extract_pages, all_tables_from_pages
+from table_functions import TEMPLATES_DIR
+
+
+def normalize_row(row):
+    """Compare rows as stripped strings, ignoring trailing empty cells"""
+    cells = [str(c).strip() if c is not None else "" for c in row]
+    while cells and not cells[-1]:
+        cells.pop()
+    return tuple(cells)
+
+def load_expected_rows(csv_path):
+    """Read ground-truth rows from a CSV (no header handling: every row counts)"""
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        return [r for r in (normalize_row(row) for row in csv.reader(f)) if r]
+
+def row_recovery(expected_rows, pages):
+    """Share of expected rows found in the extracted tables (duplicates counted)"""
+    if not expected_rows:
+        return None
+    extracted = Counter(normalize_row(r) for table in all_tables_from_pages(pages) for r in table)
+    expected = Counter(expected_rows)
+    found = sum((expected & extracted).values())
+    return found / len(expected_rows)
+
+def benchmark(corpus_dir, repeat=3):
+    """
+    Time every backend on every PDF in corpus_dir.
+    Returns {backend: {'seconds': total median seconds, 'found': int, 'expected': int, 'files': int}}
+    """
+    pdf_paths = sorted(glob.glob(os.path.join(corpus_dir, "*.pdf")))
+    results = {name: {'seconds': 0.0, 'found': 0, 'expected': 0, 'files': 0} for name in EXTRACTION_BACKENDS}
+
+    for pdf_path in pdf_paths:
+        with open(pdf_path, "rb") as f:
+            file_bytes = f.read()
+        csv_path = os.path.splitext(pdf_path)[0] + ".csv"
+        expected_rows = load_expected_rows(csv_path) if os.path.exists(csv_path) else []
+
+        for name in EXTRACTION_BACKENDS:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                pages = extract_pages(file_bytes, {"backend": name})
+                timings.append(time.perf_counter() - start)
+            res = results[name]
+            res['seconds'] += statistics.median(timings)
+            res['files'] += 1
+            if expected_rows:
+                res['found'] += round(row_recovery(expected_rows, pages) * len(expected_rows))
+                res['expected'] += len(expected_rows)
+    return results
+
+def accuracy(res):
+    """Overall row recovery for one backend, or None without ground truth"""
+    return res['found'] / res['expected'] if res['expected'] else None
+
+def fastest_adequate_backend(results, min_accuracy):
+    """Fastest backend whose row recovery meets min_accuracy (None if none qualify)"""
+    adequate = [(res['seconds'], name) for name, res in results.items()
+                if accuracy(res) is not None and accuracy(res) >= min_accuracy]
+    return min(adequate)[1] if adequate else None
+
+def pin_backend(template_file, backend):
+    """Store the backend in a saved template's extraction settings"""
+    path = os.path.join(TEMPLATES_DIR, template_file)
+    with open(path, "r", encoding="utf-8") as f:
+        tpl = json.load(f)
+    tpl.setdefault("extraction", {})["backend"] = backend
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(tpl, f, ensure_ascii=False, indent=2)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction backends")
+    parser.add_argument("corpus_dir", help="Folder of PDFs (with optional same-name CSVs of expected rows)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per file and backend (median is used)")
+    parser.add_argument("--min-accuracy", type=float, default=0.95, help="Row recovery needed to pin a backend")
+    parser.add_argument("--pin", metavar="TEMPLATE.json", help="Template file in templates/ to pin the backend in")
+    args = parser.parse_args()
+
+    results = benchmark(args.corpus_dir, repeat=args.repeat)
+    print(f"{'backend':<14} {'files':>5} {'seconds':>9} {'row recovery':>13}")
+    for name, res in results.items():
+        acc = accuracy(res)
+        acc_text = f"{acc:.1%}" if acc is not None else "n/a"
+        print(f"{name:<14} {res['files']:>5} {res['seconds']:>9.3f} {acc_text:>13}")
+
+    best = fastest_adequate_backend(results, args.min_accuracy)
+    if best is None:
+        print(f"No backend reached {args.min_accuracy:.0%} row recovery (expected rows come from same-name CSVs)")
+        return
+    print(f"Fastest adequate backend: {best}")
+    if args.pin:
+        path = pin_backend(args.pin, best)
+        print(f"Pinned {best} in {path}")
+
+if __name__ == "__main__":
+    main()
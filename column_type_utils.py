@@ -0,0 +1,109 @@
+"""
+Typed storage for the display table: numeric columns as numbers, repetitive text as categoricals.
+Conversions are lossless, so the original strings can be rebuilt for display and export.
+"""
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Integers without leading zeros (so item numbers like "00123" stay text)
+INT_PATTERN = r"^(?:0|-?[1-9]\d*)$"
+# Decimals; a column only converts when every cell has the same number of decimals
+FLOAT_PATTERN = r"^-?(?:0|[1-9]\d*)\.\d+$"
+# Longest number (characters) converted; longer ones wouldn't survive the round trip exactly
+MAX_NUMBER_CHARS = 15
+# Cells checked first, so text columns are rejected without scanning every row
+SAMPLE_CELLS = 200
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+# Tables shorter than this are left as they are (nothing to gain)
+MIN_TYPED_ROWS = 20
+# Where the per-column conversions are recorded on the DataFrame
+FORMATS_ATTR = "column_formats"
+
+
+def _empty_value(values, empty):
+    """What empty cells were: None or "" (None wins when a column has both)"""
+    return None if values[empty].isna().any() else ""
+
+def _infer_column(values):
+    """
+    Pick a typed representation for one text column.
+    Returns (typed Series, format dict) or (None, None) to keep the column as it is.
+    """
+    text = values.where(values.isna(), values.astype(str))
+    empty = text.isna() | (text == "")
+    filled = text[~empty]
+    if filled.empty:
+        return None, None
+    lengths = filled.str.len()
+    short_enough = lengths.max() <= MAX_NUMBER_CHARS
+
+    sample = filled.head(SAMPLE_CELLS)
+    if short_enough and sample.str.fullmatch(INT_PATTERN).all() and filled.str.fullmatch(INT_PATTERN).all():
+        typed = pd.to_numeric(text.where(~empty), errors="coerce").astype("Int64")
+        return typed, {'kind': "int", 'empty': _empty_value(values, empty)}
+
+    if short_enough and sample.str.fullmatch(FLOAT_PATTERN).all() and filled.str.fullmatch(FLOAT_PATTERN).all():
+        places = lengths - filled.str.find(".") - 1
+        if places.nunique() == 1:
+            typed = pd.to_numeric(text.where(~empty), errors="coerce").astype(float)
+            return typed, {'kind': "float", 'decimals': int(places.iloc[0]), 'empty': _empty_value(values, empty)}
+
+    if values.nunique(dropna=False) <= CATEGORY_MAX_RATIO * len(values):
+        return values.astype("category"), {'kind': "category"}
+    return None, None
+
+def infer_column_types(df):
+    """
+    Convert a DataFrame of strings to compact typed columns where that is lossless:
+    - whole numbers -> nullable Int64
+    - decimals with the same number of places -> float64 (places remembered for display)
+    - low-cardinality text (Location, discount %, empty cells) -> category
+    Other columns stay as object strings. The conversions are stored in df.attrs
+    so to_text_frame() can rebuild the original strings.
+    """
+    if len(df) < MIN_TYPED_ROWS or not df.columns.is_unique:
+        return df
+    typed = df.copy()
+    formats = {}
+    for col in df.columns:
+        # Only text columns (object, or pandas' string dtype) are converted
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        converted, fmt = _infer_column(df[col])
+        if fmt:
+            typed[col] = converted
+            formats[col] = fmt
+    typed.attrs[FORMATS_ATTR] = formats
+    return typed
+
+def to_text_frame(df):
+    """Rebuild the original string cells of a table typed by infer_column_types()"""
+    formats = df.attrs.get(FORMATS_ATTR) or {}
+    if not formats:
+        return df
+    text = df.copy()
+    for col, fmt in formats.items():
+        if col not in text.columns:
+            continue
+        values = text[col]
+        if fmt['kind'] == "category":
+            text[col] = values.astype(object).where(values.notna(), None)
+            continue
+        missing = values.isna().to_numpy()
+        if fmt['kind'] == "int":
+            strings = values.fillna(0).astype(np.int64).astype(str).to_numpy(dtype=object)
+        else:
+            strings = np.char.mod(f"%.{fmt['decimals']}f", values.fillna(0).to_numpy(dtype=float)).astype(object)
+        strings[missing] = fmt['empty']
+        text[col] = strings
+    text.attrs.pop(FORMATS_ATTR, None)
+    return text
+
+def display_column_config(df):
+    """st.dataframe column_config showing typed decimals with their original number of places"""
+    formats = df.attrs.get(FORMATS_ATTR) or {}
+    return {col: st.column_config.NumberColumn(format=f"%.{fmt['decimals']}f")
+            for col, fmt in formats.items() if fmt['kind'] == "float"}
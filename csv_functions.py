@@ -0,0 +1,142 @@
+"""
+CSV input for the working-table pipeline: chunked reading and chunk-by-chunk template replay
+"""
+
+import csv
+import io
+from contextlib import contextmanager
+from itertools import islice
+import streamlit as st
+from fingerprint_utils import row_fingerprint
+from table_functions import _invoke
+
+# Rows read and processed at a time when streaming a CSV through a template
+CHUNK_ROWS = 50_000
+# Rows loaded into the app as the working table for building a template
+CSV_PREVIEW_ROWS = 5_000
+# Action that picks the header row; later chunks get the header row put back in front
+HEADER_ACTION = "apply_headers"
+# Session keys an action may touch; saved and restored around a streaming run
+STATE_KEYS = ["working_data", "current_headers", "raw_headers", "header_row_index",
+              "debug_matches", "debug_matched_cols"]
+
+
+def open_csv_text(source):
+    """Text stream for a path, bytes or binary file object (BOM stripped)"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    if isinstance(source, str):
+        return open(source, newline="", encoding="utf-8-sig")
+    return io.TextIOWrapper(source, newline="", encoding="utf-8-sig")
+
+def iter_csv_chunks(source, chunk_rows=CHUNK_ROWS):
+    """
+    Yield lists of rows (lists of strings) of at most chunk_rows rows.
+    Rows keep their own width, so messy exports with ragged rows read fine.
+    The header line is treated as data, like the first row of a PDF table.
+    """
+    with open_csv_text(source) as f:
+        reader = csv.reader(f)
+        while True:
+            chunk = list(islice(reader, chunk_rows))
+            if not chunk:
+                return
+            yield chunk
+
+@st.cache_data(show_spinner="Reading CSV...")
+def csv_preview_pages(file_bytes, rows=CSV_PREVIEW_ROWS):
+    """
+    First rows of a CSV in the per-page format of extract_pages(), as one "page"
+    holding one table, so the app treats an uploaded CSV like a PDF.
+    """
+    table = next(iter_csv_chunks(file_bytes, rows), [])
+    return [{'page_num': 1, 'width': 0, 'height': 0, 'skipped': False,
+             'tables': [table] if table else [], 'text': "", 'words': []}]
+
+def non_row_local_steps(plan):
+    """Labels of plan steps that need the whole table at once (so can't run chunk by chunk)"""
+    return [step['label'] for step in plan['steps']
+            if step['cfg'] and step['type'] != HEADER_ACTION and not step['cfg'].get("row_local")]
+
+@contextmanager
+def _isolated_state(keys=STATE_KEYS):
+    """Run actions on scratch session state, leaving the user's table untouched"""
+    ss = st.session_state
+    saved = {key: ss[key] for key in keys if key in ss}
+    try:
+        for key in keys:
+            ss.pop(key, None)
+        yield ss
+    finally:
+        for key in keys:
+            ss.pop(key, None)
+        ss.update(saved)
+
+def _run_steps(ss, steps, rows, header_row=None):
+    """
+    Run compiled steps over one chunk of rows.
+    Returns (output rows without the header row, warnings, header row as headers were applied).
+    header_row: the header row as the first chunk had it when headers were applied;
+    it is put back in front of later chunks so header-relative steps behave the same.
+    """
+    ss.working_data = rows
+    ss.current_headers = None
+    ss.header_row_index = None
+    ss.raw_headers = None
+    warnings = []
+    applied_header_row = None
+    for step in steps:
+        if step['error'] or not step['cfg']:
+            continue
+        call_params = step['call_params']
+        if header_row is not None and step['type'] == HEADER_ACTION:
+            ss.working_data = [header_row] + ss.working_data
+        if header_row is not None and 'header_row_index' in call_params:
+            # The header row sits at the top of every chunk after the first
+            call_params = dict(call_params, header_row_index=0)
+        result, call_warnings = _invoke(step['cfg'], call_params)
+        warnings.extend(call_warnings)
+        if step['cfg']["returns_data"] and result is not None:
+            ss.working_data = result
+        if step['type'] == HEADER_ACTION:
+            applied_header_row = ss.get("raw_headers")
+
+    # Leave out the header row and its repeats, as the app's display does
+    header_idx = ss.get("header_row_index")
+    header_key = row_fingerprint(ss.raw_headers) if ss.get("raw_headers") is not None else None
+    out = [r for i, r in enumerate(ss.working_data)
+           if i != header_idx and (header_key is None or row_fingerprint(r) != header_key)]
+    return out, warnings, applied_header_row
+
+def process_csv(source, plan, out, chunk_rows=CHUNK_ROWS):
+    """
+    Stream a CSV through a compiled template plan, writing CSV to the text stream out.
+    Rows are read, transformed and written one chunk at a time, so memory use
+    depends on chunk_rows, not on the size of the file.
+    The first chunk must hold the header row the template picks.
+    Yields a progress dict after every chunk:
+        {'chunks': int, 'rows_in': int, 'rows_out': int, 'warnings': [str, ...]}
+    Raises ValueError when a step can't run chunk by chunk.
+    """
+    blocked = non_row_local_steps(plan)
+    if blocked:
+        raise ValueError(f"These steps need the whole table and can't be streamed: {', '.join(blocked)}")
+
+    writer = csv.writer(out)
+    progress = {'chunks': 0, 'rows_in': 0, 'rows_out': 0, 'warnings': []}
+    header_row = None
+    with _isolated_state() as ss:
+        for chunk in iter_csv_chunks(source, chunk_rows):
+            first = progress['chunks'] == 0
+            rows, warnings, applied_header_row = _run_steps(ss, plan['steps'], chunk,
+                                                            None if first else header_row)
+            if first:
+                header_row = applied_header_row
+                if ss.get("current_headers"):
+                    writer.writerow(ss.current_headers)
+            writer.writerows(["" if c is None else c for c in r] for r in rows)
+            progress['chunks'] += 1
+            progress['rows_in'] += len(chunk)
+            progress['rows_out'] += len(rows)
+            progress['warnings'] = sorted(set(progress['warnings']) | set(warnings))
+            yield dict(progress)
@@ -1,17 +1,48 @@
-import streamlit as st
-import pandas as pd
+"""
+Run a saved template over a CSV export, chunk by chunk
 
-st.title("CSV Table Viewer")
+Usage:
+    python csv_tables.py INPUT.csv --template TEMPLATE.json [--output OUT.csv] [--chunk-rows 50000]
 
-uploaded_file = st.file_uploader("Upload CSV File", type="csv")
+Rows are read, cleaned by the template's actions and written out one chunk at a time,
+so multi-GB vendor exports never have to fit in memory. Only row-by-row actions
+(row deletes, splits, computed columns, header fixes) can be streamed; the first
+chunk must contain the header row the template picks.
+"""
 
-if uploaded_file is not None:
-    # Read the CSV
-    df = pd.read_csv(uploaded_file)
+import argparse
+import sys
 
-    st.write(f"**Table Info:** {len(df)} rows x {len(df.columns)} columns")
+from csv_functions import CHUNK_ROWS, process_csv
+from table_functions import load_compiled_template
 
-    #Display the table
-    st.dataframe(df, width="stretch")
 
-    st.write("**Columns:**", list(df.columns))
+def main():
+    parser = argparse.ArgumentParser(description="Stream a CSV through a saved template")
+    parser.add_argument("csv", help="CSV file to read")
+    parser.add_argument("--template", required=True, metavar="TEMPLATE.json", help="Template file in templates/")
+    parser.add_argument("-o", "--output", help="File to write to (default: stdout)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help=f"Rows per chunk (default {CHUNK_ROWS})")
+    args = parser.parse_args()
+
+    plan = load_compiled_template(args.template)
+    if not plan:
+        sys.exit(f"Could not load template: {args.template}")
+
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    progress = None
+    try:
+        for progress in process_csv(args.csv, plan, out, chunk_rows=args.chunk_rows):
+            out.flush()
+            print(f"chunk {progress['chunks']}: {progress['rows_in']} rows read, "
+                  f"{progress['rows_out']} written", file=sys.stderr)
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    for w in (progress or {}).get('warnings', []):
+        print(f"warning: {w}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Invoice-to-invoice diff: two processed tables hash-joined on an item key
+"""
+
+import pandas as pd
+from column_type_utils import to_text_frame
+from csv_functions import STATE_KEYS, _isolated_state, iter_csv_chunks
+from extraction_functions import extract_pdf, all_tables_from_pages
+from table_functions import FINGERPRINT_KEYS, init_main_table, replay_plan
+
+# Extra session keys a full replay touches (init_main_table included), on top of the ones a streaming run uses
+REPLAY_KEYS = STATE_KEYS + ["main_table", "table_as_list", "original_table_data",
+                            "applied_actions", "redo_stack"] + FINGERPRINT_KEYS
+# Join column numbering repeated keys, so the same item listed twice pairs up in order
+OCCURRENCE_COL = "__occurrence"
+# Suffixes of the two sides' columns after the join
+OLD_SUFFIX, NEW_SUFFIX = " (old)", " (new)"
+
+
+def file_tables(file_name, file_bytes, settings=None):
+    """Raw tables of an uploaded PDF or CSV, as the app extracts them"""
+    if file_name.lower().endswith(".csv"):
+        rows = [row for chunk in iter_csv_chunks(file_bytes) for row in chunk]
+        return [rows] if rows else []
+    return all_tables_from_pages(extract_pdf(file_bytes, settings), settings)
+
+def processed_table(all_tables, plan):
+    """
+    Display table after replaying a compiled plan over freshly extracted tables (at least one).
+    Runs on scratch session state, so the table being worked on is left as it is.
+    The tables are combined by init_main_table, as the app does, so rows line up the same way.
+    Returns (DataFrame, warnings).
+    """
+    with _isolated_state(REPLAY_KEYS) as ss:
+        init_main_table(all_tables)
+        warnings = replay_plan(plan, reset_first=True, log_steps=False)
+        return ss.main_table, warnings
+
+def _keyed_text(df, key_col):
+    """Text cells (stripped, empty for None) plus a per-key occurrence number"""
+    text = to_text_frame(df).astype(object).fillna("").astype(str).apply(lambda s: s.str.strip())
+    text[OCCURRENCE_COL] = text.groupby(key_col, sort=False).cumcount()
+    return text
+
+def diff_tables(old, new, key_col):
+    """
+    Compare two processed invoice tables line by line, matching lines on key_col.
+    A key listed several times is matched by order of appearance.
+    Cells are compared as the tables show them, over whole columns at once.
+    Returns:
+        'added': rows only in new, 'removed': rows only in old,
+        'changed': matched rows with any difference; for each column that changed anywhere,
+                   the old and new values side by side,
+        'changed_cells': boolean frame, same shape as 'changed', marking the differing new values,
+        'unchanged': count of matched rows with no differences,
+        'columns_only_old' / 'columns_only_new': columns not present on both sides
+    """
+    if key_col not in old.columns or key_col not in new.columns:
+        raise ValueError(f"Key column {key_col!r} must be in both tables")
+    if not (old.columns.is_unique and new.columns.is_unique):
+        raise ValueError("Both tables need unique column names; apply headers first")
+    old_text, new_text = _keyed_text(old, key_col), _keyed_text(new, key_col)
+    join = [key_col, OCCURRENCE_COL]
+    compare = [c for c in old.columns if c != key_col and c in new.columns]
+
+    # Hash join on (key, occurrence); the indicator says which side each line came from
+    merged = old_text[join + compare].merge(new_text[join + compare], on=join, how="outer",
+                                            suffixes=(OLD_SUFFIX, NEW_SUFFIX), indicator=True, sort=False)
+    side = merged.pop("_merge")
+    both = merged[side == "both"]
+
+    differs = pd.DataFrame({c: both[c + OLD_SUFFIX].to_numpy() != both[c + NEW_SUFFIX].to_numpy()
+                            for c in compare}, index=both.index)
+    changed_rows = differs.any(axis=1)
+    changed_cols = [c for c in compare if differs[c].any()]
+
+    changed = both.loc[changed_rows, [key_col] + [c + s for c in changed_cols for s in (OLD_SUFFIX, NEW_SUFFIX)]]
+    changed_cells = pd.DataFrame(False, index=changed.index, columns=changed.columns)
+    for c in changed_cols:
+        changed_cells[c + NEW_SUFFIX] = differs.loc[changed_rows, c]
+
+    added_keys = merged.loc[side == "right_only", join]
+    removed_keys = merged.loc[side == "left_only", join]
+    return {
+        'added': new_text.merge(added_keys, on=join).drop(columns=OCCURRENCE_COL),
+        'removed': old_text.merge(removed_keys, on=join).drop(columns=OCCURRENCE_COL),
+        'changed': changed.reset_index(drop=True),
+        'changed_cells': changed_cells.reset_index(drop=True),
+        'unchanged': int((~changed_rows).sum()),
+        'columns_only_old': [c for c in old.columns if c not in new.columns],
+        'columns_only_new': [c for c in new.columns if c not in old.columns],
+    }
+
+def highlight_changes(changed, changed_cells, color="background-color: #fff3b0"):
+    """Styler for the changed lines with the differing new values highlighted"""
+    styles = changed_cells.replace({True: color, False: ""})
+    return changed.style.apply(lambda _: styles, axis=None)
@@ -0,0 +1,101 @@
+"""
+EXPLAIN for templates: run a plan over a sample of the table and report what each step would do
+"""
+
+import time
+from collections import Counter
+from csv_functions import STATE_KEYS, _isolated_state
+from fingerprint_utils import row_fingerprint
+from table_functions import _invoke
+
+# Rows of the table the plan is run on (plus any rows above the header row)
+EXPLAIN_SAMPLE_ROWS = 2_000
+
+
+def sample_rows(rows, plan, size=EXPLAIN_SAMPLE_ROWS):
+    """
+    Evenly spaced sample of the table for explaining a plan.
+    Rows up to the furthest header row any step refers to are kept as they are,
+    so header row indexes still point at the same rows.
+    Returns (sample, scale) where scale turns sample counts into whole-table estimates.
+    """
+    fixed = max((int(s['params']['header_row_index']) + 1 for s in plan['steps']
+                 if s['params'].get('header_row_index') is not None), default=0)
+    rest = rows[fixed:]
+    room = max(1, size - fixed)
+    step = max(1, -(-len(rest) // room))
+    sampled = rest[::step]
+    scale = len(rest) / len(sampled) if sampled else 1.0
+    return rows[:fixed] + sampled, scale
+
+def _width(ss):
+    """Columns in the table as shown: the headers once applied, else the widest row"""
+    if ss.get("current_headers"):
+        return len(ss.current_headers)
+    return max((len(r) for r in ss.get("working_data") or []), default=0)
+
+def _data_rows(ss, rows):
+    """Rows other than the header row"""
+    header_idx = ss.get("header_row_index")
+    return len(rows) - (1 if header_idx is not None and 0 <= header_idx < len(rows) else 0)
+
+def explain_plan(plan, rows, size=EXPLAIN_SAMPLE_ROWS):
+    """
+    Run a compiled plan over a sample of rows, step by step, on scratch session state.
+    Returns:
+        {'table_rows', 'sample_rows', 'scale', 'projected_ms',
+         'steps': [{'step', 'label', 'rows_in', 'rows_out', 'rows_matched', 'rows_added',
+                    'rows_removed', 'columns_in', 'columns_out', 'projected_ms', 'flags'}]}
+    Row counts are whole-table estimates scaled from the sample; rows_matched counts rows
+    a step removed or changed. Steps needing the whole table (e.g. column deletes)
+    are only as good as the sample.
+    flags: "error", "matches nothing", "deletes every row", "deletes every column"
+    """
+    sample, scale = sample_rows(rows, plan, size)
+    est = lambda n: int(round(n * scale))
+    report = []
+    with _isolated_state(STATE_KEYS) as ss:
+        ss.working_data = [list(r) for r in sample]
+        ss.current_headers = None
+        ss.header_row_index = None
+        ss.raw_headers = None
+        for n, step in enumerate(plan['steps'], 1):
+            before = ss.working_data
+            columns_in = _width(ss)
+            entry = {'step': n, 'label': step['label'], 'rows_in': est(len(before)), 'columns_in': columns_in,
+                     'flags': []}
+            if step['error'] or not step['cfg']:
+                entry.update(rows_out=entry['rows_in'], rows_matched=0, rows_added=0, rows_removed=0,
+                             columns_out=columns_in, projected_ms=0.0,
+                             flags=[f"error: {step['error'] or 'unknown action'}"])
+                report.append(entry)
+                continue
+
+            start = time.perf_counter()
+            result, warnings = _invoke(step['cfg'], step['call_params'])
+            elapsed = time.perf_counter() - start
+            if step['cfg']["returns_data"] and result is not None:
+                ss.working_data = result
+            after = ss.working_data
+
+            # Rows that came out differently: compare the rows as multisets of fingerprints
+            old_rows, new_rows = Counter(map(row_fingerprint, before)), Counter(map(row_fingerprint, after))
+            removed, added = sum((old_rows - new_rows).values()), sum((new_rows - old_rows).values())
+            entry.update(rows_out=est(len(after)), rows_matched=est(max(removed, added)),
+                         rows_added=est(max(0, len(after) - len(before))),
+                         rows_removed=est(max(0, len(before) - len(after))),
+                         columns_out=_width(ss), projected_ms=round(elapsed * scale * 1000, 1))
+            entry['flags'] += [f"error: {w}" for w in warnings]
+            if step['cfg']["returns_data"] and result is None:
+                entry['flags'].append("error: returned no data")
+            elif not warnings and removed == 0 and added == 0 and entry['columns_out'] == columns_in \
+                    and step['type'] != "apply_headers":
+                entry['flags'].append("matches nothing")
+            if _data_rows(ss, before) and not _data_rows(ss, after):
+                entry['flags'].append("deletes every row")
+            if columns_in and not entry['columns_out']:
+                entry['flags'].append("deletes every column")
+            report.append(entry)
+
+    return {'table_rows': len(rows), 'sample_rows': len(sample), 'scale': scale,
+            'projected_ms': round(sum(e['projected_ms'] for e in report), 1), 'steps': report}
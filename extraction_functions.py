@@ -0,0 +1,351 @@
+"""
+PDF extraction functions
+"""
+
+import io
+from bisect import bisect_right
+import streamlit as st
+import pdfplumber
+import pypdfium2 as pdfium
+from fingerprint_utils import table_fingerprint
+from layout_functions import LayoutPage, compact_layout, parse_layouts, worker_layouts, file_digest, char_attrs_for
+from pool_functions import run_job
+
+
+# Optional extraction settings a template can carry under "extraction"
+# - backend: key into EXTRACTION_BACKENDS (defaults to pdfplumber)
+# - table_settings: passed straight to pdfplumber's page.extract_tables() (pdfplumber backend only)
+# - crop_bbox: [x0, top, x1, bottom] region analyzed on every page
+# - page_crop_bboxes: per-page overrides, keyed by page number ("1", "2" or "-1" for the last page)
+# - skip_first_pages / skip_last_pages: number of pages left out entirely
+# - word_gap: largest gap (points) between words of the same cell (word-clustering backends only)
+# - drop_repeated_tables: drop tables identical to one on an earlier page (repeated headers, footers);
+#   off by default, as repeated line-item blocks are real data
+EXTRACTION_SETTING_KEYS = ["backend", "table_settings", "crop_bbox", "page_crop_bboxes",
+                           "skip_first_pages", "skip_last_pages", "word_gap", "drop_repeated_tables"]
+
+def clean_extraction_settings(settings):
+    """
+    Keep only known, non-empty extraction settings.
+    Returns None when nothing is set so default extraction shares one cache entry.
+    """
+    if not settings:
+        return None
+    cleaned = {k: settings[k] for k in EXTRACTION_SETTING_KEYS if settings.get(k)}
+    return cleaned or None
+
+def pages_to_extract(page_count, settings):
+    """Page numbers (1-based) left after applying the skip first/last page rules"""
+    settings = settings or {}
+    first = 1 + int(settings.get("skip_first_pages") or 0)
+    last = page_count - int(settings.get("skip_last_pages") or 0)
+    return set(range(first, last + 1))
+
+def crop_bbox_for_page(settings, page_num, page_count):
+    """Crop box for a page: a per-page override wins over the default crop_bbox"""
+    settings = settings or {}
+    overrides = settings.get("page_crop_bboxes") or {}
+    bbox = overrides.get(str(page_num)) or overrides.get(str(page_num - page_count - 1))
+    return bbox or settings.get("crop_bbox")
+
+def _empty_page(page_num, width, height, skipped):
+    """Per-page result shared by every backend"""
+    return {'page_num': page_num, 'width': width, 'height': height,
+            'skipped': skipped, 'tables': [], 'text': "", 'words': []}
+
+def _layout_pages(layouts, settings, read_region):
+    """
+    Call read_region(entry, region) for every wanted page of the parsed layouts.
+    region is a LayoutPage cropped to the template's line-item box (or the whole page),
+    so new settings or crop boxes never re-parse the PDF.
+    """
+    pages = []
+    page_count = len(layouts)
+    wanted = pages_to_extract(page_count, settings)
+    for page_num, layout in enumerate(layouts, 1): # Start page numbering at 1
+        entry = _empty_page(page_num, layout['width'], layout['height'], page_num not in wanted)
+        if not entry['skipped']:
+            # Only analyze the line-item region when the template gives one
+            region = LayoutPage(layout, crop_bbox_for_page(settings, page_num, page_count))
+            read_region(entry, region)
+        pages.append(entry)
+    return pages
+
+def _read_pdfplumber_region(entry, region, settings):
+    """pdfplumber backend, one page: ruling-line table finder plus text and words"""
+    entry['tables'] = region.extract_tables((settings or {}).get("table_settings") or {})
+    entry['text'] = region.extract_text() or ""
+    entry['words'] = region.word_tuples()
+
+def _read_words_region(entry, region, settings):
+    """Word-clustering backend, one page: rows and columns straight from word positions"""
+    words = region.word_tuples()
+    rows = words_to_table(words, word_gap=(settings or {}).get("word_gap"))
+    entry['words'] = words
+    entry['text'] = _lines_to_text(_group_into_lines(words))
+    entry['tables'] = [rows] if rows else []
+
+def _extract_with_pdfplumber(file_bytes, settings, layouts):
+    """
+    pdfplumber backend: ruling-line table finder (the original extraction path).
+    Runs on the cached page layouts, so only the table finder reruns when settings change.
+    """
+    return _layout_pages(layouts, settings, lambda entry, region: _read_pdfplumber_region(entry, region, settings))
+
+def _extract_with_words(file_bytes, settings, layouts):
+    """
+    Word-clustering backend for borderless invoices: skips pdfplumber's table finder
+    and builds rows and columns straight from word positions (see words_to_table).
+    """
+    return _layout_pages(layouts, settings, lambda entry, region: _read_words_region(entry, region, settings))
+
+def _group_into_lines(words, y_tolerance=3):
+    """
+    Group (x0, top, x1, bottom, text) tuples into lines of text, top to bottom.
+    One sweep over the words sorted by top: a word joins the current line
+    while its top is within y_tolerance of the line's first word.
+    Each line is sorted left to right.
+    """
+    lines = []
+    for word in sorted(words, key=lambda w: (w[1], w[0])):
+        if lines and word[1] - lines[-1][0][1] <= y_tolerance:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    return [sorted(line, key=lambda w: w[0]) for line in lines]
+
+def _lines_to_text(lines):
+    """Plain text of grouped lines, one line per row"""
+    return "\n".join(" ".join(w[4] for w in line) for line in lines)
+
+def _merge_into_cells(line, word_gap):
+    """Join neighbouring words of one line whose horizontal gap is at most word_gap"""
+    cells = []
+    for word in line:
+        if cells and word[0] - cells[-1][2] <= word_gap:
+            x0, top, _, bottom, text = cells[-1]
+            cells[-1] = (x0, min(top, word[1]), word[2], max(bottom, word[3]), f"{text} {word[4]}")
+        else:
+            cells.append(word)
+    return cells
+
+def _column_bands(lines):
+    """
+    Find column x-ranges by merging overlapping cell intervals (sorted by x0).
+    Only lines with more than one cell vote, so titles and footers that run
+    across several columns don't glue the columns together.
+    """
+    spans = sorted((cell[0], cell[2]) for line in lines if len(line) > 1 for cell in line)
+    bands = []
+    for x0, x1 in spans:
+        if bands and x0 <= bands[-1][1]:
+            bands[-1][1] = max(bands[-1][1], x1)
+        else:
+            bands.append([x0, x1])
+    return bands
+
+def words_to_table(words, y_tolerance=3, word_gap=None):
+    """
+    Build table rows directly from positioned words (x0, top, x1, bottom, text).
+    - rows: words are swept top to bottom and grouped into lines
+    - cells: words closer than word_gap are joined (default: half the median word height)
+    - columns: overlapping cell x-intervals are merged into column bands,
+      and each cell goes to the band holding its centre (binary search over band starts)
+    Empty positions stay as "" so every row has the same width.
+    """
+    if not words:
+        return []
+    if word_gap is None:
+        heights = sorted(w[3] - w[1] for w in words)
+        word_gap = heights[len(heights) // 2] / 2
+    lines = [_merge_into_cells(line, word_gap) for line in _group_into_lines(words, y_tolerance)]
+    bands = _column_bands(lines)
+    if not bands:
+        return [[cell[4] for cell in line] for line in lines]
+
+    starts = [band[0] for band in bands]
+    rows = []
+    for line in lines:
+        row = [""] * len(bands)
+        for cell in line:
+            col = max(bisect_right(starts, (cell[0] + cell[2]) / 2) - 1, 0)
+            row[col] = f"{row[col]} {cell[4]}" if row[col] else cell[4]
+        rows.append(row)
+    return rows
+
+def _pdfium_page(pdf, page_num, page_count, settings):
+    """Read one page with PDFium into the per-page dict (skipped pages are not read)"""
+    page = pdf[page_num - 1]
+    width, height = page.get_size()
+    entry = _empty_page(page_num, width, height, page_num not in pages_to_extract(page_count, settings))
+    if not entry['skipped']:
+        textpage = page.get_textpage()
+        bbox = crop_bbox_for_page(settings, page_num, page_count)
+        x0, top, x1, bottom = (float(v) for v in bbox) if bbox else (0, 0, width, height)
+        runs = []
+        for i in range(textpage.count_rects()):
+            # PDFium measures from the bottom of the page; flip to pdfplumber's top-down coordinates
+            left, low, right, high = textpage.get_rect(i)
+            run = (left, height - high, right, height - low)
+            if run[0] < x0 or run[2] > x1 or run[1] < top or run[3] > bottom:
+                continue
+            text = textpage.get_text_bounded(left, low, right, high).strip()
+            if text:
+                runs.append(run + (text,))
+        rows = words_to_table(runs, word_gap=(settings or {}).get("word_gap"))
+        entry['words'] = runs
+        entry['text'] = _lines_to_text(_group_into_lines(runs))
+        entry['tables'] = [rows] if rows else []
+        textpage.close()
+    page.close()
+    return entry
+
+def _extract_with_pdfium(file_bytes, settings, layouts=None):
+    """
+    PDFium text-layout backend: reads positioned text runs with PDFium's C text engine
+    (no Java, no service) and clusters them into rows and columns with words_to_table.
+    Much faster than pdfplumber's parsing and table finder.
+    """
+    pdf = pdfium.PdfDocument(file_bytes)
+    try:
+        page_count = len(pdf)
+        return [_pdfium_page(pdf, page_num, page_count, settings) for page_num in range(1, page_count + 1)]
+    finally:
+        pdf.close()
+
+# Registry of extraction backends
+# - label: shown in the extraction settings form
+# - func: callable(file_bytes, settings, layouts) returning the per-page list described in extract_pages()
+# - uses_layout: True when func reads the parsed pdfplumber layouts (see layout_functions)
+# - read_region: callable(entry, region, settings) filling one page from a LayoutPage (layout backends only)
+EXTRACTION_BACKENDS = {
+    "pdfplumber": {
+        "label": "pdfplumber table finder",
+        "func": _extract_with_pdfplumber,
+        "uses_layout": True,
+        "read_region": _read_pdfplumber_region,
+    },
+    "words": {
+        "label": "Word clustering (borderless tables)",
+        "func": _extract_with_words,
+        "uses_layout": True,
+        "read_region": _read_words_region,
+    },
+    "pdfium_text": {
+        "label": "PDFium text layout (fast)",
+        "func": _extract_with_pdfium,
+        "uses_layout": False,
+    },
+}
+DEFAULT_BACKEND = "pdfplumber"
+
+def _backend_config(settings):
+    """Registry entry of the backend chosen in (cleaned) settings"""
+    backend = (settings or {}).get("backend") or DEFAULT_BACKEND
+    cfg = EXTRACTION_BACKENDS.get(backend)
+    if not cfg:
+        raise ValueError(f"Unknown extraction backend: {backend}")
+    return cfg
+
+def extract_pages(file_bytes, settings=None, layouts=None):
+    """
+    Run the backend chosen in settings (uncached).
+    layouts: parsed page layouts to reuse (see worker_layouts); parsed here when not given.
+    Returns a list of per-page dicts:
+        {'page_num': int, 'width': float, 'height': float, 'skipped': bool,
+         'tables': [table, ...], 'text': str, 'words': [(x0, top, x1, bottom, text), ...]}
+    Each table is a raw list of rows.
+    Skipped pages keep their place in the list (so page numbers line up) but are never analyzed.
+    """
+    settings = clean_extraction_settings(settings)
+    cfg = _backend_config(settings)
+    if cfg.get("uses_layout") and layouts is None:
+        layouts = parse_layouts(file_bytes, char_attrs_for((settings or {}).get("table_settings")))
+    return cfg["func"](file_bytes, settings, layouts)
+
+def _extract_in_worker(file_bytes, settings, digest):
+    """Worker side of extract_pdf: layout backends reuse the worker's cached layouts"""
+    layouts = None
+    if _backend_config(settings).get("uses_layout"):
+        layouts = worker_layouts(digest, file_bytes, char_attrs_for((settings or {}).get("table_settings")))
+    return extract_pages(file_bytes, settings, layouts)
+
+@st.cache_data(show_spinner="Extracting tables from PDF...")
+def extract_pdf(file_bytes, settings=None):
+    """
+    Extract tables and cache the result by file content and settings.
+    Runs in the shared extraction worker pool; raises PoolBusyError when it's full
+    and JobFailedError when the job runs too long or its worker dies.
+    Only the file goes to the worker: the parsed layouts stay cached there (see worker_layouts),
+    so a settings change only reruns table detection.
+    """
+    settings = clean_extraction_settings(settings)
+    return run_job(_extract_in_worker, file_bytes, settings, file_digest(file_bytes))
+
+def page_count(source):
+    """Number of pages in a PDF (path or bytes), read with PDFium without parsing any page"""
+    pdf = pdfium.PdfDocument(source)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+def iter_pages(source, settings=None, page_numbers=None):
+    """
+    Yield the per-page dicts of extract_pages() one page at a time (uncached).
+    source: path or bytes of the PDF. page_numbers: 1-based pages to read (default: all).
+    Only one page's layout is held at once, so memory stays flat for long documents.
+    Pages outside page_numbers are not yielded; skipped pages are yielded as skipped.
+    """
+    settings = clean_extraction_settings(settings)
+    cfg = _backend_config(settings)
+    if cfg.get("uses_layout"):
+        opened = pdfplumber.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        count = len(opened.pages)
+    else:
+        opened = pdfium.PdfDocument(source)
+        count = len(opened)
+    try:
+        wanted = pages_to_extract(count, settings)
+        char_attrs = char_attrs_for((settings or {}).get("table_settings"))
+        for page_num in sorted(page_numbers or range(1, count + 1)):
+            if not 1 <= page_num <= count:
+                continue
+            if not cfg.get("uses_layout"):
+                yield _pdfium_page(opened, page_num, count, settings)
+                continue
+            page = opened.pages[page_num - 1]
+            entry = _empty_page(page_num, page.width, page.height, page_num not in wanted)
+            if not entry['skipped']:
+                layout = compact_layout(page, char_attrs)
+                cfg["read_region"](entry, LayoutPage(layout, crop_bbox_for_page(settings, page_num, count)), settings)
+            # Release pdfplumber's per-page layout objects before moving on
+            page.close()
+            yield entry
+    finally:
+        opened.close()
+
+def all_tables_from_pages(pages, settings=None):
+    """
+    Flatten the per-page tables into one list (in page order).
+    Every table is kept unless the settings ask to drop the ones identical to a table on an
+    earlier page (repeated headers, footers, address blocks).
+    """
+    if not (settings or {}).get("drop_repeated_tables"):
+        return [table for page in pages for table in page['tables']]
+
+    tables = []
+    seen_on_earlier_pages = set()
+    for page in pages:
+        page_keys = [table_fingerprint(table) for table in page['tables']]
+        tables.extend(t for t, key in zip(page['tables'], page_keys) if key not in seen_on_earlier_pages)
+        seen_on_earlier_pages.update(page_keys)
+    return tables
+
+def page_text(pages, page_num):
+    """Cached text of a single page (1-based page number)"""
+    return pages[page_num - 1]['text']
+
+def full_text(pages):
+    """Cached text of every page joined together, for the no-tables fallback"""
+    return "".join(p['text'] + "\n\n" for p in pages if p['text'])
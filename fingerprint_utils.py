@@ -0,0 +1,67 @@
+"""
+Row and table fingerprints: hashes computed once per row/table so rows can be
+compared with set lookups instead of full list equality, and table versions
+that only cost hashing the rows an action changed.
+"""
+
+import hashlib
+import numpy as np
+
+
+def row_fingerprint(row):
+    """Hash of a row's cell text (None and surrounding whitespace ignored)"""
+    return hash(tuple("" if cell is None else str(cell).strip() for cell in row))
+
+def row_key(row):
+    """Hash of a row's exact cells (whitespace, None and cell types count), to tell table states apart"""
+    try:
+        return hash(tuple((cell.__class__, cell) for cell in row))
+    except TypeError: # unhashable cell
+        return hash(repr(row))
+
+def table_fingerprint(table):
+    """Hash of a whole table, built from its row fingerprints"""
+    return hash(tuple(row_fingerprint(row) for row in table))
+
+def fingerprint_rows(rows, *previous):
+    """
+    Fingerprints and exact keys (row_key) of every row of a table, reusing the ones already
+    worked out for the same row objects in previous results, so only new or changed rows are hashed.
+    Rows are matched by id with a sorted lookup in numpy: unchanged rows cost no Python work.
+    This relies on rows never being changed in place (actions build new row lists).
+    Returns:
+        {'hashes': int64 array, one fingerprint per row, 'keys': int64 array, one row_key per row,
+         'rows': the rows - held, so no id is reused while cached,
+         'ids': sorted row ids, 'index': position in rows of each of ids,
+         'hashed': number of rows that had to be hashed}
+    """
+    n = len(rows)
+    ids = np.fromiter(map(id, rows), dtype=np.uint64, count=n)
+    hashes = np.zeros(n, dtype=np.int64)
+    keys = np.zeros(n, dtype=np.int64)
+    todo = np.arange(n)
+    for cache in previous:
+        if not cache or not len(todo) or not len(cache['ids']):
+            continue
+        pos = np.minimum(np.searchsorted(cache['ids'], ids[todo]), len(cache['ids']) - 1)
+        hit = cache['ids'][pos] == ids[todo]
+        found = cache['index'][pos[hit]]
+        hashes[todo[hit]] = cache['hashes'][found]
+        keys[todo[hit]] = cache['keys'][found]
+        todo = todo[~hit]
+    for i in todo.tolist():
+        hashes[i] = row_fingerprint(rows[i])
+        keys[i] = row_key(rows[i])
+    index = np.argsort(ids, kind="stable")
+    return {'hashes': hashes, 'keys': keys, 'rows': rows, 'ids': ids[index], 'index': index, 'hashed': len(todo)}
+
+def table_digest(keys, *extra):
+    """
+    Version id of a table state: a digest of its exact row keys in order, plus anything
+    else that shapes the table (headers, header row). Same content, same id - within one
+    process, as str hashes are salted per process. Changing only whitespace or None cells
+    gives a new id: the display table and everything built from it depend on them.
+    """
+    h = hashlib.blake2b(np.asarray(keys, dtype=np.int64).tobytes(), digest_size=8)
+    h.update(repr(extra).encode("utf-8"))
+    return h.hexdigest()
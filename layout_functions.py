@@ -0,0 +1,229 @@
+"""
+Page layout cache: pdfplumber's parsed chars, words, lines, rects and edges kept
+as compact numpy arrays, so table detection can be re-run with new settings or
+crop boxes without re-parsing the PDF.
+"""
+
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pdfplumber
+from pdfplumber import utils
+from pdfplumber.table import TableFinder, TableSettings
+
+
+# Files whose layouts each extraction worker keeps (least recently used dropped first)
+WORKER_LAYOUT_ENTRIES = 4
+# Columns of the coordinate arrays (all in pdfplumber's top-down page coordinates)
+BOX_FIELDS = ["x0", "top", "x1", "bottom"]
+# Edge orientation and object type are stored as small integer codes
+ORIENTATIONS = ["h", "v", None]
+EDGE_TYPES = ["line", "rect_edge", "curve_edge"]
+
+# (digest, char attributes) -> layouts, in this process (see worker_layouts)
+_WORKER_LAYOUTS = OrderedDict()
+_WORKER_LAYOUTS_LOCK = threading.Lock()
+
+
+def _boxes(objs):
+    """(n, 4) float array of x0, top, x1, bottom"""
+    return np.array([[o[f] for f in BOX_FIELDS] for o in objs], dtype=float).reshape(-1, len(BOX_FIELDS))
+
+def char_attrs_for(table_settings):
+    """
+    Char attributes, beyond text, box and upright, that pdfplumber's table finder reads with
+    these table settings: the ones text_extra_attrs groups words by (e.g. fontname, size)
+    """
+    text_settings = TableSettings.resolve(table_settings or {}).text_settings or {}
+    return tuple(sorted(text_settings.get("extra_attrs") or ()))
+
+def compact_layout(page, char_attrs=()):
+    """
+    Read one pdfplumber page into arrays; the page's own objects can be released afterwards.
+    char_attrs: extra char attributes to keep (see char_attrs_for)
+    """
+    chars = page.chars
+    words = page.extract_words()
+    edges = page.edges
+    curves = page.curves
+    return {
+        'bbox': tuple(page.bbox),
+        'width': page.width,
+        'height': page.height,
+        'doctop_offset': page.initial_doctop,
+        'chars': _boxes(chars),
+        'char_text': [c['text'] for c in chars],
+        'char_upright': np.array([bool(c['upright']) for c in chars], dtype=bool),
+        'char_attrs': {name: [c.get(name) for c in chars] for name in char_attrs},
+        'words': _boxes(words),
+        'word_text': [w['text'] for w in words],
+        'lines': _boxes(page.lines),
+        'rects': _boxes(page.rects),
+        'curves': _boxes(curves),
+        # Edges per curve (one per pair of points); curve edges come last in 'edges'
+        'curve_edge_counts': np.array([max(len(c['pts']) - 1, 0) for c in curves], dtype=int),
+        'edges': _boxes(edges),
+        'edge_orientation': np.array([ORIENTATIONS.index(e.get('orientation')) for e in edges], dtype=np.int8),
+        'edge_type': np.array([EDGE_TYPES.index(e.get('object_type', "line")) if e.get('object_type') in EDGE_TYPES
+                               else 0 for e in edges], dtype=np.int8),
+    }
+
+def parse_layouts(file_bytes, char_attrs=()):
+    """Parse every page of the PDF once; returns a list of compact layouts (uncached)"""
+    layouts = []
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        for page in pdf.pages:
+            layouts.append(compact_layout(page, char_attrs))
+            # Release pdfplumber's per-page layout objects once we're done with them
+            page.close()
+    return layouts
+
+def file_digest(file_bytes):
+    """Content hash used as the layout cache key"""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def worker_layouts(digest, file_bytes, char_attrs=()):
+    """
+    Layouts of every page, keyed by file hash and the extra char attributes kept
+    (index the list by page number - 1).
+    Cached in the calling process - an extraction worker (see pool_functions) - so jobs
+    send the file rather than its layouts, and a settings change only reruns table detection.
+    Each worker parses a file the first time one of its jobs needs it.
+    """
+    key = (digest, tuple(char_attrs))
+    with _WORKER_LAYOUTS_LOCK:
+        if key in _WORKER_LAYOUTS:
+            _WORKER_LAYOUTS.move_to_end(key)
+            return _WORKER_LAYOUTS[key]
+    layouts = parse_layouts(file_bytes, char_attrs)
+    with _WORKER_LAYOUTS_LOCK:
+        _WORKER_LAYOUTS[key] = layouts
+        while len(_WORKER_LAYOUTS) > WORKER_LAYOUT_ENTRIES:
+            _WORKER_LAYOUTS.popitem(last=False)
+    return layouts
+
+
+def _clip(boxes, bbox):
+    """
+    pdfplumber's crop (utils.crop_to_bbox): mask of the boxes that overlap bbox
+    (touching counts, unless only at a corner) and every box clipped to bbox
+    """
+    x0, top, x1, bottom = bbox
+    clipped = np.column_stack([np.maximum(boxes[:, 0], x0), np.maximum(boxes[:, 1], top),
+                               np.minimum(boxes[:, 2], x1), np.minimum(boxes[:, 3], bottom)])
+    width, height = clipped[:, 2] - clipped[:, 0], clipped[:, 3] - clipped[:, 1]
+    return (width >= 0) & (height >= 0) & (width + height > 0), clipped
+
+
+class LayoutPage:
+    """
+    Read-only stand-in for a (cropped) pdfplumber page, rebuilt from a cached layout.
+    Provides what pdfplumber's TableFinder and text helpers read: bbox, chars, edges,
+    extract_words() and extract_text(), plus extract_tables().
+    Cropping follows page.crop(): objects overlapping the box are kept and clipped to it,
+    and edges are rebuilt from the clipped lines and rects (curves keep their own points).
+    """
+
+    def __init__(self, layout, bbox=None):
+        self.layout = layout
+        if bbox:
+            px0, ptop, px1, pbottom = layout['bbox']
+            x0, top, x1, bottom = (float(v) for v in bbox)
+            bbox = (max(x0, px0), max(top, ptop), min(x1, px1), min(bottom, pbottom))
+        self.bbox = bbox or layout['bbox']
+        self.cropped = bbox is not None
+        self._chars = None
+        self._edges = None
+
+    @property
+    def chars(self):
+        """Char dicts inside the crop box (the keys pdfplumber's text helpers use, plus any kept char_attrs)"""
+        if self._chars is None:
+            lay = self.layout
+            boxes = lay['chars']
+            if self.cropped:
+                keep, boxes = _clip(boxes, self.bbox)
+                keep = np.flatnonzero(keep)
+            else:
+                keep = range(len(lay['char_text']))
+            offset = lay['doctop_offset']
+            attrs = (lay.get('char_attrs') or {}).items()
+            self._chars = []
+            for i in keep:
+                x0, top, x1, bottom = boxes[i].tolist()
+                self._chars.append({
+                    'text': lay['char_text'][i], 'upright': bool(lay['char_upright'][i]),
+                    'x0': x0, 'top': top, 'x1': x1, 'bottom': bottom, 'doctop': top + offset,
+                    'width': x1 - x0, 'height': bottom - top,
+                    **{name: values[i] for name, values in attrs},
+                })
+        return self._chars
+
+    def _edge(self, x0, top, x1, bottom, orientation, object_type, width=None, height=None):
+        page_height = self.layout['height']
+        return {
+            'x0': x0, 'top': top, 'x1': x1, 'bottom': bottom,
+            'width': x1 - x0 if width is None else width, 'height': bottom - top if height is None else height,
+            'y0': page_height - bottom, 'y1': page_height - top, 'doctop': top + self.layout['doctop_offset'],
+            'orientation': orientation, 'object_type': object_type,
+        }
+
+    @property
+    def edges(self):
+        """Edge dicts from lines, rects and curves, in pdfplumber's order"""
+        if self._edges is None:
+            lay = self.layout
+            if not self.cropped:
+                self._edges = [self._edge(*box, ORIENTATIONS[o], EDGE_TYPES[t]) for box, o, t in
+                               zip(lay['edges'].tolist(), lay['edge_orientation'], lay['edge_type'])]
+                return self._edges
+            self._edges = []
+            keep, lines = _clip(lay['lines'], self.bbox)
+            for x0, top, x1, bottom in lines[keep].tolist():
+                self._edges.append(self._edge(x0, top, x1, bottom, "h" if top == bottom else "v", "line"))
+            keep, rects = _clip(lay['rects'], self.bbox)
+            for x0, top, x1, bottom in rects[keep].tolist():
+                # utils.rect_to_edges on the clipped rect: top, bottom, left, right
+                width, height = x1 - x0, bottom - top
+                self._edges += [
+                    self._edge(x0, top, x1, top, "h", "rect_edge", width, 0),
+                    self._edge(x0, top + height, x1, bottom, "h", "rect_edge", width, 0),
+                    self._edge(x0, top, x0, bottom, "v", "rect_edge", 0, height),
+                    self._edge(x1, top, x1, bottom, "v", "rect_edge", 0, height),
+                ]
+            # A cropped curve keeps its points, so its edges are not clipped
+            keep, _ = _clip(lay['curves'], self.bbox)
+            first = len(lay['edges']) - int(lay['curve_edge_counts'].sum())
+            owner = np.repeat(np.arange(len(lay['curve_edge_counts'])), lay['curve_edge_counts'])
+            for i in first + np.flatnonzero(keep[owner]):
+                self._edges.append(self._edge(*lay['edges'][i].tolist(), ORIENTATIONS[lay['edge_orientation'][i]],
+                                              "curve_edge"))
+        return self._edges
+
+    def word_tuples(self):
+        """Default words inside the crop box as (x0, top, x1, bottom, text); cached for whole pages"""
+        if self.cropped:
+            return [(w['x0'], w['top'], w['x1'], w['bottom'], w['text']) for w in self.extract_words()]
+        lay = self.layout
+        return [tuple(box) + (text,) for box, text in zip(lay['words'].tolist(), lay['word_text'])]
+
+    def extract_words(self, **kwargs):
+        """Word dicts; default settings on a whole page are served from the cache"""
+        if not kwargs and not self.cropped:
+            return [dict(zip(BOX_FIELDS + ["text"], w)) for w in self.word_tuples()]
+        return utils.extract_words(self.chars, **kwargs)
+
+    def extract_text(self, **kwargs):
+        return utils.extract_text(self.chars, **kwargs)
+
+    def extract_tables(self, table_settings=None):
+        """Same as pdfplumber's page.extract_tables() (or page.crop(bbox).extract_tables()), on the cached layout"""
+        missing = set(char_attrs_for(table_settings)) - set(self.layout.get('char_attrs') or ())
+        if missing:
+            raise ValueError(f"Layout was read without the char attributes {sorted(missing)}; "
+                             "parse it with char_attrs_for(table_settings)")
+        tset = TableSettings.resolve(table_settings)
+        finder = TableFinder(self, tset)
+        return [table.extract(**(tset.text_settings or {})) for table in finder.tables]
@@ -0,0 +1,185 @@
+"""
+Line-item ledger: final tables of processed invoices kept in a local SQLite database
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, UTC
+import pandas as pd
+from column_type_utils import to_text_frame
+from search_functions import guess_search_columns
+from table_functions import to_float_series
+from validation_functions import COLUMN_ROLES
+
+# Database file, shared by everyone using the same app instance
+LEDGER_PATH = os.environ.get("FILEREADER_LEDGER_PATH", "ledger.db")
+
+# Ledger fields filled from table columns; header names used to guess the mapping
+LEDGER_TEXT_FIELDS = ["item_number", "title"]
+LEDGER_NUMBER_FIELDS = {
+    "ordered": COLUMN_ROLES["order"],
+    "shipped": COLUMN_ROLES["ship"],
+    "backordered": COLUMN_ROLES["bo"],
+    "list_price": ["list", "list price", "retail", "retail price"],
+    "net_price": COLUMN_ROLES["net"],
+    "extension": COLUMN_ROLES["extension"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_id TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    invoice_date TEXT NOT NULL,          -- ISO yyyy-mm-dd
+    source_file TEXT,
+    added_at TEXT NOT NULL,
+    UNIQUE (vendor, invoice_id)
+);
+CREATE TABLE IF NOT EXISTS line_items (
+    id INTEGER PRIMARY KEY,
+    invoice_pk INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    line_no INTEGER NOT NULL,
+    vendor TEXT NOT NULL,                -- copied from the invoice so item queries need no join
+    invoice_date TEXT NOT NULL,
+    item_number TEXT,
+    title TEXT,
+    ordered REAL, shipped REAL, backordered REAL,
+    list_price REAL, net_price REAL, extension REAL,
+    -- Backorders: the invoice whose later shipment filled it (NULL while still open)
+    filled_by INTEGER REFERENCES invoices(id) ON DELETE SET NULL
+);
+CREATE INDEX IF NOT EXISTS idx_line_items_item_date ON line_items (item_number, invoice_date);
+CREATE INDEX IF NOT EXISTS idx_line_items_date ON line_items (invoice_date);
+CREATE INDEX IF NOT EXISTS idx_line_items_invoice ON line_items (invoice_pk);
+-- Small partial indexes: open backorders, and shipments that could fill them
+CREATE INDEX IF NOT EXISTS idx_line_items_open_bo ON line_items (vendor, invoice_date)
+    WHERE backordered > 0 AND filled_by IS NULL;
+CREATE INDEX IF NOT EXISTS idx_line_items_shipped ON line_items (item_number, vendor, invoice_date)
+    WHERE shipped > 0;
+"""
+
+_SCHEMA_READY = set()
+_SCHEMA_LOCK = threading.Lock()
+
+
+@contextmanager
+def ledger_connection(path=None):
+    """
+    Short-lived connection (commits on success, rolls back on error).
+    SQLite connections are cheap to open and can't be shared across Streamlit's threads.
+    """
+    path = path or LEDGER_PATH
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        with _SCHEMA_LOCK:
+            if path not in _SCHEMA_READY:
+                # WAL lets readers query while another session is appending
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.executescript(SCHEMA)
+                _SCHEMA_READY.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def guess_ledger_map(columns):
+    """Map each ledger field to a table column by header name (None when not found)"""
+    item_col, title_col = guess_search_columns(columns)
+    lookup = {str(c).strip().lower(): c for c in columns}
+    column_map = {'item_number': item_col, 'title': title_col}
+    for field, names in LEDGER_NUMBER_FIELDS.items():
+        column_map[field] = next((lookup[n] for n in names if n in lookup), None)
+    return column_map
+
+def ledger_rows(df, column_map):
+    """Line-item field values for every row of the table, column by column"""
+    text = to_text_frame(df)
+    fields = {}
+    for field in LEDGER_TEXT_FIELDS:
+        col = column_map.get(field)
+        fields[field] = (text[col].fillna("").astype(str).str.strip().tolist() if col is not None
+                         else [None] * len(text))
+    for field in LEDGER_NUMBER_FIELDS:
+        col = column_map.get(field)
+        fields[field] = to_float_series(text[col]).tolist() if col is not None else [None] * len(text)
+    return fields
+
+def save_invoice(invoice_id, vendor, invoice_date, df, column_map, source_file=None, path=None):
+    """
+    Append an invoice's final line items to the ledger.
+    Saving the same vendor + invoice id again replaces the earlier copy.
+    Rows without an item number are skipped. Returns the number of line items stored.
+    """
+    invoice_date = pd.Timestamp(invoice_date).date().isoformat()
+    fields = ledger_rows(df, column_map)
+    names = LEDGER_TEXT_FIELDS + list(LEDGER_NUMBER_FIELDS)
+    with ledger_connection(path) as conn:
+        conn.execute("DELETE FROM invoices WHERE vendor = ? AND invoice_id = ?", (vendor, invoice_id))
+        invoice_pk = conn.execute(
+            "INSERT INTO invoices (invoice_id, vendor, invoice_date, source_file, added_at) VALUES (?, ?, ?, ?, ?)",
+            (invoice_id, vendor, invoice_date, source_file, datetime.now(UTC).isoformat())).lastrowid
+        rows = [(invoice_pk, line_no, vendor, invoice_date, *values)
+                for line_no, values in enumerate(zip(*(fields[n] for n in names)), 1)
+                if column_map.get('item_number') is None or values[0]]
+        conn.executemany(
+            f"INSERT INTO line_items (invoice_pk, line_no, vendor, invoice_date, {', '.join(names)}) "
+            f"VALUES ({', '.join('?' * (4 + len(names)))})", rows)
+        _mark_filled_backorders(conn, vendor)
+        # Keeps the planner's statistics current so the partial indexes get picked
+        conn.execute("PRAGMA optimize")
+    return len(rows)
+
+def _mark_filled_backorders(conn, vendor):
+    """
+    Point each open backorder of the vendor at a later invoice that shipped the item.
+    Run after every save, so invoices can arrive in any order (and replaced invoices
+    reopen what they filled, through ON DELETE SET NULL). Only open lines are visited.
+    """
+    conn.execute(
+        """UPDATE line_items SET filled_by = (
+               SELECT later.invoice_pk FROM line_items later
+               WHERE later.item_number = line_items.item_number
+                 AND later.vendor = line_items.vendor
+                 AND later.invoice_date > line_items.invoice_date
+                 AND later.shipped > 0
+               LIMIT 1)
+           WHERE vendor = ? AND backordered > 0 AND filled_by IS NULL""",
+        (vendor,))
+
+def price_history(item_number, path=None):
+    """Every time an item was invoiced, oldest first (uses the item/date index)"""
+    with ledger_connection(path) as conn:
+        return pd.read_sql_query(
+            """SELECT li.invoice_date AS date, li.vendor, inv.invoice_id, li.title,
+                      li.list_price, li.net_price, li.ordered, li.shipped, li.backordered
+               FROM line_items li JOIN invoices inv ON inv.id = li.invoice_pk
+               WHERE li.item_number = ?
+               ORDER BY li.invoice_date, inv.invoice_id""",
+            conn, params=(str(item_number).strip(),))
+
+def open_backorders(vendor=None, path=None):
+    """
+    Backordered lines not yet filled: no later invoice from the same vendor
+    shipped that item (kept current by save_invoice). Newest first.
+    """
+    # Conditions spelled out (no "? IS NULL OR ...") so SQLite can use the partial index
+    vendor_filter = "AND bo.vendor = ?" if vendor else ""
+    with ledger_connection(path) as conn:
+        return pd.read_sql_query(
+            f"""SELECT bo.invoice_date AS date, bo.vendor, inv.invoice_id, bo.item_number, bo.title,
+                       bo.backordered
+                FROM line_items bo JOIN invoices inv ON inv.id = bo.invoice_pk
+                WHERE bo.backordered > 0 AND bo.filled_by IS NULL {vendor_filter}
+                ORDER BY bo.invoice_date DESC, bo.item_number""",
+            conn, params=(vendor,) if vendor else ())
+
+def ledger_summary(path=None):
+    """Counts shown in the app"""
+    with ledger_connection(path) as conn:
+        invoices, vendors, last_date = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT vendor), MAX(invoice_date) FROM invoices").fetchone()
+        lines = conn.execute("SELECT COUNT(*) FROM line_items").fetchone()[0]
+    return {'invoices': invoices, 'vendors': vendors, 'line_items': lines, 'last_date': last_date}
@@ -0,0 +1,251 @@
+"""
+Memory accounting and eviction for sessions sharing one app instance
+"""
+
+import os
+import sys
+import threading
+import time
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from table_functions import FINGERPRINT_KEYS, init_main_table, replay_from_actions
+
+
+# Budget for session tables across the whole process, set with an environment variable
+MEMORY_BUDGET_MB = float(os.environ.get("FILEREADER_MEMORY_BUDGET_MB", "1024"))
+# Sessions untouched for this long may have their tables evicted
+IDLE_SECONDS = float(os.environ.get("FILEREADER_IDLE_SECONDS", "600"))
+# Rows sampled when estimating the size of a table
+SAMPLE_ROWS = 200
+
+# Session tables that can be rebuilt from the extraction cache plus a replay
+# (in the order their rows are counted: the original owns the rows the others share)
+TABLE_KEYS = ["original_table_data", "table_as_list", "working_data", "main_table"]
+# Indexes built from the tables; dropped along with them and rebuilt when next needed
+DERIVED_KEYS = ["search_index", "invoice_diff"] + FINGERPRINT_KEYS
+# Keys of each applied action holding a full snapshot (never needed by undo, which replays)
+SNAPSHOT_KEYS = ["working_data", "main_table"]
+
+# session_id -> {'last_seen': float, 'usage': {key: bytes}, 'key': _usage_key when usage was measured,
+#                'evict': {'snapshots': bytes to free, 'tables': bool} asked of the session, or None}
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _session_alive(session_id):
+    """
+    Whether the runtime still holds a session (it keeps disconnected sessions until they expire).
+    None when that can't be asked: no runtime, or its private session manager API has changed.
+    """
+    try:
+        return Runtime.instance()._session_mgr.get_session_info(session_id) is not None
+    except (RuntimeError, AttributeError, TypeError):
+        return None
+
+
+def rows_bytes(rows, shared=()):
+    """
+    Estimate the size of a list of rows from a sample of up to SAMPLE_ROWS rows.
+    Rows whose id is in shared (already counted under another table) add only the list's own size.
+    """
+    if not rows:
+        return sys.getsizeof(rows) if rows is not None else 0
+    step = max(1, len(rows) // SAMPLE_ROWS)
+    sample = rows[::step]
+    sample_bytes = sum(sys.getsizeof(r) + sum(sys.getsizeof(c) for c in r)
+                       for r in sample if id(r) not in shared)
+    return sys.getsizeof(rows) + sample_bytes * len(rows) // len(sample)
+
+def frame_bytes(df):
+    """Estimate the size of a DataFrame from a sample of up to SAMPLE_ROWS rows"""
+    if df is None or len(df) == 0:
+        return 0
+    sample = df.head(SAMPLE_ROWS)
+    return int(sample.memory_usage(deep=True).sum() * len(df) / len(sample))
+
+def _value_bytes(value, shared=()):
+    """Size estimate for a table stored in session state"""
+    if value is None:
+        return 0
+    if hasattr(value, "memory_usage"):
+        return frame_bytes(value)
+    return rows_bytes(value, shared)
+
+def _live_tables(state):
+    return [state[key] for key in TABLE_KEYS if key in state and state[key] is not None]
+
+def _history(state):
+    history = list(state['applied_actions']) if 'applied_actions' in state else []
+    return history + (list(state['redo_stack']) if 'redo_stack' in state else [])
+
+def session_usage(state):
+    """
+    Bytes used by one session's tables and history snapshots, by key.
+    Tables and rows are shared between keys (working_data starts as a copy of the original's row
+    list, snapshots hold the tables of earlier steps): each table and each live row is counted once,
+    and a snapshot adds only its list and the rows no live table holds any more.
+    """
+    seen = set()
+    shared = set()
+    def once(value):
+        if value is None or id(value) in seen:
+            return 0
+        seen.add(id(value))
+        return _value_bytes(value, shared)
+
+    usage = {}
+    for key in TABLE_KEYS:
+        value = state[key] if key in state else None
+        usage[key] = once(value)
+        if isinstance(value, list):
+            shared.update(map(id, value))
+    usage['snapshots'] = sum(once(a.get(k)) for a in _history(state) for k in SNAPSHOT_KEYS)
+    return usage
+
+def _usage_key(state):
+    """Changes whenever session_usage would: the table version, the tables held and the history"""
+    history = _history(state)
+    return (state['table_version'] if 'table_version' in state else None,
+            tuple(id(t) for t in _live_tables(state)),
+            tuple(id(a.get(k)) for a in history for k in SNAPSHOT_KEYS))
+
+def process_rss_bytes():
+    """Resident memory of the whole process (Linux), or None where it can't be read"""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _evict_snapshots(state, needed):
+    """
+    Drop the oldest history snapshots of one session; returns bytes freed. A snapshot only frees
+    its list and the rows no live table holds (and nothing when it is a live table).
+    """
+    freed = 0
+    live = _live_tables(state)
+    live_ids = {id(t) for t in live}
+    shared = {id(r) for t in live if isinstance(t, list) for r in t}
+    for action in sorted(_history(state), key=lambda a: a.get('saved_at', 0)):
+        if freed >= needed:
+            break
+        for key in SNAPSHOT_KEYS:
+            if action.get(key) is not None:
+                if id(action[key]) not in live_ids:
+                    freed += _value_bytes(action[key], shared)
+                action[key] = None
+    return freed
+
+def _evict_tables(state):
+    """Drop a session's tables; they are rebuilt on its next full run. Returns bytes freed"""
+    freed = 0
+    for key in TABLE_KEYS:
+        if key in state:
+            freed += _value_bytes(state[key])
+            del state[key]
+    for key in DERIVED_KEYS:
+        if key in state:
+            del state[key]
+    state['tables_evicted'] = True
+    return freed
+
+def _pending_bytes(s):
+    """Bytes a session has been asked to free and hasn't yet"""
+    evict = s['evict'] or {}
+    tables = sum(b for key, b in s['usage'].items() if key in TABLE_KEYS) if evict.get('tables') else 0
+    return tables + min(evict.get('snapshots', 0), s['usage'].get('snapshots', 0))
+
+def govern_memory():
+    """
+    Record the current session's usage and, when the process is over budget, ask sessions to
+    free memory: first the oldest history snapshots (any session), then idle sessions' tables.
+    A session only ever changes its own state: what it was asked to free is dropped here,
+    on its own next run, so nothing is evicted while another thread uses it.
+    Call once per script run and at the start of fragments that use the tables.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    now = time.time()
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    state = ctx.session_state
+
+    with _SESSIONS_LOCK:
+        previous = _SESSIONS.get(ctx.session_id)
+        evict = previous['evict'] if previous else None
+    if evict:
+        if evict.get('snapshots'):
+            _evict_snapshots(state, evict['snapshots'])
+        if evict.get('tables'):
+            _evict_tables(state) # rebuilt by the next full run (see restore_evicted_tables)
+
+    with _SESSIONS_LOCK:
+        # Usage is measured again only when the tables or history changed since the last run
+        key = _usage_key(state)
+        previous = None if evict else _SESSIONS.get(ctx.session_id)
+        usage = previous['usage'] if previous and previous['key'] == key else session_usage(state)
+        _SESSIONS[ctx.session_id] = {'last_seen': now, 'usage': usage, 'key': key, 'evict': None}
+        others = {sid: _session_alive(sid) for sid in _SESSIONS if sid != ctx.session_id}
+        # Forget sessions the runtime has closed
+        for sid in [sid for sid, alive in others.items() if alive is False]:
+            del _SESSIONS[sid]
+        # Without the runtime's session list, closed sessions can't be told apart: evict nothing
+        if None in others.values():
+            return
+
+        over = sum(sum(s['usage'].values()) - _pending_bytes(s) for s in _SESSIONS.values()) - budget
+        if over <= 0:
+            return
+
+        # Oldest sessions give up their snapshots first
+        by_age = sorted(_SESSIONS.items(), key=lambda item: item[1]['last_seen'])
+        for sid, s in by_age:
+            if over <= 0:
+                break
+            asked = (s['evict'] or {}).get('snapshots', 0)
+            more = min(s['usage'].get('snapshots', 0) - asked, over)
+            if more > 0:
+                s['evict'] = {**(s['evict'] or {}), 'snapshots': asked + more}
+                over -= more
+
+        # Then idle sessions give up their tables
+        for sid, s in by_age:
+            if over <= 0:
+                break
+            if sid == ctx.session_id or now - s['last_seen'] < IDLE_SECONDS:
+                continue
+            pending = _pending_bytes(s)
+            s['evict'] = {**(s['evict'] or {}), 'tables': True}
+            over -= _pending_bytes(s) - pending
+
+def restore_evicted_tables(all_tables):
+    """Rebuild this session's evicted tables from the extraction cache and replay its history"""
+    actions = st.session_state.get('applied_actions', [])
+    redo_stack = st.session_state.get('redo_stack', [])
+    init_main_table(all_tables)
+    st.session_state.applied_actions = actions
+    st.session_state.redo_stack = redo_stack
+    replay_from_actions(
+        actions=[{'type': a['type'], 'params': a.get('params', {}) or {}} for a in actions],
+        reset_first=True,
+        log_steps=False
+    )
+    st.session_state.pop('tables_evicted', None)
+
+def memory_report():
+    """Per-session usage for the admin panel: list of dicts, plus totals"""
+    now = time.time()
+    with _SESSIONS_LOCK:
+        sessions = [{
+            'session': sid[:8],
+            'idle (s)': int(now - s['last_seen']),
+            **{key: round(b / 1024 / 1024, 2) for key, b in s['usage'].items()},
+            'total (MB)': round(sum(s['usage'].values()) / 1024 / 1024, 2),
+        } for sid, s in _SESSIONS.items()]
+    return {
+        'sessions': sessions,
+        'tracked_mb': round(sum(s['total (MB)'] for s in sessions), 2),
+        'budget_mb': MEMORY_BUDGET_MB,
+        'rss_mb': round(process_rss_bytes() / 1024 / 1024, 2) if process_rss_bytes() else None,
+    }
@@ -0,0 +1,206 @@
+"""
+Process-wide extraction worker pool shared by every session: PDF parsing runs in worker
+processes, so script threads only wait (without holding the GIL) and the UI stays responsive.
+Jobs queue per session and are started round robin, so one user's uploads can't starve another's.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+
+# Worker processes (0 = up to 4, one per core), set with environment variables like the memory budget
+EXTRACTION_WORKERS = int(os.environ.get("FILEREADER_EXTRACTION_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+# Jobs waiting for a worker across all sessions; further jobs are turned away until the queue drains
+MAX_QUEUED_JOBS = int(os.environ.get("FILEREADER_MAX_QUEUED_JOBS", "16"))
+# Jobs one session may have waiting or running at once
+MAX_JOBS_PER_SESSION = int(os.environ.get("FILEREADER_MAX_JOBS_PER_SESSION", "2"))
+# Seconds a job may run on a worker (waiting in the queue doesn't count) before the pool's workers are restarted
+JOB_TIMEOUT = float(os.environ.get("FILEREADER_JOB_TIMEOUT", "300"))
+# Recent jobs kept for the latency figures
+LATENCY_SAMPLES = 200
+
+
+class PoolError(RuntimeError):
+    """A job the pool couldn't run; the message is meant for the user"""
+
+
+class PoolBusyError(PoolError):
+    """Job turned away because the queue (or the session's share of it) is full"""
+
+
+class JobFailedError(PoolError):
+    """Job ran over JOB_TIMEOUT, or its worker died (e.g. out of memory)"""
+
+
+_LOCK = threading.Lock()
+_WAKE = threading.Condition(_LOCK)
+_EXECUTOR = None
+_DISPATCHER = None
+# session_id -> deque of waiting jobs; the first session is served next (round robin)
+_QUEUES = OrderedDict()
+# session_id -> jobs running
+_RUNNING = {}
+_COUNTS = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+# (seconds waiting in the queue, seconds running) of recent jobs
+_LATENCIES = deque(maxlen=LATENCY_SAMPLES)
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+def _executor():
+    """
+    The worker processes, started on first use. Workers are forked: a spawned worker
+    would re-import the Streamlit script as its main module. Where fork isn't
+    available (Windows) jobs run on threads, keeping the queueing but not the GIL relief.
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        if "fork" in multiprocessing.get_all_start_methods():
+            _EXECUTOR = ProcessPoolExecutor(EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        else:
+            _EXECUTOR = ThreadPoolExecutor(EXTRACTION_WORKERS, thread_name_prefix="extraction")
+    return _EXECUTOR
+
+def _retire(executor):
+    """
+    Replace an executor that broke or has a stuck job: its workers are killed (a stuck worker
+    would never return), and it shuts down without waiting. Jobs still running on it fail.
+    """
+    global _EXECUTOR
+    with _LOCK:
+        if _EXECUTOR is executor:
+            _EXECUTOR = None
+    # ProcessPoolExecutor has no public way to stop a running job; threads can only be abandoned
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def _queued():
+    return sum(len(q) for q in _QUEUES.values())
+
+def _finished(job, inner):
+    """Done callback of a running job: hand over the result and free the worker slot"""
+    error = inner.exception()
+    with _WAKE:
+        sid = job['session']
+        _RUNNING[sid] -= 1
+        if not _RUNNING[sid]:
+            del _RUNNING[sid]
+        _COUNTS['failed' if error else 'completed'] += 1
+        _LATENCIES.append((job['started'] - job['queued_at'], time.perf_counter() - job['started']))
+        _WAKE.notify()
+    if isinstance(error, BrokenProcessPool):
+        # A worker died (e.g. out of memory); shut the pool down and start afresh for the next job
+        _retire(job['executor'])
+    if error:
+        job['future'].set_exception(error)
+    else:
+        job['future'].set_result(inner.result())
+
+def _dispatch_forever():
+    """Dispatcher thread: start the next session's job whenever a worker is free"""
+    while True:
+        with _WAKE:
+            while not _QUEUES or sum(_RUNNING.values()) >= EXTRACTION_WORKERS:
+                _WAKE.wait()
+            sid, queue = next(iter(_QUEUES.items()))
+            job = queue.popleft()
+            if queue:
+                _QUEUES.move_to_end(sid)
+            else:
+                del _QUEUES[sid]
+            _RUNNING[sid] = _RUNNING.get(sid, 0) + 1
+            job['started'] = time.perf_counter()
+            executor = job['executor'] = _executor()
+        try:
+            inner = executor.submit(job['func'], *job['args'])
+        except Exception as e: # executor broken or shut down
+            inner = Future()
+            inner.set_exception(e)
+        inner.add_done_callback(lambda f, job=job: _finished(job, f))
+
+def _submit(func, args):
+    """Queue a job; returns the job dict (see submit_job)"""
+    global _DISPATCHER
+    sid = _session_id()
+    with _WAKE:
+        mine = len(_QUEUES.get(sid, ())) + _RUNNING.get(sid, 0)
+        if mine >= MAX_JOBS_PER_SESSION:
+            _COUNTS['rejected'] += 1
+            raise PoolBusyError(f"You already have {mine} file(s) being processed; "
+                                "please wait for them to finish")
+        if _queued() >= MAX_QUEUED_JOBS:
+            _COUNTS['rejected'] += 1
+            raise PoolBusyError(f"The server is busy ({_queued()} files waiting to be processed); "
+                                "please try again in a minute")
+        if _DISPATCHER is None:
+            _DISPATCHER = threading.Thread(target=_dispatch_forever, name="extraction-dispatcher", daemon=True)
+            _DISPATCHER.start()
+        job = {'func': func, 'args': args, 'session': sid, 'future': Future(),
+               'queued_at': time.perf_counter(), 'started': None, 'executor': None}
+        _QUEUES.setdefault(sid, deque()).append(job)
+        _COUNTS['submitted'] += 1
+        _WAKE.notify()
+    return job
+
+def submit_job(func, *args):
+    """
+    Queue func(*args) for a worker; returns a Future.
+    func and args must pickle (a module-level function and plain data).
+    Raises PoolBusyError when the queue or this session's share of it is full.
+    """
+    return _submit(func, args)['future']
+
+def run_job(func, *args):
+    """
+    submit_job and wait for the result (exceptions from func are raised here).
+    Raises JobFailedError when the job runs longer than JOB_TIMEOUT (its workers are then
+    restarted, see _retire) or its worker dies.
+    """
+    job = _submit(func, args)
+    while True:
+        started = job['started']
+        wait = JOB_TIMEOUT if started is None else started + JOB_TIMEOUT - time.perf_counter()
+        try:
+            return job['future'].result(timeout=max(wait, 0))
+        except TimeoutError:
+            if job['started'] is None or time.perf_counter() - job['started'] < JOB_TIMEOUT:
+                continue # still queued, or started while we waited
+            _retire(job['executor'])
+            raise JobFailedError(f"Processing the file took longer than {JOB_TIMEOUT:g}s and was stopped; "
+                                 "please try again, or try another extraction backend") from None
+        except BrokenProcessPool:
+            raise JobFailedError("The worker processing the file stopped unexpectedly "
+                                 "(the file may be too large); please try again") from None
+
+def pool_load():
+    """{'workers', 'running', 'queued'}: enough to tell a user whether they'll have to wait"""
+    with _LOCK:
+        return {'workers': EXTRACTION_WORKERS, 'running': sum(_RUNNING.values()), 'queued': _queued()}
+
+def pool_metrics():
+    """
+    Queue depth, job counts and latencies for the admin panel:
+        'workers', 'running', 'queued', 'max_queued', 'sessions': [{'session', 'queued', 'running'}],
+        'submitted', 'completed', 'failed', 'rejected',
+        'wait_p50_s', 'wait_p95_s', 'run_p50_s', 'run_p95_s' (None before any job finished)
+    """
+    with _LOCK:
+        sessions = [{'session': sid[:8], 'queued': len(_QUEUES.get(sid, ())), 'running': _RUNNING.get(sid, 0)}
+                    for sid in sorted(set(_QUEUES) | set(_RUNNING))]
+        report = {'workers': EXTRACTION_WORKERS, 'running': sum(_RUNNING.values()), 'queued': _queued(),
+                  'max_queued': MAX_QUEUED_JOBS, 'sessions': sessions, **_COUNTS}
+        latencies = np.array(_LATENCIES, dtype=float).reshape(-1, 2)
+    for i, name in enumerate(["wait", "run"]):
+        for p in (50, 95):
+            report[f"{name}_p{p}_s"] = round(float(np.percentile(latencies[:, i], p)), 2) if len(latencies) else None
+    return report
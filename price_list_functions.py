@@ -0,0 +1,98 @@
+"""
+Price lists (our own catalogs) loaded once into keyed indexes shared by every session
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+import streamlit as st
+from search_functions import guess_search_columns
+
+# Folder of saved price lists; templates refer to them by file name
+# shared by anyone using same app instance
+PRICE_LISTS_DIR = "price_lists"
+PRICE_LIST_TYPES = ["csv", "parquet"]
+# Header names tried (in order) for the price column of a price list
+PRICE_COLUMN_NAMES = ["net", "net price", "price", "cost", "our price", "list", "list price"]
+
+
+def ensure_price_lists_dir():
+    os.makedirs(PRICE_LISTS_DIR, exist_ok=True)
+
+def save_price_list(file_name, data):
+    """Store an uploaded price list under PRICE_LISTS_DIR; returns the saved file name"""
+    ensure_price_lists_dir()
+    base, ext = os.path.splitext(os.path.basename(file_name))
+    name = (re.sub(r"[^A-Za-z0-9._-]+", "_", base).strip("_") or "price_list") + ext.lower()
+    with open(os.path.join(PRICE_LISTS_DIR, name), "wb") as f:
+        f.write(data)
+    return name
+
+def list_price_lists():
+    ensure_price_lists_dir()
+    return sorted(f for f in os.listdir(PRICE_LISTS_DIR)
+                  if os.path.splitext(f)[1].lower().lstrip(".") in PRICE_LIST_TYPES)
+
+def _price_list_path(name):
+    return os.path.join(PRICE_LISTS_DIR, os.path.basename(name))
+
+def _is_parquet(path):
+    return path.lower().endswith(".parquet")
+
+@st.cache_data
+def price_list_columns(name, signature=None):
+    """Column names of a saved price list (header only; signature busts the cache when the file changes)"""
+    path = _price_list_path(name)
+    if _is_parquet(path):
+        import pyarrow.parquet as pq # optional: only needed for Parquet price lists
+        return list(pq.read_schema(path).names)
+    return list(pd.read_csv(path, nrows=0, dtype=str).columns)
+
+def guess_price_list_columns(columns):
+    """(item column, price column) of a price list picked from its headers; either may be None"""
+    lookup = {str(c).strip().lower(): c for c in columns}
+    price_col = next((lookup[n] for n in PRICE_COLUMN_NAMES if n in lookup), None)
+    return guess_search_columns(columns)[0], price_col
+
+def price_list_signature(name):
+    """(size, modified time) of a saved price list; a changed file gets a new index"""
+    stat = os.stat(_price_list_path(name))
+    return stat.st_size, stat.st_mtime_ns
+
+@st.cache_resource(max_entries=4, show_spinner="Indexing price list...")
+def _build_price_index(name, key_column, price_column, signature):
+    """
+    Read two columns of a price list and build the lookup:
+        {'keys': pd.Index of item keys (unique), 'prices': float array aligned with keys, 'rows': int}
+    Keys are stripped text; a key listed twice keeps its last price. Empty keys are dropped.
+    """
+    path = _price_list_path(name)
+    columns = [key_column, price_column]
+    if _is_parquet(path):
+        catalog = pd.read_parquet(path, columns=columns)
+    else:
+        catalog = pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+    keys = catalog[key_column].astype(str).str.strip()
+    prices = pd.to_numeric(catalog[price_column].astype(str).str.replace(r"[$£€,\s]", "", regex=True),
+                           errors="coerce")
+    keep = (keys != "") & ~keys.duplicated(keep="last")
+    index = pd.Index(keys[keep].to_numpy())
+    # Build the hash table now, once, rather than on the first lookup
+    index.get_indexer(index[:1])
+    return {'keys': index, 'prices': prices[keep].to_numpy(dtype=float), 'rows': len(catalog)}
+
+def load_price_index(name, key_column, price_column):
+    """
+    Keyed index of a saved price list, read and hashed once per file version
+    and shared by every session (st.cache_resource): treat it as read-only.
+    """
+    return _build_price_index(name, key_column, price_column, price_list_signature(name))
+
+def lookup_prices(index, keys):
+    """Expected price for each key (NaN where the key isn't in the price list), as one hash probe"""
+    positions = index['keys'].get_indexer(pd.Series(keys, dtype=object).fillna("").astype(str).str.strip())
+    found = positions >= 0
+    expected = np.full(len(positions), np.nan)
+    expected[found] = index['prices'][positions[found]]
+    return expected
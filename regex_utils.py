@@ -0,0 +1,316 @@
+"""
+Guarded regex for user-entered patterns: patterns prone to catastrophic backtracking are
+rejected up front, and matching runs in a long-lived worker process that is killed (and
+replaced) when it runs over its time budget, so one bad pattern can't pin a core shared by every session.
+"""
+
+import multiprocessing
+import re
+import string
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+try:
+    from re import _parser as sre_parse, _constants as sre_constants # Python 3.11+
+except ImportError:
+    import sre_parse, sre_constants
+
+# Seconds one action's matching may take in all (see regex_deadline) before its worker is killed
+REGEX_TIME_BUDGET = 5.0
+# Longest pattern accepted (longer ones are almost always pasted by mistake)
+MAX_PATTERN_LENGTH = 1_000
+# Seconds a worker may take to pick up a job; a worker that doesn't is replaced
+WORKER_START_TIMEOUT = 10.0
+# Idle workers kept for the next job; more are started while several sessions match at once
+MAX_IDLE_WORKERS = 2
+# Joins cells sent to a worker (text almost never contains it; if it does, cells go as a list)
+CELL_SEPARATOR = "\0"
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+# First characters of the character categories (ASCII only; negated categories match anything)
+_CATEGORY_CHARS = {
+    'DIGIT': set(map(ord, string.digits)),
+    'SPACE': set(map(ord, string.whitespace)),
+    'WORD': set(map(ord, string.ascii_letters + string.digits + "_")),
+    'LINEBREAK': {ord("\n")},
+}
+
+
+class UnsafePatternError(ValueError):
+    """Pattern rejected before running: invalid, too long, or prone to catastrophic backtracking"""
+
+class RegexTimeoutError(ValueError):
+    """Matching ran over its time budget and was stopped"""
+
+
+def _is_variable(op, av):
+    """A repeat that can match a varying number of times (so the engine can backtrack into it)"""
+    return op in _REPEATS and av[0] != av[1]
+
+def _children(op, av):
+    """Sub-patterns of one parsed regex node"""
+    if op in _REPEATS:
+        return [av[2]]
+    if op == sre_constants.SUBPATTERN:
+        return [av[-1]]
+    if op == sre_constants.BRANCH:
+        return av[1]
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op == sre_constants.GROUPREF_EXISTS:
+        return [p for p in av[1:] if p is not None]
+    # Atomic groups and possessive repeats never backtrack into themselves
+    return []
+
+def _nested_quantifier(items, inside=False):
+    """True if a variable repeat sits inside another repeat, e.g. (a+)+ or (\\s*\\w+)*"""
+    for op, av in items:
+        if _is_variable(op, av) and inside:
+            return True
+        repeated = inside or (op in _REPEATS and (av[1] == sre_constants.MAXREPEAT or av[1] > 1))
+        if any(_nested_quantifier(child, repeated) for child in _children(op, av)):
+            return True
+    return False
+
+def _union(a, b):
+    """Union of two first-character sets, where None means any character"""
+    return None if a is None or b is None else a | b
+
+def _class_chars(items):
+    """Characters a [...] class can match, or None for a negated or very wide class"""
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.add(av)
+        elif op == sre_constants.RANGE and av[1] - av[0] <= 0xFFFF:
+            chars.update(range(av[0], av[1] + 1))
+        elif op == sre_constants.CATEGORY and "NOT" not in str(av):
+            chars |= _CATEGORY_CHARS.get(str(av).rsplit("_", 1)[-1], set())
+        else:
+            return None
+    return chars
+
+def _first(items):
+    """(characters a sequence can start with or None for any, whether it can match empty)"""
+    first = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            node, empty = {av}, False
+        elif op == sre_constants.IN:
+            node, empty = _class_chars(av), False
+        elif op == sre_constants.SUBPATTERN:
+            node, empty = _first(av[-1])
+        elif op == getattr(sre_constants, "ATOMIC_GROUP", None):
+            node, empty = _first(av)
+        elif op == sre_constants.BRANCH:
+            node, empty = set(), False
+            for alt in av[1]:
+                alt_first, alt_empty = _first(alt)
+                node, empty = _union(node, alt_first), empty or alt_empty
+        elif op in _REPEATS or op == getattr(sre_constants, "POSSESSIVE_REPEAT", None):
+            node, empty = _first(av[2])
+            empty = empty or av[0] == 0
+        elif op in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            node, empty = set(), True
+        else:
+            node, empty = None, op == sre_constants.GROUPREF
+        first = _union(first, node)
+        if not empty:
+            return first, False
+    return first, True
+
+def _overlapping_branch(items, inside=False, follow=frozenset()):
+    """
+    True if a repeat holds alternatives that can start with the same character, e.g. (a|aa)+
+    or (\\w|\\d)+: the engine can split the same text between them in exponentially many ways.
+    follow is what can come after items (for alternatives that can match empty).
+    """
+    for i, (op, av) in enumerate(items):
+        rest, rest_empty = _first(items[i + 1:])
+        after = _union(rest, follow) if rest_empty else rest
+        if op == sre_constants.BRANCH:
+            if inside:
+                firsts = []
+                for alt in av[1]:
+                    alt_first, alt_empty = _first(alt)
+                    firsts.append(_union(alt_first, after) if alt_empty else alt_first)
+                for j, a in enumerate(firsts):
+                    if any(a is None or b is None or a & b for b in firsts[j + 1:]):
+                        return True
+            if any(_overlapping_branch(alt, inside, after) for alt in av[1]):
+                return True
+        elif op in _REPEATS:
+            repeated = inside or av[1] == sre_constants.MAXREPEAT or av[1] > 1
+            # Inside a repeat the body can be followed by itself again
+            body_follow = _union(_first(av[2])[0], after) if repeated else after
+            if _overlapping_branch(av[2], repeated, body_follow):
+                return True
+        elif any(_overlapping_branch(child, inside, after) for child in _children(op, av)):
+            return True
+    return False
+
+def check_pattern(pattern):
+    """
+    Raise UnsafePatternError for a pattern that won't compile, is too long, nests quantifiers
+    or repeats overlapping alternatives (the usual causes of catastrophic backtracking).
+    Compiled patterns are checked too.
+    """
+    text = pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+    if not isinstance(text, str):
+        raise UnsafePatternError(f"Pattern must be text, not {type(text).__name__}")
+    if len(text) > MAX_PATTERN_LENGTH:
+        raise UnsafePatternError(f"Pattern is longer than {MAX_PATTERN_LENGTH:,} characters")
+    try:
+        parsed = sre_parse.parse(text)
+    except re.error as e:
+        raise UnsafePatternError(f"Invalid pattern {text!r} ({e})") from None
+    if _nested_quantifier(parsed):
+        raise UnsafePatternError(
+            f"Pattern {text!r} repeats a group that itself repeats (like (a+)+), which can take "
+            "forever on some rows. Use a possessive quantifier (e.g. \\d++) or an atomic group (?>...)")
+    if _overlapping_branch(parsed):
+        raise UnsafePatternError(
+            f"Pattern {text!r} repeats alternatives that can match the same text (like (a|aa)+), which "
+            "can take forever on some rows. Make the alternatives distinct or use an atomic group (?>a|aa)+")
+
+def safe_compile(pattern):
+    """check_pattern, then re.compile (compiled patterns pass through)"""
+    check_pattern(pattern)
+    return pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+
+# Workers are forked once and reused (not forked per call): a spawned or fork-server worker would
+# re-import the Streamlit script as its main module. Without fork (Windows) matching runs in-process
+_CONTEXT = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+_LOCK = threading.Lock()
+# (process, connection) of workers waiting for a job
+_IDLE = []
+# Per script thread: (deadline, budget) of the action running, or None
+_DEADLINE = threading.local()
+
+
+def _worker_loop(conn):
+    """Worker process: run jobs until the connection closes, acknowledging each before running it"""
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+        conn.send(("started", None))
+        try:
+            result = ("ok", func(*args))
+        except Exception as e:
+            result = ("error", e)
+        try:
+            conn.send(result)
+        except Exception as e: # result or exception that won't pickle
+            conn.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+
+def _take_worker():
+    """An idle worker, or a newly started one"""
+    with _LOCK:
+        while _IDLE:
+            worker = _IDLE.pop()
+            if worker[0].is_alive():
+                return worker
+            worker[1].close()
+        # Started under the lock so no other worker is forked holding this one's end of the pipe
+        parent_conn, child_conn = _CONTEXT.Pipe()
+        process = _CONTEXT.Process(target=_worker_loop, args=(child_conn,), name="regex-worker", daemon=True)
+        process.start()
+        child_conn.close()
+    return process, parent_conn
+
+def _release_worker(worker):
+    with _LOCK:
+        if len(_IDLE) < MAX_IDLE_WORKERS:
+            _IDLE.append(worker)
+            return
+    _stop_worker(worker)
+
+def _stop_worker(worker):
+    # Killed rather than asked to exit: workers forked later share the pipe, so it never closes
+    process, conn = worker
+    conn.close()
+    process.kill()
+    process.join()
+
+@contextmanager
+def regex_deadline(budget=REGEX_TIME_BUDGET):
+    """
+    One time budget for all guarded matching inside the block (an action with several
+    conditions, or a whole replay): each pass only gets what the earlier ones left.
+    A block inside another keeps the outer deadline.
+    """
+    if getattr(_DEADLINE, 'current', None) is not None:
+        yield
+        return
+    _DEADLINE.current = (time.monotonic() + budget, budget)
+    try:
+        yield
+    finally:
+        _DEADLINE.current = None
+
+def run_guarded(func, *args, budget=REGEX_TIME_BUDGET, what="Matching"):
+    """
+    func(*args) in a worker process, killed (and replaced) if it runs longer than budget seconds,
+    or than what is left of the deadline when called inside regex_deadline().
+    func and args must pickle (a module-level function and plain data); they are sent to the worker
+    and only the result is sent back. Workers are started once and reused.
+    Exceptions raised by func are raised here; running over raises RegexTimeoutError, and a
+    worker that fails to start or dies raises RuntimeError.
+    Where fork isn't available (Windows) func runs in-process, with only the pattern checks.
+    """
+    if _CONTEXT is None:
+        return func(*args)
+    deadline = getattr(_DEADLINE, 'current', None)
+    if deadline is not None:
+        budget = deadline[1]
+        remaining = deadline[0] - time.monotonic()
+    else:
+        remaining = budget
+    if remaining <= 0:
+        raise RegexTimeoutError(f"{what} took longer than {budget:g}s and was stopped; try a simpler pattern")
+    worker = _take_worker()
+    process, conn = worker
+    try:
+        conn.send((func, args))
+        if not conn.poll(WORKER_START_TIMEOUT):
+            raise TimeoutError
+        conn.recv() # started
+        if not conn.poll(remaining):
+            _stop_worker(worker)
+            raise RegexTimeoutError(f"{what} took longer than {budget:g}s and was stopped; "
+                                    "try a simpler pattern")
+        status, value = conn.recv()
+    except TimeoutError:
+        _stop_worker(worker)
+        raise RuntimeError(f"{what} couldn't run: the matching worker didn't respond; "
+                           "please try again") from None
+    except (EOFError, OSError):
+        _stop_worker(worker)
+        raise RuntimeError(f"{what} couldn't run: the matching worker stopped unexpectedly "
+                           f"(exit code {process.exitcode}); please try again") from None
+    _release_worker(worker)
+    if status == "error":
+        raise value
+    return value
+
+def _search(pattern, cells):
+    """Worker side of search_cells: cells is a list, or a (joined text, count) pair"""
+    if isinstance(cells, tuple):
+        text, count = cells
+        cells = text.split(CELL_SEPARATOR) if count else []
+    search = re.compile(pattern).search
+    return np.fromiter(map(bool, map(search, cells)), dtype=bool, count=len(cells))
+
+def search_cells(pattern, cells, what="Matching"):
+    """
+    Boolean array: re.search of pattern in each cell (text), run guarded (see run_guarded).
+    Cells go to the worker joined into one string, which pickles as one copy rather
+    than one object per cell.
+    """
+    text = CELL_SEPARATOR.join(cells)
+    if text.count(CELL_SEPARATOR) == max(len(cells) - 1, 0):
+        return run_guarded(_search, pattern, (text, len(cells)), what=what)
+    return run_guarded(_search, pattern, list(cells), what=what)
@@ -0,0 +1,224 @@
+"""
+Line-item search over the display table: hash, prefix and substring indexes,
+kept up to date incrementally as actions change rows (rows are docs, keyed by row fingerprint)
+"""
+
+import re
+import weakref
+from bisect import bisect_left, insort
+import numpy as np
+import pandas as pd
+from column_type_utils import FORMATS_ATTR
+from fingerprint_utils import row_fingerprint
+
+# Header names tried (in order) for the item number and title columns
+KEY_COLUMN_NAMES = ["edition #", "edition", "item #", "item", "item number", "sku", "part #", "part", "catalog #"]
+TITLE_COLUMN_NAMES = ["title", "description", "item description", "product", "name"]
+# Substring search length covered by the n-gram index; shorter queries use the term list
+NGRAM = 3
+# Search modes shown in the app
+SEARCH_MODES = ["Exact", "Prefix", "Substring"]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def guess_search_columns(columns):
+    """(item column, title column) picked from the headers; either may be None"""
+    lookup = {str(c).strip().lower(): c for c in columns}
+    key_col = next((lookup[n] for n in KEY_COLUMN_NAMES if n in lookup), None)
+    title_col = next((lookup[n] for n in TITLE_COLUMN_NAMES if n in lookup), None)
+    return key_col, title_col
+
+def _column_text(df, col):
+    """Cell text of one column, formatted the way the table shows it"""
+    if col is None:
+        return [""] * len(df)
+    values = df[col]
+    fmt = (df.attrs.get(FORMATS_ATTR) or {}).get(col)
+    if fmt and fmt['kind'] == "float":
+        text = np.char.mod(f"%.{fmt['decimals']}f", values.fillna(0).to_numpy(dtype=float)).astype(object)
+        text[values.isna().to_numpy()] = ""
+        return text.tolist()
+    # pd.isna covers None, NaN and the pd.NA of nullable integer columns
+    return ["" if pd.isna(v) else str(v) for v in values.astype(object)]
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+def new_search_index(key_col, title_col):
+    """Empty index over the given columns"""
+    return {
+        'columns': (key_col, title_col),
+        'table': None,      # weak reference to the DataFrame the index currently describes
+        'hashes': np.zeros(0, dtype=np.int64),  # doc id of each row of that table, in order
+        'doc_ids': np.zeros(0, dtype=np.int64), # doc ids indexed, sorted
+        'docs': {},         # doc id -> (item, title), normalized
+        'terms': {},        # item number or title word -> doc id(s)
+        'grams': {},        # n-gram of "item title" -> doc id(s)
+        'sorted_terms': [], # terms in order, for prefix lookups with bisect
+        'stats': {'added': 0, 'removed': 0},
+    }
+
+# Postings hold a bare doc id until a second doc shares the value; most item numbers
+# and many words belong to one row, and a one-element set costs ten times the memory
+# (both return True when the value itself was added to or dropped from postings)
+def _post_add(postings, value, doc_id):
+    ids = postings.get(value)
+    if ids is None:
+        postings[value] = doc_id
+        return True
+    if isinstance(ids, set):
+        ids.add(doc_id)
+    elif ids != doc_id:
+        postings[value] = {ids, doc_id}
+    return False
+
+def _post_remove(postings, value, doc_id):
+    ids = postings.get(value)
+    if isinstance(ids, set):
+        ids.discard(doc_id)
+        if len(ids) == 1:
+            postings[value] = next(iter(ids))
+    elif ids == doc_id:
+        del postings[value]
+        return True
+    return False
+
+def _post_get(postings, value):
+    ids = postings.get(value)
+    if ids is None:
+        return set()
+    return ids if isinstance(ids, set) else {ids}
+
+def _doc_entries(doc):
+    """Terms and n-grams of one row (recomputed on removal rather than stored)"""
+    key_norm, title_norm = doc
+    terms = set(_TOKEN_RE.findall(title_norm))
+    if key_norm:
+        terms.add(key_norm)
+    return [('terms', terms), ('grams', _ngrams(_doc_text(doc)))]
+
+def _doc_text(doc):
+    return f"{doc[0]} {doc[1]}".strip()
+
+def _add_doc(index, doc_id, key, title, changed_terms):
+    """Index one row; terms new to the index are appended to changed_terms"""
+    doc = (key.strip().lower(), title.strip().lower())
+    index['docs'][doc_id] = doc
+    for name, values in _doc_entries(doc):
+        for value in values:
+            if _post_add(index[name], value, doc_id) and name == 'terms':
+                changed_terms.append(value)
+
+def _remove_doc(index, doc_id, changed_terms):
+    """Unindex one row; terms no longer in the index are appended to changed_terms"""
+    doc = index['docs'].pop(doc_id)
+    for name, values in _doc_entries(doc):
+        for value in values:
+            if _post_remove(index[name], value, doc_id) and name == 'terms':
+                changed_terms.append(value)
+
+def _update_sorted_terms(index, added, removed):
+    """Keep the sorted term list in step: a few changes are bisected in, many are re-sorted"""
+    terms = index['sorted_terms']
+    if len(added) + len(removed) > len(terms) // 100:
+        index['sorted_terms'] = sorted(index['terms'])
+        return
+    for term in removed:
+        del terms[bisect_left(terms, term)]
+    for term in added:
+        insort(terms, term)
+
+def refresh_search_index(index, df, row_hashes=None):
+    """
+    Bring the index in line with df and return it.
+    row_hashes: a fingerprint per row of df (see table_functions.display_row_hashes), used as
+    doc ids; rows are fingerprinted here when not given. Rows are matched to docs with numpy
+    set operations, so after an action only rows that are new get tokenized, and only rows
+    that are gone are removed.
+    Does nothing when df is the table already indexed (e.g. on a rerun from the search box).
+    """
+    key_col, title_col = guess_search_columns(df.columns)
+    if index is None or index['columns'] != (key_col, title_col):
+        index = new_search_index(key_col, title_col)
+    if index['table'] is not None and index['table']() is df:
+        return index
+
+    if row_hashes is None or len(row_hashes) != len(df):
+        row_hashes = [row_fingerprint(row) for row in df.astype(object).values.tolist()]
+    hashes = np.asarray(row_hashes, dtype=np.int64)
+    doc_ids, first = np.unique(hashes, return_index=True)
+
+    added_terms, removed_terms = [], []
+    gone = np.setdiff1d(index['doc_ids'], doc_ids, assume_unique=True)
+    for doc_id in gone.tolist():
+        _remove_doc(index, doc_id, removed_terms)
+    is_new = ~np.isin(doc_ids, index['doc_ids'], assume_unique=True)
+    new, new_pos = doc_ids[is_new], first[is_new]
+    if len(new):
+        # Only the new rows' cells are read as text
+        rows = df.iloc[new_pos]
+        for doc_id, key, title in zip(new.tolist(), _column_text(rows, key_col), _column_text(rows, title_col)):
+            _add_doc(index, doc_id, key, title, added_terms)
+    if added_terms or removed_terms:
+        _update_sorted_terms(index, added_terms, removed_terms)
+
+    index['hashes'], index['doc_ids'] = hashes, doc_ids
+    # Weak, so the index never keeps an old or evicted table alive
+    index['table'] = weakref.ref(df)
+    index['stats'] = {'added': len(new), 'removed': len(gone)}
+    return index
+
+def _prefix_docs(index, prefix):
+    """Doc ids with a term starting with prefix (bisect over the sorted terms)"""
+    terms = index['sorted_terms']
+    found = set()
+    for i in range(bisect_left(terms, prefix), len(terms)):
+        if not terms[i].startswith(prefix):
+            break
+        found |= _post_get(index['terms'], terms[i])
+    return found
+
+def _substring_docs(index, query):
+    """Doc ids whose item or title contains query"""
+    if len(query) < NGRAM:
+        # Too short for the n-gram index: look through the distinct terms instead of the rows
+        found = set()
+        for term in index['terms']:
+            if query in term:
+                found |= _post_get(index['terms'], term)
+        return found
+    candidates = None
+    for gram in _ngrams(query):
+        ids = _post_get(index['grams'], gram)
+        candidates = ids if candidates is None else candidates & ids
+        if not candidates:
+            return set()
+    # n-grams can all match without the whole query being there; confirm on the candidates only
+    return {d for d in candidates if query in _doc_text(index['docs'][d])}
+
+def search_rows(index, query, mode="Substring"):
+    """
+    Row positions in the indexed table matching query, in table order.
+    - Exact: item number or whole title equals the query (case-insensitive)
+    - Prefix: every word of the query starts a word of the title or the item number
+    - Substring: the query appears anywhere in the item number or title
+    """
+    query = (query or "").strip().lower()
+    if not query or index is None:
+        return []
+    docs = index['docs']
+    if mode == "Exact":
+        # Item numbers are terms; whole titles are found through the n-grams, then compared
+        doc_ids = {d for d in _post_get(index['terms'], query) if docs[d][0] == query}
+        doc_ids |= {d for d in _substring_docs(index, query) if docs[d][1] == query}
+    elif mode == "Prefix":
+        doc_ids = None
+        for word in _TOKEN_RE.findall(query) or [query]:
+            ids = _prefix_docs(index, word)
+            doc_ids = ids if doc_ids is None else doc_ids & ids
+    else:
+        doc_ids = _substring_docs(index, query)
+    if not doc_ids:
+        return []
+    return np.flatnonzero(np.isin(index['hashes'], np.fromiter(doc_ids, dtype=np.int64))).tolist()
@@ -3,12 +3,21 @@ Table processing and template functions
 """
 
 import uuid
+from itertools import compress
 from datetime import datetime, UTC
+import hashlib
 import json
 import os
 import re
+import time
+import ast
 import streamlit as st
+import numpy as np
 import pandas as pd
+from fingerprint_utils import row_fingerprint, fingerprint_rows, table_digest
+from column_type_utils import infer_column_types
+from price_list_functions import load_price_index, lookup_prices
+from regex_utils import safe_compile, check_pattern, search_cells, regex_deadline
 
 # Relative folder where all templates live 
 # shared by anyone using same app instance
@@ -26,19 +35,61 @@ def save_action_state(action_type, action_name=None, params=None):
         'label': label,
         'name': action_name,
         'timestamp': datetime.now().strftime("%H:%M:%S"),
-        'working_data': [r[:] for r in st.session_state.working_data] if 'working_data' in st.session_state else None,
+        'saved_at': time.time(), # used to evict the oldest snapshots first
+        # Version id of the table before this action (see update_display_table)
+        'version': st.session_state.get('table_version'),
+        # Snapshots share rows with the live table: actions build new row lists and never change
+        # them in place, and main_table is replaced, not edited, so no copies are needed
+        'working_data': st.session_state.get('working_data'),
         'current_headers': list(st.session_state.current_headers) if st.session_state.get('current_headers') else None,
         'header_row_index': st.session_state.get('header_row_index'),
-        'main_table': st.session_state.main_table.copy(deep=True) if 'main_table' in st.session_state else None,
+        'main_table': st.session_state.get('main_table'),
     }
     st.session_state.setdefault('applied_actions', []).append(action_data)
     # Invalidate redo on any new forward action
     st.session_state['redo_stack'] = []
     return action_id
 
+# Session keys holding row fingerprints and the table version; derived from the tables
+FINGERPRINT_KEYS = ["table_fingerprints", "original_fingerprints", "table_version"]
+
+def table_fingerprints(rows):
+    """
+    Row fingerprints of rows (working data), hashing only rows not seen in the
+    current or original table before (see fingerprint_utils.fingerprint_rows).
+    The row list already fingerprinted is returned as is, with no per-row work.
+    """
+    ss = st.session_state
+    for cached in (ss.get("table_fingerprints"), ss.get("original_fingerprints")):
+        if cached and cached['rows'] is rows:
+            return cached
+    return fingerprint_rows(rows, ss.get("table_fingerprints"), ss.get("original_fingerprints"))
+
+def _shown_rows(fingerprints, header_row_idx, header_key):
+    """Mask of the working rows the display table shows: all but the header row and its duplicates"""
+    shown = np.ones(len(fingerprints['hashes']), dtype=bool)
+    if header_row_idx is not None and 0 <= header_row_idx < len(shown):
+        shown[header_row_idx] = False
+    if header_key is not None:
+        shown &= fingerprints['hashes'] != header_key # hides duplicate header rows
+    return shown
+
+def display_row_hashes():
+    """
+    Row fingerprints of the rows main_table shows, in order, from the cached working-data
+    fingerprints (no per-row work). Used to keep the line-item search index up to date.
+    """
+    ss = st.session_state
+    fingerprints = table_fingerprints(ss.get('working_data') or [])
+    raw_headers = ss.get("raw_headers")
+    header_key = row_fingerprint(raw_headers) if raw_headers is not None else None
+    return fingerprints['hashes'][_shown_rows(fingerprints, ss.get("header_row_index"), header_key)]
+
 def update_display_table(new_working_data):
     """
     Build DataFrame from working_data while hiding the header source row (if chosen).
+    Also records the row fingerprints and version id (table_version) of the new state;
+    the DataFrame is only rebuilt when the version changed.
     """
     # Update working data
     st.session_state.working_data = new_working_data
@@ -46,21 +97,25 @@ def update_display_table(new_working_data):
     headers_to_use = st.session_state.get("current_headers")
     raw_headers = st.session_state.get("raw_headers")
 
+    header_key = row_fingerprint(raw_headers) if raw_headers is not None else None
+    fingerprints = table_fingerprints(new_working_data)
+    version = table_digest(fingerprints['keys'], headers_to_use, header_row_idx, header_key)
+    st.session_state.table_fingerprints = fingerprints
+    if st.session_state.get("table_version") == version and 'main_table' in st.session_state:
+        return # Same table as shown already (e.g. a step that matched nothing)
+    st.session_state.table_version = version
+
     # Hide header row without mutating working data
-    display_rows = []
-    for i, r in enumerate(new_working_data):
-        if header_row_idx is not None and i == header_row_idx:
-            continue
-        if raw_headers is not None and r == raw_headers: # hides duplicate header rows
-            continue
-        display_rows.append(r)
+    shown = _shown_rows(fingerprints, header_row_idx, header_key)
+    display_rows = list(compress(new_working_data, shown))
 
     # Header length guard
     if headers_to_use and display_rows and len(headers_to_use) != len(display_rows[0]):
         headers_to_use = None
 
-    # Update display
-    st.session_state.main_table = pd.DataFrame(display_rows, columns= headers_to_use)
+    # Update display; with headers applied, columns are stored typed (numbers, categoricals)
+    display_table = pd.DataFrame(display_rows, columns= headers_to_use)
+    st.session_state.main_table = infer_column_types(display_table) if headers_to_use else display_table
 
 def clean_duplicate_headers(headers):
     """
@@ -114,15 +169,13 @@ def remove_duplicate_headers(table_data, header_row_index):
     if not table_data or header_row_index >= len(table_data):
         return table_data
 
-    header_row = table_data[header_row_index]
-    cleaned_data = []
-
-    for i, row in enumerate(table_data):
-        # Keep the original header row and all rows that don't match it
-        if i == header_row_index or row != header_row:
-            cleaned_data.append(row)
+    # Fingerprints come from the table's cache; only rows new since the last action are hashed
+    hashes = table_fingerprints(table_data)['hashes']
+    # Keep the original header row and all rows that don't match it
+    keep = hashes != hashes[header_row_index]
+    keep[header_row_index] = True
 
-    return cleaned_data
+    return list(compress(table_data, keep))
 
 
 def fix_concatenated_table(table):
@@ -132,13 +185,19 @@ def fix_concatenated_table(table):
         return table
     
     raw_headers = st.session_state.get("raw_headers")
+    header_key = row_fingerprint(raw_headers) if raw_headers is not None else None
+    hashes = table_fingerprints(table)['hashes'] if header_key is not None else None
     fixed_rows = []
     # Process each row
     for i, row in enumerate(table):
         #Preserve header row (do not split)
-        if raw_headers is not None and row == raw_headers:
+        if header_key is not None and hashes[i] == header_key:
             fixed_rows.append(row[:])
             continue
+        # Nothing to split: keep the row object itself, so its fingerprint is reused
+        if any(row) and all(c.__class__ is str and "\n" not in c and c == c.strip() for c in row):
+            fixed_rows.append(row)
+            continue
         
         # Split each cell by newlines to get individual values
         split_cells = []
@@ -164,47 +223,160 @@ def fix_concatenated_table(table):
     return fixed_rows
 
 
-def delete_unwanted_rows(search_pattern):
-    """Delete rows that don't contain actual data - pick by input"""
-    kept_rows = []
-    matched_rows = []
-    
-    for i, row in enumerate(st.session_state.working_data):
-        # Check if the first cell in the row matches the pattern
-        first_cell = str(row[0]) if row and row[0] is not None else ""
-        if re.search(search_pattern, first_cell):
-            matched_rows.append((i, first_cell))
+# Where a delete rows condition looks for its pattern
+# - first_cell: the first cell of the row
+# - column: one column, by 1-based number or header name ('column' param)
+# - any_cell: at least one cell of the row
+# - all_cells: every cell of the row
+ROW_SCOPES = ["first_cell", "column", "any_cell", "all_cells"]
+# How several delete rows conditions combine
+ROW_COMBINES = ["or", "and"]
+
+def _row_conditions(search_pattern, scope=None, column=None, conditions=None):
+    """The step's own pattern/scope/column as the first condition, then any extra conditions"""
+    first = {'pattern': search_pattern, 'scope': scope or "first_cell", 'column': column}
+    return [first] + [dict(c, scope=c.get('scope') or "first_cell") for c in conditions or []]
+
+def _cell_text(v):
+    """Cell value as text; empty cells (None, or NaN from DataFrame.values) read as "" """
+    if v.__class__ is str:
+        return v
+    if v is None or (np.ndim(v) == 0 and pd.isna(v)):
+        return ""
+    return str(v)
+
+def match_rows(rows, conditions, combine="or", headers=None):
+    """
+    Boolean array: rows matching the conditions ({'pattern', 'scope', 'column'}), joined with combine.
+    Each condition is one pass of the pattern over whole columns of cell text, and a column's
+    text is built once however many conditions read it. The patterns are user-entered, so the
+    passes run in a guarded worker (regex_utils.search_cells).
+    Empty cells (None or NaN) and missing cells of short rows read as "".
+    """
+    if combine not in ROW_COMBINES:
+        raise ValueError(f"Unknown combine {combine!r}: use one of {', '.join(ROW_COMBINES)}")
+    n = len(rows)
+    width = max(map(len, rows), default=0)
+    columns = {}
+    grid = []
+
+    def column_text(idx):
+        if idx not in columns:
+            cells = [r[idx] if idx < len(r) else "" for r in rows]
+            columns[idx] = [v if v.__class__ is str else _cell_text(v) for v in cells]
+        return columns[idx]
+
+    def all_text():
+        # Every cell, row by row, padded to the widest row; plus which cells are really there
+        # (an empty row still has its one empty first cell)
+        if not grid:
+            cells = pd.DataFrame(rows, columns=range(max(1, width)), dtype=object).to_numpy()
+            grid.append([v if v.__class__ is str else _cell_text(v) for v in cells.ravel().tolist()])
+            lengths = np.maximum(np.fromiter(map(len, rows), dtype=int, count=n), 1)
+            grid.append(np.arange(max(1, width)) < lengths[:, None])
+        return grid
+
+    matched = np.zeros(n, dtype=bool) if combine == "or" else np.ones(n, dtype=bool)
+    for cond in conditions:
+        scope = cond['scope']
+        if scope == "first_cell":
+            hits = search_cells(cond['pattern'], column_text(0))
+        elif scope == "column":
+            if cond.get('column') is None:
+                raise ValueError("A column condition needs a column")
+            idx = _resolve_column(str(cond['column']), headers)
+            if not 0 <= idx < width:
+                raise ValueError(f"Column {cond['column']} is not in the table")
+            hits = search_cells(cond['pattern'], column_text(idx))
+        elif scope in ("any_cell", "all_cells"):
+            cells, present = all_text()
+            found = search_cells(cond['pattern'], cells).reshape(present.shape)
+            hits = (found & present).any(axis=1) if scope == "any_cell" else (found | ~present).all(axis=1)
         else:
-            kept_rows.append(row)
-
+            raise ValueError(f"Unknown scope {scope!r}: use one of {', '.join(ROW_SCOPES)}")
+        matched = matched & hits if combine == "and" else matched | hits
+    return matched
+
+def describe_row_conditions(params):
+    """Delete rows conditions in words, e.g. Total OR ^$ in all cells"""
+    conds = _row_conditions(params.get('pattern'), params.get('scope'), params.get('column'),
+                            params.get('conditions'))
+    parts = []
+    for c in conds:
+        where = {'column': f" in column {c.get('column')}", 'any_cell': " in any cell",
+                 'all_cells': " in all cells"}.get(c['scope'], "")
+        parts.append(f"{c['pattern']}{where}")
+    return f" {(params.get('combine') or 'or').upper()} ".join(parts)
+
+def delete_rows_label(params):
+    return f"Delete Rows: {describe_row_conditions(params)}"
+
+def delete_unwanted_rows(search_pattern, scope=None, column=None, conditions=None, combine=None):
+    """
+    Delete rows that don't contain actual data - pick by input
+    The pattern is looked for in the scope (default first_cell, see ROW_SCOPES);
+    conditions adds more {'pattern', 'scope', 'column'} checks, joined by combine ("or" / "and"),
+    so one step can do the work of several.
+    """
+    rows = st.session_state.working_data
+    conds = [dict(c, pattern=safe_compile(c['pattern']))
+             for c in _row_conditions(search_pattern, scope, column, conditions)]
+    matched = match_rows(rows, conds, combine or "or", st.session_state.get("current_headers"))
+
+    if not matched.any():
+        return rows # Same list, so the display update finds the table unchanged without rehashing
+    kept_rows = list(compress(rows, ~matched))
     # Store matches in session state to show later
+    # (the first cell when that's all that was checked, else the whole row)
+    hits = compress(rows, matched)
+    if all(c['scope'] == "first_cell" for c in conds):
+        hits = (_cell_text(r[0]) if r else "" for r in hits)
+    matched_rows = list(zip(np.flatnonzero(matched).tolist(), hits))
     if matched_rows:
         st.session_state.debug_matches = matched_rows
 
     return kept_rows
 
+def match_cols(rows, pattern, skip_row=None):
+    """
+    Boolean array: columns where every cell matches pattern (cells missing from short rows count
+    as matching), checked over the whole table at once. skip_row (the header row) isn't checked.
+    """
+    width = max(map(len, rows), default=0)
+    body = [r for i, r in enumerate(rows) if i != skip_row]
+    if not width or not body:
+        return np.zeros(width, dtype=bool)
+    cells = pd.DataFrame(body, columns=range(width), dtype=object).to_numpy()
+    text = [v if v.__class__ is str else _cell_text(v) for v in cells.ravel().tolist()]
+    present = np.arange(width) < np.fromiter(map(len, body), dtype=int, count=len(body))[:, None]
+    return (search_cells(pattern, text).reshape(cells.shape) | ~present).all(axis=0)
+
 def delete_unwanted_cols(search_pattern):
     """
     Delete columns that don't contain actual data - pick by input
-    If no headers, delete columns where all cells match the pattern.
+    Deletes columns where all cells match the pattern (the header row, if chosen, isn't checked).
     Returns updated working_data (list of rows.)
     """
-    
-    kept_cols = []
-    matched_cols = []
+    rows = st.session_state.working_data
+    header_row_idx = st.session_state.get("header_row_index")
+    headers = st.session_state.get("current_headers")
+    matched = match_cols(rows, safe_compile(search_pattern), header_row_idx)
+    if not matched.any():
+        return rows
 
-    for i, col in enumerate(st.session_state.working_data):
-        # Check if columns match pattern
-        if re.search(search_pattern, col):
-            matched_cols.append(i, col)
-        else:
-            kept_cols.append(col)
-    
+    drop = set(np.flatnonzero(matched).tolist())
+    kept_rows = [[c for i, c in enumerate(r) if i not in drop] for r in rows]
     # Store matches in session state to show later if needed
-    if matched_cols:
-        st.session_state.debug_matched_cols = matched_cols
-    
-    return kept_cols
+    st.session_state.debug_matched_cols = [(i, headers[i] if headers and i < len(headers) else f"Column {i + 1}")
+                                           for i in sorted(drop)]
+    if headers:
+        st.session_state.current_headers = [h for i, h in enumerate(headers) if i not in drop]
+    # Keep the stored header row in step with the header row inside the data
+    if st.session_state.get("raw_headers") is not None and header_row_idx is not None \
+            and 0 <= header_row_idx < len(kept_rows):
+        st.session_state.raw_headers = kept_rows[header_row_idx]
+
+    return kept_rows
 
 
 def add_net_item_col(retail_idx, discount_idx, header_name="Item Net"):
@@ -215,44 +387,245 @@ def add_net_item_col(retail_idx, discount_idx, header_name="Item Net"):
 
     if not st.session_state.working_data:
         return st.session_state.working_data # Nothing to do if empty
-    # max_width = max((len(r) for r in st.session_state.working_data), default=0)
     
     # Validate indices
     if any(v is None for v in (retail_idx, discount_idx)) or retail_idx < 0 or discount_idx < 0:
         return st.session_state.working_data
-    
-    net_item_values = []
-    for row in st.session_state.working_data:
-        if len(row) <= max(retail_idx, discount_idx):
-            net_item_values.append("")
-            continue
-        price = to_float(row[retail_idx])
-        disc_percent = to_float(row[discount_idx])
-        net = price * (1 - disc_percent / 100)
-        net_item_values.append(f"{net:.2f}")
-
-    # Insert after discount column
-    insert_position = discount_idx + 1
-    for i, row in enumerate(st.session_state.working_data):
-        if len(row) < insert_position:
-            row.extend([""] * (insert_position - len(row)))
-        row.insert(insert_position, net_item_values[i])
-                        
-    if st.session_state.get("current_headers"):
-        headers = st.session_state.current_headers
-        # Pad headers up to insert_position
-        while len(headers) < insert_position:
-            headers.append(f"col_{len(headers)}")
-        # Insert new header
-        headers.insert(insert_position, header_name)
-        # Reconcile header count with widest row
-        new_width = max((len(r) for r in st.session_state.working_data), default=0)
-        while len(headers) < new_width:
-            headers.append(f"col_{len(headers)}")
-        if len(headers) > new_width:
-            headers[:] = headers[:new_width]
-
-    return st.session_state.working_data
+
+    # Same formula as a computed column; references are 1-based like the UI
+    expression = f"{{{retail_idx + 1}}} * (1 - {{{discount_idx + 1}}} / 100)"
+    return add_computed_col(st.session_state.working_data, expression, header_name,
+                            insert_after=discount_idx + 1)
+
+
+# Operators allowed in computed column expressions
+_EXPRESSION_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.USub: np.negative,
+    ast.UAdd: np.positive,
+}
+
+def _resolve_column(ref, headers):
+    """
+    Column reference -> zero-based index: a header name, or else a 1-based column number
+    (headers are looked up first, so a column named "2" isn't taken for column 2)
+    """
+    ref = ref.strip()
+    if headers and ref in headers:
+        return headers.index(ref)
+    if ref.isdigit():
+        if int(ref) < 1:
+            raise ValueError(f"Column numbers start at 1: {ref}")
+        return int(ref) - 1
+    raise ValueError(f"Unknown column: {ref}")
+
+def parse_expression(expression, headers=None):
+    """
+    Parse an arithmetic expression over columns, e.g. "{Net} * {Ship}" or "{5} * (1 - {6} / 100)".
+    Columns are written in braces, by 1-based number or header name.
+    Returns (tree, column_indices) where names col_0, col_1... in the tree refer to column_indices.
+    """
+    column_indices = []
+
+    def to_name(match):
+        idx = _resolve_column(match.group(1), headers)
+        if idx not in column_indices:
+            column_indices.append(idx)
+        return f"col_{column_indices.index(idx)}"
+
+    tree = ast.parse(re.sub(r"\{([^{}]+)\}", to_name, expression), mode="eval")
+    # Only numbers, column names, parentheses and + - * / are allowed
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)) and type(node.op) not in _EXPRESSION_OPS:
+            raise ValueError(f"Operator not allowed in expression: {type(node.op).__name__}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"Only numbers are allowed in expression: {node.value!r}")
+        if not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load,
+                                 *_EXPRESSION_OPS)):
+            raise ValueError(f"Not allowed in expression: {type(node).__name__}")
+    return tree, column_indices
+
+def _evaluate(node, columns):
+    """Evaluate a parsed expression with numpy arrays for the column names"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, columns)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return columns[node.id]
+    if isinstance(node, ast.UnaryOp):
+        return _EXPRESSION_OPS[type(node.op)](_evaluate(node.operand, columns))
+    return _EXPRESSION_OPS[type(node.op)](_evaluate(node.left, columns), _evaluate(node.right, columns))
+
+def to_float_series(values, default=0.0):
+    """
+    Vectorized to_float for a whole column.
+    Handles: commas, %, currency symbols, parentheses for negatives.
+    Returns a float numpy array with default where a cell can't be parsed.
+    """
+    s = pd.Series(values, dtype="object").fillna("").astype(str).str.strip()
+    # Handle negative parentheses: (123.45) -> -123.45
+    neg = s.str.startswith("(") & s.str.endswith(")")
+    s = s.mask(neg, s.str[1:-1])
+    s = s.str.replace(r"[$£€,%]", "", regex=True).str.strip()
+    nums = pd.to_numeric(s, errors="coerce").fillna(default).to_numpy(dtype=float)
+    return np.where(neg.to_numpy(), -nums, nums)
+
+def _insert_header(insert_position, header_name, new_width):
+    """Insert a header name at insert_position and keep header count equal to new_width"""
+    headers = st.session_state.get("current_headers")
+    if not headers:
+        return
+    # Pad headers up to insert_position
+    while len(headers) < insert_position:
+        headers.append(f"col_{len(headers)}")
+    # Insert new header
+    headers.insert(insert_position, header_name)
+    # Reconcile header count with widest row
+    while len(headers) < new_width:
+        headers.append(f"col_{len(headers)}")
+    if len(headers) > new_width:
+        headers[:] = headers[:new_width]
+
+def add_computed_col(table_data, expression, header_name="Computed", insert_after=None, decimals=2):
+    """
+    Add a column computed from an arithmetic expression over other columns,
+    e.g. extension = "{Net} * {Ship}" (see parse_expression).
+    The referenced columns are parsed to numbers and the expression runs over whole
+    columns at once; the result is inserted as a single new column.
+    insert_after is a 1-based column number (None = add at the end).
+    Rows too short to hold the referenced columns get "".
+    Returns new table data (list of rows).
+    """
+    if not table_data:
+        return table_data
+    header_name = header_name or "Computed"
+
+    tree, column_indices = parse_expression(expression, st.session_state.get("current_headers"))
+    df = pd.DataFrame(table_data)
+    width = df.shape[1]
+    columns = {f"col_{i}": to_float_series(df[idx]) if idx < width else np.zeros(len(df))
+               for i, idx in enumerate(column_indices)}
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.broadcast_to(np.asarray(_evaluate(tree, columns), dtype=float), (len(df),))
+    formatted = np.char.mod(f"%.{int(decimals)}f", values).astype(object)
+    # Blank out division by zero and rows missing a referenced column
+    row_lengths = np.fromiter((len(r) for r in table_data), dtype=int, count=len(table_data))
+    needed = max(column_indices, default=-1) + 1
+    formatted[~np.isfinite(values) | (row_lengths < needed)] = ""
+
+    insert_position = width if insert_after is None else min(int(insert_after), width)
+    df.insert(insert_position, "_computed", formatted)
+    new_data = df.astype(object).where(df.notna(), None).values.tolist()
+
+    _insert_header(insert_position, header_name, df.shape[1])
+    # Keep the stored header row in step with the header row inside the data
+    header_row_idx = st.session_state.get("header_row_index")
+    if st.session_state.get("raw_headers") is not None and header_row_idx is not None \
+            and 0 <= header_row_idx < len(new_data):
+        st.session_state.raw_headers = new_data[header_row_idx]
+
+    return new_data
+
+# Default split: runs of two or more spaces, as text-extracted invoice columns are separated
+SPLIT_WHITESPACE = r"\s{2,}"
+
+def split_column(table_data, column, pattern=None, num_columns=None, header_names=None):
+    """
+    Split one column into several by a delimiter regex (default: runs of 2+ spaces),
+    e.g. a mashed "Edition #  Location  Title" column from a CSV export.
+    column is a 1-based column number or a header name.
+    num_columns caps the split (the last piece keeps the rest); None = as many as needed.
+    Every row is padded with "" to the same number of new columns.
+    header_names: optional comma-separated names for the new columns
+    (default: the split header row when headers are applied).
+    The split runs over the whole column at once with pandas' string methods.
+    Returns new table data (list of rows).
+    """
+    if not table_data:
+        return table_data
+    headers = st.session_state.get("current_headers")
+    idx = _resolve_column(str(column), headers)
+    df = pd.DataFrame(table_data)
+    if not 0 <= idx < df.shape[1]:
+        raise ValueError(f"Column {column} is not in the table")
+
+    if pattern is not None:
+        check_pattern(pattern)
+    limit = int(num_columns) - 1 if num_columns else -1
+    text = df[idx].fillna("").astype(str).str.strip()
+    parts = text.str.split(pattern or SPLIT_WHITESPACE, n=limit, expand=True, regex=True)
+    parts = parts.fillna("").apply(lambda col: col.str.strip())
+    # Pad to the requested width even when no row had that many pieces
+    for extra in range(parts.shape[1], int(num_columns or 0)):
+        parts[extra] = ""
+
+    new_df = pd.concat([df.iloc[:, :idx], parts, df.iloc[:, idx + 1:]], axis=1, ignore_index=True)
+    new_data = new_df.astype(object).where(new_df.notna(), None).values.tolist()
+
+    header_row_idx = st.session_state.get("header_row_index")
+    if headers and idx < len(headers):
+        names = [n.strip() for n in header_names.split(",")] if header_names else []
+        if not names and header_row_idx is not None and 0 <= header_row_idx < len(parts):
+            names = list(parts.iloc[header_row_idx])
+        # Unnamed pieces fall back to the old header with a number
+        names = [names[i] if i < len(names) and names[i] else f"{headers[idx]}_{i + 1}"
+                 for i in range(parts.shape[1])]
+        st.session_state.current_headers = clean_duplicate_headers(headers[:idx] + names + headers[idx + 1:])
+    # Keep the stored header row in step with the header row inside the data
+    if st.session_state.get("raw_headers") is not None and header_row_idx is not None \
+            and 0 <= header_row_idx < len(new_data):
+        st.session_state.raw_headers = new_data[header_row_idx]
+
+    return new_data
+
+def add_price_check_cols(table_data, price_list, key_column, price_column, list_key_column, list_price_column,
+                         decimals=2):
+    """
+    Compare invoice prices to a saved price list (see price_list_functions).
+    Each row's item (key_column) is looked up in the price list's keyed index, and
+    "Expected Price" and "Price Delta" (invoice price - expected) columns are added at the end.
+    key_column / price_column: 1-based column numbers or header names in the table.
+    list_key_column / list_price_column: column names in the price list.
+    The price list is read and indexed once and reused across runs and sessions.
+    Rows whose item isn't in the price list get "" in both columns.
+    Returns new table data (list of rows).
+    """
+    if not table_data:
+        return table_data
+    headers = st.session_state.get("current_headers")
+    key_idx = _resolve_column(str(key_column), headers)
+    price_idx = _resolve_column(str(price_column), headers)
+    index = load_price_index(price_list, list_key_column, list_price_column)
+
+    df = pd.DataFrame(table_data)
+    width = df.shape[1]
+    if not (0 <= key_idx < width and 0 <= price_idx < width):
+        raise ValueError("Key or price column is not in the table")
+    expected = lookup_prices(index, df[key_idx])
+    delta = to_float_series(df[price_idx]) - expected
+    found = ~np.isnan(expected)
+    for offset, values in enumerate([expected, delta]):
+        rounded = np.round(np.nan_to_num(values), int(decimals))
+        # No "-0.00" deltas from float noise
+        formatted = np.char.mod(f"%.{int(decimals)}f", np.where(rounded == 0, 0.0, rounded)).astype(object)
+        formatted[~found] = ""
+        df[width + offset] = formatted
+    new_data = df.astype(object).where(df.notna(), None).values.tolist()
+
+    _insert_header(width, "Expected Price", width + 1)
+    _insert_header(width + 1, "Price Delta", width + 2)
+    # Keep the stored header row in step with the header row inside the data
+    header_row_idx = st.session_state.get("header_row_index")
+    if st.session_state.get("raw_headers") is not None and header_row_idx is not None \
+            and 0 <= header_row_idx < len(new_data):
+        st.session_state.raw_headers = new_data[header_row_idx]
+
+    return new_data
 
 
 # Single registry describing each action
@@ -262,6 +635,7 @@ def add_net_item_col(retail_idx, discount_idx, header_name="Item Net"):
 # - args: list of argument specs; taken from params or working_data
 # - returns_data: True if func returns new list-of-rows to render, otherwise just post_update
 # -post_update: call update_display_table even if function returns None (for stateful funcs)
+# - row_local: True if each row is handled on its own, so the action can run chunk by chunk (CSV streaming)
 ACTIONS = {
     "apply_headers": {
         "required": ["header_row_index"],
@@ -270,6 +644,7 @@ ACTIONS = {
         "args": ["header_row_index"],
         "returns_data": False,
         "post_update": True,
+        "row_local": False,
     },
     "remove_duplicates": {
         "required": ["header_row_index"],
@@ -278,6 +653,7 @@ ACTIONS = {
         "args": ["working_data", "header_row_index"],
         "returns_data": True,
         "post_update": False,
+        "row_local": True,
     },
     "fix_concatenated": {
         "required": [],
@@ -286,14 +662,16 @@ ACTIONS = {
         "args": ["working_data"],
         "returns_data": True,
         "post_update": False,
+        "row_local": True,
     },
     "delete_unwanted_rows": {
         "required": ["pattern"],
-        "label": "Delete Rows: {pattern}",
+        "label": delete_rows_label,
         "func": delete_unwanted_rows,
-        "args": ["pattern"],
+        "args": ["pattern", "scope", "column", "conditions", "combine"],
         "returns_data": True,
         "post_update": False,
+        "row_local": True,
     },
     "delete_unwanted_cols": {
         "required": ["pattern"],
@@ -302,6 +680,7 @@ ACTIONS = {
         "args": ["pattern"],
         "returns_data": True,
         "post_update": False,
+        "row_local": False,
     },
     "add_net_item_col": {
         "required": ["retail_price_index", "discount_percent_index"],
@@ -313,6 +692,37 @@ ACTIONS = {
         "args": ["retail_price_index", "discount_percent_index"],
         "returns_data": True,
         "post_update": False,
+        "row_local": True,
+    },
+    "add_computed_col": {
+        "required": ["expression"],
+        "label": lambda p: f"Add Column {p.get('header_name') or 'Computed'} = {p.get('expression')}",
+        "func": add_computed_col,
+        "args": ["working_data", "expression", "header_name", "insert_after"],
+        "returns_data": True,
+        "post_update": False,
+        "row_local": True,
+    },
+    "split_column": {
+        "required": ["column"],
+        "label": lambda p: (
+            f"Split Column {p.get('column')} on {p.get('pattern') or 'whitespace'}"
+            + (f" into {p['num_columns']}" if p.get('num_columns') else "")
+        ),
+        "func": split_column,
+        "args": ["working_data", "column", "pattern", "num_columns", "header_names"],
+        "returns_data": True,
+        "post_update": False,
+        "row_local": True,
+    },
+    "check_prices": {
+        "required": ["price_list", "key_column", "price_column", "list_key_column", "list_price_column"],
+        "label": "Check {price_column} against {price_list} on {key_column}",
+        "func": add_price_check_cols,
+        "args": ["working_data", "price_list", "key_column", "price_column", "list_key_column", "list_price_column"],
+        "returns_data": True,
+        "post_update": False,
+        "row_local": True,
     },
 }
 
@@ -347,7 +757,9 @@ def _invoke(cfg, params):
         else:
             call_args.append(params.get(spec))
     try:
-        result = func(*call_args)
+        # All of one action's regex passes share one time budget
+        with regex_deadline():
+            result = func(*call_args)
         return result, []
     except Exception as e:
         return None, [f"Error invoking {getattr(func, '__name__', 'action')}: {e}"]
@@ -356,33 +768,56 @@ def run_action(action_type, params):
     """
     Use the ACTIONS registry to run all functions, update display,
     and log into Applied Actions once.
+    Returns a list of warnings for the app to show (it may be running in a widget callback,
+    where nothing can be drawn).
     """
     cfg = ACTIONS.get(action_type)
     if not cfg:
-        st.warning(f"Unknown action: {action_type}")
-        return
+        return [f"Unknown action: {action_type}"]
 
     # Validate required params
     missing = [req for req in cfg["required"] if params.get(req) is None]
     if missing:
-        st.warning(f"Missing {', '.join(missing)} for {action_type}")
-        return
+        return [f"Missing {', '.join(missing)} for {action_type}"]
 
     # Log once
     save_action_state(action_type, action_label(action_type, params), params=params)
 
     # 'invoke and render
     result, warnings = _invoke(cfg, params)
-    for w in warnings:
-        st.warning(w)
 
     if cfg["returns_data"]:
         if result is not None:
             update_display_table(result)
         else:
-            st.warning(f"{action_type} returned no data")
+            warnings.append(f"{action_type} returned no data")
     elif cfg.get("post_update"):
         update_display_table(st.session_state.working_data)
+    return warnings
+
+def init_main_table(all_tables):
+    """
+    Initialize session tables from freshly extracted tables (list of raw pdfplumber tables).
+    Also clears headers and history, since they referred to the previous extraction.
+    """
+    # DataFrames are only built here, once per extraction
+    combined_table = pd.concat([pd.DataFrame(t) for t in all_tables], ignore_index=True)
+    st.session_state.main_table = combined_table
+    # Convert dataframe to list of lists for processing
+    st.session_state.table_as_list = combined_table.values.tolist()
+    # Always preserve original data
+    # (rows are shared, never changed in place: actions build new row lists)
+    st.session_state.original_table_data = st.session_state.table_as_list
+    st.session_state.working_data = list(st.session_state.table_as_list)
+    # Hashed once per extraction; resets and replays look rows up here
+    st.session_state.original_fingerprints = fingerprint_rows(st.session_state.original_table_data)
+    st.session_state.table_fingerprints = st.session_state.original_fingerprints
+    st.session_state.table_version = table_digest(st.session_state.original_fingerprints['keys'], None, None, None)
+    st.session_state.current_headers = None
+    for key in ["header_row_index", "raw_headers"]:
+        st.session_state.pop(key, None)
+    st.session_state['applied_actions'] = []
+    st.session_state['redo_stack'] = []
 
 def reset_all():
     """
@@ -392,9 +827,11 @@ def reset_all():
     - clear applied actions_and redo_stack
     - rebuild main_table
     """
-    # Restore original data
-    original = [r[:] for r in st.session_state.get('original_table_data', [])]
+    # Restore original data (rows are shared with it, see init_main_table)
+    original = list(st.session_state.get('original_table_data', []))
     st.session_state.working_data = original
+    st.session_state.table_fingerprints = table_fingerprints(original)
+    st.session_state.table_version = table_digest(st.session_state.table_fingerprints['keys'], None, None, None)
 
     # Clear common state flags
     for key in [
@@ -489,55 +926,162 @@ def build_template_from_actions(applied_actions):
         
         tpl_actions.append({"type": t, "params": p})
 
-    return {
+    tpl = {
         "name": ss.get("template_name", "Untitled"),
         "version": "K",
         "created_at": datetime.now(UTC).isoformat(),
         "actions": tpl_actions,
         "warnings": warnings,
     }
+    # Optional pdfplumber settings/crop/page rules used to extract the source tables
+    if ss.get("extraction_settings"):
+        tpl["extraction"] = ss.extraction_settings
+    return tpl
 
-def replay_template(tpl, reset_first=True, log_steps=True):
-    """Accesses template and replays all steps to recreate the set table format"""
-    warnings = []
-    if reset_first:
-        # restore original
-        st.session_state.working_data = [r[:] for r in st.session_state.original_table_data]
-        st.session_state.current_headers = None
-        st.session_state.header_row_index = None
-        update_display_table(st.session_state.working_data)
+# Params holding regex patterns; compiled once when a template is compiled
+PATTERN_PARAMS = ["pattern"]
 
+def compile_template(tpl):
+    """
+    Validate a template against the ACTIONS registry once and bind what replay needs.
+    Returns a plan dict:
+        'name', 'extraction': copied from the template
+        'steps': [{'type', 'params' (as saved), 'cfg', 'call_params' (patterns precompiled),
+                   'label', 'error' (reason the step will be skipped, or None)}]
+    Plans are shared between sessions, so nothing in them should be mutated.
+    """
+    steps = []
     for step in tpl.get("actions", []):
         t = step["type"]
         p = step.get("params", {}) or {}
         cfg = ACTIONS.get(t)
+        compiled = {'type': t, 'params': p, 'cfg': cfg, 'call_params': p,
+                    'label': action_label(t, p), 'error': None}
         if not cfg:
-            warnings.append(f"Unknown action during replay: {t}")
+            compiled['error'] = f"Unknown action during replay: {t}"
+            steps.append(compiled)
             continue
 
-        # Log to Applied Actions so Undo works per-step
-        if log_steps:
-            save_action_state(t, action_label(t, p), params=p)
-
         # Validate required params
         missing = [req for req in cfg["required"] if p.get(req) is None]
         if missing:
-            warnings.append(f"Skipped {t}: missing {', '.join(missing)}")
+            compiled['error'] = f"Skipped {t}: missing {', '.join(missing)}"
+            steps.append(compiled)
             continue
 
-        result, call_warnings = _invoke(cfg, p)
-        warnings.extend(call_warnings)
+        # Precompile regex params so hot loops never compile patterns
+        call_params = dict(p)
+        # (rejecting patterns prone to catastrophic backtracking, see regex_utils)
+        for key in PATTERN_PARAMS:
+            if isinstance(call_params.get(key), str):
+                try:
+                    call_params[key] = safe_compile(call_params[key])
+                except ValueError as e:
+                    compiled['error'] = f"Skipped {t}: {e}"
+        # Delete rows conditions carry patterns of their own
+        if isinstance(call_params.get('conditions'), list):
+            try:
+                call_params['conditions'] = [dict(c, pattern=safe_compile(c['pattern']))
+                                             for c in call_params['conditions']]
+            except (ValueError, KeyError, TypeError) as e:
+                compiled['error'] = f"Skipped {t}: invalid condition ({e})"
+        compiled['call_params'] = call_params
+        steps.append(compiled)
 
-        if cfg["returns_data"]:
-            if result is None:
-                warnings.append(f"{t} returned no data")
-            else:
-                update_display_table(result)
-        elif cfg.get("post_update"):
-            update_display_table(st.session_state.working_data)
+    return {
+        'name': tpl.get("name"),
+        'extraction': tpl.get("extraction"),
+        'steps': steps,
+    }
+
+def _template_digest(tpl):
+    """Content hash of the parts of a template that affect replay"""
+    content = json.dumps({"actions": tpl.get("actions", []), "extraction": tpl.get("extraction")},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+# Compiled plans shared by every session in this process
+# - _PLANS_BY_DIGEST: template content hash -> plan
+# - _PLANS_BY_FILE: template path -> (mtime, content hash)
+_PLANS_BY_DIGEST = {}
+_PLANS_BY_FILE = {}
+_PLAN_CACHE_LIMIT = 256
+
+def compile_template_cached(tpl):
+    """compile_template, memoized by template content (so undo/redo replays skip setup)"""
+    digest = _template_digest(tpl)
+    plan = _PLANS_BY_DIGEST.get(digest)
+    if plan is None:
+        if len(_PLANS_BY_DIGEST) >= _PLAN_CACHE_LIMIT:
+            _PLANS_BY_DIGEST.pop(next(iter(_PLANS_BY_DIGEST))) # drop the oldest plan
+        plan = _PLANS_BY_DIGEST[digest] = compile_template(tpl)
+    return plan
+
+def load_compiled_template(filename):
+    """
+    Load a template from disk and return its compiled plan (None if it can't be read).
+    The file is only re-read when its mtime changes, and only recompiled when its content does.
+    """
+    path = os.path.join(TEMPLATES_DIR, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _PLANS_BY_FILE.get(path)
+    if cached and cached[0] == mtime and cached[1] in _PLANS_BY_DIGEST:
+        return _PLANS_BY_DIGEST[cached[1]]
+    try:
+        tpl = load_template_from_disk(filename)
+    except (OSError, ValueError):
+        return None
+    plan = compile_template_cached(tpl)
+    _PLANS_BY_FILE[path] = (mtime, _template_digest(tpl))
+    return plan
+
+def replay_plan(plan, reset_first=True, log_steps=True):
+    """Replays a compiled template plan to recreate the set table format"""
+    warnings = []
+    if reset_first:
+        # restore original
+        st.session_state.working_data = list(st.session_state.original_table_data)
+        st.session_state.current_headers = None
+        st.session_state.header_row_index = None
+        update_display_table(st.session_state.working_data)
+
+    # The whole replay's regex passes share one time budget, as one action's do
+    with regex_deadline():
+        for step in plan['steps']:
+            t = step['type']
+            cfg = step['cfg']
+            if not cfg:
+                warnings.append(step['error'])
+                continue
+
+            # Log to Applied Actions so Undo works per-step
+            if log_steps:
+                save_action_state(t, step['label'], params=dict(step['params']))
+
+            if step['error']:
+                warnings.append(step['error'])
+                continue
+
+            result, call_warnings = _invoke(cfg, step['call_params'])
+            warnings.extend(call_warnings)
+
+            if cfg["returns_data"]:
+                if result is None:
+                    warnings.append(f"{t} returned no data")
+                else:
+                    update_display_table(result)
+            elif cfg.get("post_update"):
+                update_display_table(st.session_state.working_data)
     
     return warnings
 
+def replay_template(tpl, reset_first=True, log_steps=True):
+    """Accesses template and replays all steps to recreate the set table format"""
+    return replay_plan(compile_template_cached(tpl), reset_first=reset_first, log_steps=log_steps)
+
 def replay_from_actions(actions, reset_first=True, log_steps=False):
     """
     Recompute state by replaying a plain actions list using replay_template.
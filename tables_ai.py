@@ -1,69 +1,133 @@
 """
-Using pdfplumber to extract tables from an invoice
+Extract invoice tables from the command line, streaming rows as they are found
+
+Usage:
+    python tables_ai.py INVOICE.pdf [--format ndjson|csv] [--output FILE] [--pages 1-3,5]
+                        [--jobs 4] [--backend pdfplumber] [--template TEMPLATE.json]
+
+Rows are written as soon as their page is processed, in page order:
+    ndjson: {"page": 1, "table": 1, "row": 1, "cells": ["100100", "Song Book", ...]}
+    csv:    page,table,row,cell 1,cell 2,... (no header row, since tables differ in width)
+Only a few pages per worker are held in memory, so long documents can be piped into other tools.
 """
 
-import pdfplumber
-import pandas as pd
-
-
-def extract_tables_with_pdfplumber(pdf_path):
-    """Extract tables using pdfplumber library"""
-    print("=" * 50)
-    print("EXTRACTING TABLES WITH PDFPLUMBER")
-    print("=" * 50)
-
-    tables = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages, 1):
-            print(f"\nPage {page_num}:")
-            print(f"Page dimensions: {page.width} x {page.height}")
-
-            # Extract text to see content
-            text = page.extract_text()
-            if text:
-                print(f"Text content preview:\n{text[:500]}...")
-
-            # Try to extract tables
-            page_tables = page.extract_tables()
-            if page_tables:
-                print(f"Found {len(page_tables)} table(s) on page {page_num}")
-                for i, table in enumerate(page_tables):
-                    print(f"\nTable {i+1}:")
-                    
-                    # Check if table has data
-                    if not table or len(table) == 0:
-                        print("Empty table, skipping...")
-                        continue
-                    
-                    try:
-                        # Handle case where table might not have headers
-                        if len(table) > 1:
-                            headers = table[0]
-                            data = table[1:]
-                        else:
-                            headers = None
-                            data = table
-                        
-                        # Create DataFrame with error handling
-                        df = pd.DataFrame(data, columns=headers)
-                        print(df.to_string())
-                        tables.append(df)
-                        
-                    except Exception as e:
-                        print(f"Error creating DataFrame for table {i+1}: {e}")
-                        # Try creating without headers
-                        try:
-                            df = pd.DataFrame(table)
-                            print(f"Created DataFrame without headers: {df.shape}")
-                            tables.append(df)
-                        except Exception as e2:
-                            print(f"Failed to create DataFrame: {e2}")
-                            continue
+import argparse
+import csv
+import json
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_functions import EXTRACTION_BACKENDS, iter_pages, page_count
+from fingerprint_utils import table_fingerprint
+from table_functions import load_template_from_disk
+
+
+def parse_pages(spec, count):
+    """Page numbers from a spec like "1-3,5,-1" (negative numbers count from the end)"""
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition("-") if not part.startswith("-") else (part, "", "")
+        start = int(first)
+        end = int(last) if sep else start
+        if start < 0:
+            start = end = count + start + 1
+        pages.update(range(start, end + 1))
+    return sorted(p for p in pages if 1 <= p <= count)
+
+# Pages handed to a worker at a time: each worker opens the PDF once per chunk
+CHUNK_PAGES = 8
+
+def extract_chunk(source, settings, page_numbers):
+    """[(page_num, tables), ...] for a run of pages (runs in a worker process when --jobs > 1)"""
+    return [(entry['page_num'], entry['tables']) for entry in iter_pages(source, settings, page_numbers)]
+
+def page_tables(source, settings, page_numbers, jobs=1):
+    """
+    Yield (page_num, tables) in page order.
+    With several jobs, chunks of CHUNK_PAGES pages are extracted in worker processes;
+    at most jobs * 2 chunks are in flight, so finished pages never pile up waiting to be written.
+    """
+    if jobs <= 1:
+        for entry in iter_pages(source, settings, page_numbers):
+            yield entry['page_num'], entry['tables']
+        return
+
+    chunks = [page_numbers[i:i + CHUNK_PAGES] for i in range(0, len(page_numbers), CHUNK_PAGES)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(extract_chunk, source, settings, chunk))
+            if len(pending) >= jobs * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def write_rows(out, fmt, page_num, tables, table_offset=0):
+    """Write every row of one page's tables; returns the number of rows written"""
+    writer = csv.writer(out) if fmt == "csv" else None
+    written = 0
+    for table_num, table in enumerate(tables, table_offset + 1):
+        for row_num, row in enumerate(table, 1):
+            cells = ["" if c is None else str(c) for c in row]
+            if writer:
+                writer.writerow([page_num, table_num, row_num] + cells)
             else:
-                print(f"No tables found on page {page_num}")
+                out.write(json.dumps({'page': page_num, 'table': table_num, 'row': row_num, 'cells': cells},
+                                     ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream the tables of a PDF invoice as NDJSON or CSV")
+    parser.add_argument("pdf", help="PDF file to read")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="Output format (default ndjson)")
+    parser.add_argument("-o", "--output", help="File to write to (default: stdout)")
+    parser.add_argument("--pages", help='Pages to read, e.g. "1-3,5" or "-1" for the last page (default: all)')
+    parser.add_argument("--jobs", type=int, default=1, help="Pages extracted in parallel (default 1)")
+    parser.add_argument("--backend", choices=list(EXTRACTION_BACKENDS), help="Extraction backend")
+    parser.add_argument("--template", metavar="TEMPLATE.json",
+                        help="Use the extraction settings saved in a template in templates/")
+    parser.add_argument("--drop-repeated", action="store_true",
+                        help="Drop tables repeated from earlier pages (page headers and footers)")
+    args = parser.parse_args()
+
+    settings = {}
+    if args.template:
+        settings.update(load_template_from_disk(args.template).get("extraction") or {})
+    if args.backend:
+        settings["backend"] = args.backend
+    if args.drop_repeated:
+        settings["drop_repeated_tables"] = True
 
-    return tables
+    count = page_count(args.pdf)
+    page_numbers = parse_pages(args.pages, count) if args.pages else list(range(1, count + 1))
 
-tables = extract_tables_with_pdfplumber("Invoice_1479909_e209944.pdf")
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    seen_on_earlier_pages = set()
+    table_count = 0
+    row_count = 0
+    try:
+        for page_num, tables in page_tables(args.pdf, settings, page_numbers, jobs=args.jobs):
+            # Drop tables already seen on an earlier page (as all_tables_from_pages does)
+            keys = [table_fingerprint(t) for t in tables]
+            if settings.get("drop_repeated_tables"):
+                tables = [t for t, key in zip(tables, keys) if key not in seen_on_earlier_pages]
+                seen_on_earlier_pages.update(keys)
+            row_count += write_rows(out, args.format, page_num, tables, table_count)
+            table_count += len(tables)
+            out.flush()
+    except BrokenPipeError:
+        # Reader went away (e.g. piped into head); stop quietly
+        sys.stderr.close()
+        return
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"{row_count} rows from {table_count} tables on {len(page_numbers)} pages", file=sys.stderr)
 
-print(tables)
+if __name__ == "__main__":
+    main()
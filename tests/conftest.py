@@ -0,0 +1,18 @@
+"""
+Tests run the app's modules outside a Streamlit server: session_state then works
+as a plain per-process store, cleared before each test.
+"""
+
+import os
+import sys
+import pytest
+import streamlit as st
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def clean_session_state():
+    st.session_state.clear()
+    yield
+    st.session_state.clear()
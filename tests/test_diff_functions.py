@@ -0,0 +1,38 @@
+import streamlit as st
+from diff_functions import processed_table, diff_tables
+from table_functions import compile_template, init_main_table, run_action
+
+ADDRESS = [["Acme Music", "12 High St"], ["Springfield", "ZIP 12345"]]
+ITEMS = [
+    ["Edition #", "Title", "Order", "Ship", "BO", "List", "Net"],
+    ["100104", "Song Book Vol 104", "5", "5", "", "9.95", "5.40"],
+    ["100105", "Song Book Vol 105", "2", "2", "", "12.95", "7.05"],
+]
+
+
+def test_processed_table_names_columns_of_mixed_width_invoice():
+    # A narrow address block ahead of the line items, as on a real invoice
+    init_main_table([ADDRESS, ITEMS])
+    run_action("apply_headers", {"header_row_index": 2})
+    shown = list(st.session_state.main_table.columns)
+    plan = compile_template({"name": "current", "actions": [
+        {'type': a['type'], 'params': a.get('params', {}) or {}} for a in st.session_state.applied_actions]})
+
+    changed = [row[:] for row in ITEMS]
+    changed[2][6] = "7.10"
+    other, warnings = processed_table([ADDRESS, changed], plan)
+
+    assert warnings == []
+    assert list(other.columns) == shown
+    assert "Edition #" in other.columns
+    diff = diff_tables(st.session_state.main_table, other, "Edition #")
+    assert list(diff['changed']["Edition #"]) == ["100105"]
+
+
+def test_processed_table_leaves_the_working_table_alone():
+    init_main_table([ITEMS])
+    before = st.session_state.working_data
+    plan = compile_template({"name": "current", "actions": []})
+    processed_table([ADDRESS, ITEMS], plan)
+    assert st.session_state.working_data is before
+    assert len(st.session_state.main_table) == len(ITEMS)
@@ -0,0 +1,16 @@
+from extraction_functions import all_tables_from_pages, clean_extraction_settings
+
+HEADER = [["Acme Music", "Invoice 42"]]
+ITEMS = [["100104", "Song Book Vol 104", "5.40"], ["100105", "Song Book Vol 105", "7.05"]]
+PAGES = [{'tables': [HEADER, ITEMS]}, {'tables': [HEADER, [row[:] for row in ITEMS]]}]
+
+
+def test_repeated_tables_are_kept_by_default():
+    # Two identical line-item blocks on different pages are both real data
+    assert all_tables_from_pages(PAGES) == [HEADER, ITEMS, HEADER, ITEMS]
+    assert all_tables_from_pages(PAGES, clean_extraction_settings({"drop_repeated_tables": False})) \
+        == [HEADER, ITEMS, HEADER, ITEMS]
+
+
+def test_repeated_tables_dropped_on_request():
+    assert all_tables_from_pages(PAGES, {"drop_repeated_tables": True}) == [HEADER, ITEMS]
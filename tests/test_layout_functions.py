@@ -0,0 +1,71 @@
+import io
+import pdfplumber
+import pytest
+from extraction_functions import extract_pages
+from layout_functions import LayoutPage, char_attrs_for, parse_layouts
+
+# Words set in two fonts with no space between them: grouping words by fontname splits them
+ROWS = [("100104", "Song", "Book", "5.40"), ("100105", "Hymn", "Book", "7.05"), ("100106", "Choir", "Part", "9.10")]
+TABLE_SETTINGS = {"vertical_strategy": "text", "horizontal_strategy": "text", "text_extra_attrs": ["fontname", "size"]}
+
+
+def _pdf_bytes():
+    """One-page PDF with a three-row table; the third column's word follows the second in Courier"""
+    lines = []
+    for i, (item, word, suffix, price) in enumerate(ROWS):
+        y = 700 - 20 * i
+        lines.append(f"BT /F1 10 Tf 72 {y} Td ({item}) Tj 80 0 Td ({word}) Tj ET")
+        lines.append(f"BT /F2 12 Tf {152 + 6 * len(word)} {y} Td ({suffix}) Tj ET")
+        lines.append(f"BT /F1 10 Tf 320 {y} Td ({price}) Tj ET")
+    stream = "\n".join(lines).encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R /F2 6 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>",
+    ]
+    out = io.BytesIO(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % o for o in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _live_tables(file_bytes, bbox=None):
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        page = pdf.pages[0]
+        return (page.crop(bbox) if bbox else page).extract_tables(TABLE_SETTINGS)
+
+
+@pytest.mark.parametrize("bbox", [None, (60, 80, 400, 140)])
+def test_extra_attrs_match_pdfplumber(bbox):
+    file_bytes = _pdf_bytes()
+    expected = _live_tables(file_bytes, bbox)
+    # The settings must actually read the font: without extra_attrs the tables differ
+    plain = {k: v for k, v in TABLE_SETTINGS.items() if k != "text_extra_attrs"}
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        page = pdf.pages[0]
+        assert (page.crop(bbox) if bbox else page).extract_tables(plain) != expected
+
+    layout = parse_layouts(file_bytes, char_attrs_for(TABLE_SETTINGS))[0]
+    assert LayoutPage(layout, bbox).extract_tables(TABLE_SETTINGS) == expected
+
+
+def test_extract_pages_keeps_extra_attrs():
+    file_bytes = _pdf_bytes()
+    pages = extract_pages(file_bytes, {"backend": "pdfplumber", "table_settings": TABLE_SETTINGS})
+    assert pages[0]['tables'] == _live_tables(file_bytes)
+
+
+def test_layout_without_extra_attrs_refuses_settings_needing_them():
+    layout = parse_layouts(_pdf_bytes())[0]
+    with pytest.raises(ValueError):
+        LayoutPage(layout).extract_tables(TABLE_SETTINGS)
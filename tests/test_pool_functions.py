@@ -0,0 +1,26 @@
+import multiprocessing
+import os
+import time
+import pytest
+import pool_functions
+
+
+def test_job_over_timeout_is_stopped(monkeypatch):
+    monkeypatch.setattr(pool_functions, "JOB_TIMEOUT", 1.0)
+    started = time.monotonic()
+    with pytest.raises(pool_functions.JobFailedError):
+        pool_functions.run_job(time.sleep, 60)
+    assert time.monotonic() - started < 3
+    # The stuck worker is killed and the next job gets a fresh pool
+    assert pool_functions.run_job(len, "abc") == 3
+
+
+def test_dead_worker_is_replaced():
+    pool_functions.run_job(len, "warm up")
+    broken = pool_functions._EXECUTOR
+    with pytest.raises(pool_functions.JobFailedError):
+        pool_functions.run_job(os._exit, 3)
+    assert pool_functions.run_job(len, "abc") == 3
+    assert pool_functions._EXECUTOR is not broken
+    assert broken._shutdown_thread
+    assert all(p.is_alive() for p in multiprocessing.active_children())
@@ -0,0 +1,25 @@
+import time
+import pytest
+from regex_utils import RegexTimeoutError, regex_deadline, search_cells
+
+# Passes the pattern checks but takes seconds on a long run of "a"s (cubic backtracking)
+SLOW_PATTERN = r"a*a*a*b"
+SLOW_CELLS = ["a" * 600]
+
+
+def test_passes_in_one_action_share_its_budget():
+    started = time.monotonic()
+    with pytest.raises(RegexTimeoutError):
+        with regex_deadline(1.0):
+            for _ in range(3):
+                search_cells(SLOW_PATTERN, SLOW_CELLS)
+    assert time.monotonic() - started < 2.5
+
+
+def test_nested_deadline_keeps_the_outer_one():
+    with regex_deadline(1.0):
+        with regex_deadline(60.0):
+            with pytest.raises(RegexTimeoutError):
+                search_cells(SLOW_PATTERN, SLOW_CELLS)
+    # Outside any action, each pass gets the full default budget again
+    assert search_cells("b", ["abc", "xyz"]).tolist() == [True, False]
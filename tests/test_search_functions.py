@@ -0,0 +1,44 @@
+import streamlit as st
+from search_functions import refresh_search_index, search_rows
+from table_functions import display_row_hashes, init_main_table, run_action, undo_last_action
+
+ROWS = [["Edition #", "Title", "Net"]] + [
+    [str(100100 + i), f"Song Book Vol {i % 7}", f"{i}.00"] for i in range(40)
+]
+QUERIES = [("100105", "Exact"), ("song book vol 3", "Exact"), ("vol 5", "Substring"),
+           ("so", "Substring"), ("song b", "Prefix"), ("1001", "Prefix")]
+
+
+def _refresh():
+    st.session_state.search_index = refresh_search_index(
+        st.session_state.get('search_index'), st.session_state.main_table, display_row_hashes())
+    return st.session_state.search_index
+
+def _fresh_results():
+    index = refresh_search_index(None, st.session_state.main_table, display_row_hashes())
+    return [search_rows(index, q, mode) for q, mode in QUERIES]
+
+
+def test_index_tracks_actions_incrementally():
+    init_main_table([ROWS])
+    run_action("apply_headers", {"header_row_index": 0})
+    assert _refresh()['stats'] == {'added': 40, 'removed': 0}
+    assert search_rows(st.session_state.search_index, "100105", "Exact") == [5]
+
+    run_action("delete_unwanted_rows", {"pattern": "^100105$"})
+    index = _refresh()
+    assert index['stats'] == {'added': 0, 'removed': 1}
+    assert [search_rows(index, q, mode) for q, mode in QUERIES] == _fresh_results()
+    assert search_rows(index, "100106", "Exact") == [5]
+
+    undo_last_action()
+    index = _refresh()
+    assert index['stats'] == {'added': 1, 'removed': 0}
+    assert [search_rows(index, q, mode) for q, mode in QUERIES] == _fresh_results()
+
+
+def test_index_without_row_hashes_matches_table():
+    init_main_table([ROWS])
+    run_action("apply_headers", {"header_row_index": 0})
+    index = refresh_search_index(None, st.session_state.main_table)
+    assert search_rows(index, "vol 6", "Substring") == [i for i in range(40) if i % 7 == 6]
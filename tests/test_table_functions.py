@@ -0,0 +1,37 @@
+import pandas as pd
+import streamlit as st
+from table_functions import init_main_table, run_action, update_display_table
+
+# Enough rows for column types to be inferred; prices padded as pdfplumber sometimes reads them
+ITEMS = [["Edition #", "Title", "Net"]] + [
+    [str(100100 + i), f"Song Book Vol {i}", f" {5 + i}.{i:02d}"] for i in range(30)
+]
+
+
+def test_strip_only_change_updates_display_table():
+    init_main_table([ITEMS])
+    run_action("apply_headers", {"header_row_index": 0})
+    version = st.session_state.table_version
+
+    stripped = [row[:2] + [row[2].strip()] for row in st.session_state.working_data]
+    update_display_table(stripped)
+
+    assert st.session_state.table_version != version
+    assert st.session_state.main_table["Net"].iloc[:2].tolist() == [5.0, 6.01]
+    assert pd.api.types.is_float_dtype(st.session_state.main_table["Net"])
+
+
+def test_none_to_empty_change_updates_display_table():
+    init_main_table([[["a", "y"], ["b", "x"]]])
+    update_display_table([["a", None], ["b", "x"]])
+    version = st.session_state.table_version
+    update_display_table([["a", ""], ["b", "x"]])
+    assert st.session_state.table_version != version
+    assert st.session_state.main_table.iloc[0, 1] == ""
+
+
+def test_unchanged_rows_keep_the_version():
+    init_main_table([ITEMS])
+    version = st.session_state.table_version
+    update_display_table(list(st.session_state.working_data))
+    assert st.session_state.table_version == version
@@ -0,0 +1,82 @@
+"""
+Invoice reconciliation checks run over whole columns of the combined table
+"""
+
+import numpy as np
+from table_functions import to_float_series
+
+
+# Registry describing each row-level check
+# - label: shown in the results
+# - columns: roles the rule needs (each mapped to a table column by the user)
+# - check: callable(values, tolerance) -> boolean array, True where a row passes
+#          values maps each role to a float array for the whole column
+VALIDATION_RULES = {
+    "order_equals_ship_plus_bo": {
+        "label": "Order = Ship + BO",
+        "columns": ["order", "ship", "bo"],
+        "check": lambda v, tol: np.abs(v["order"] - (v["ship"] + v["bo"])) <= tol,
+    },
+    "net_times_ship_equals_extension": {
+        "label": "Net x Ship = Extension",
+        "columns": ["net", "ship", "extension"],
+        "check": lambda v, tol: np.abs(v["net"] * v["ship"] - v["extension"]) <= tol,
+    },
+}
+
+# Roles a column can be mapped to, with header names used to guess the mapping
+COLUMN_ROLES = {
+    "order": ["order", "ordered", "qty ordered"],
+    "ship": ["ship", "shipped", "qty shipped"],
+    "bo": ["bo", "backorder", "back order", "backordered"],
+    "net": ["net", "item net", "net price"],
+    "extension": ["extension", "ext", "amount", "total"],
+}
+
+def guess_column_map(columns):
+    """Map each role to the first column whose header matches one of the role's names"""
+    lookup = {str(c).strip().lower(): c for c in columns}
+    column_map = {}
+    for role, names in COLUMN_ROLES.items():
+        column_map[role] = next((lookup[n] for n in names if n in lookup), None)
+    return column_map
+
+def validate_table(df, column_map, invoice_total=None, tolerance=0.01):
+    """
+    Run every rule whose columns are mapped, over whole columns at once.
+    column_map: {role: column label in df (or None to leave unmapped)}
+    Returns a dict:
+        'failed': boolean array, True for rows failing any rule
+        'rules': {rule key: boolean array of failing rows} for the rules that ran
+        'skipped': [labels of rules missing a column]
+        'extension_sum': float or None, 'total_ok': bool or None (sum-to-invoice-total check)
+    """
+    values = {}
+    for role, col in column_map.items():
+        if col is not None and col in df.columns:
+            values[role] = to_float_series(df[col])
+
+    failed = np.zeros(len(df), dtype=bool)
+    rules = {}
+    skipped = []
+    for key, rule in VALIDATION_RULES.items():
+        if not all(role in values for role in rule["columns"]):
+            skipped.append(rule["label"])
+            continue
+        rule_failed = ~rule["check"](values, tolerance)
+        rules[key] = rule_failed
+        failed |= rule_failed
+
+    # Table-level check: extensions add up to the invoice total
+    extension_sum = float(values["extension"].sum()) if "extension" in values else None
+    total_ok = None
+    if extension_sum is not None and invoice_total:
+        total_ok = abs(extension_sum - float(invoice_total)) <= tolerance
+
+    return {
+        'failed': failed,
+        'rules': rules,
+        'skipped': skipped,
+        'extension_sum': extension_sum,
+        'total_ok': total_ok,
+    }